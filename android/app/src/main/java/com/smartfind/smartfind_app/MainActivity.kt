@@ -9,6 +9,7 @@ import io.flutter.embedding.android.FlutterActivity
 import io.flutter.embedding.engine.FlutterEngine
 import io.flutter.plugin.common.MethodChannel
 import com.chaquo.python.Python
+import com.chaquo.python.Kwarg
 import com.chaquo.python.PyObject
 import com.chaquo.python.android.AndroidPlatform
 import java.io.File
@@ -45,17 +46,29 @@ class MainActivity : FlutterActivity() {
                     when (call.method) {
                         // Core Features
                         "classifyFile" -> handleClassifyFile(call.arguments as Map<*, *>, result)
+                        "classifyFiles" -> handleClassifyFiles(call.arguments as Map<*, *>, result)
                         "summarizeFile" -> handleSummarizeFile(call.arguments as Map<*, *>, result)
+                        "summarizeFiles" -> handleSummarizeFiles(call.arguments as Map<*, *>, result)
                         "readFile" -> handleReadFile(call.arguments as Map<*, *>, result)
+                        "readFiles" -> handleReadFiles(call.arguments as Map<*, *>, result)
 
                         // Search & Indexing
                         "searchDocuments" -> handleSearchDocuments(call.arguments as Map<*, *>, result)
+                        "searchMany" -> handleSearchMany(call.arguments as Map<*, *>, result)
                         "addToIndex" -> handleAddToIndex(call.arguments as Map<*, *>, result)
                         "trainSearchIndex" -> handleTrainSearchIndex(call.arguments as Map<*, *>, result)
                         "getIndexedPaths" -> handleGetIndexedPaths(call.arguments as Map<*, *>, result)
+                        "startIndexJob" -> handleStartIndexJob(call.arguments as Map<*, *>, result)
+                        "resumeIndexJob" -> handleIndexJobCall("resume_index_job", result)
+                        "indexJobStatus" -> handleIndexJobCall("job_status", result)
+                        "cancelIndexJob" -> handleIndexJobCall("cancel_job", result)
 
                         // Recommendation (Content-Based / P8)
                         "getSimilarFiles" -> handleGetSimilarFiles(call.arguments as Map<*, *>, result)
+
+                        // Diagnostics
+                        "getMetrics" -> handleGetMetrics(result)
+                        "configureMetrics" -> handleConfigureMetrics(call.arguments as Map<*, *>, result)
                         else -> result.notImplemented()
                     }
                 } catch (e: Exception) {
@@ -103,12 +116,23 @@ class MainActivity : FlutterActivity() {
             val dataDir = applicationContext.filesDir.absolutePath
             val module = python.getModule("search_engine")
 
-            val jsonObject = org.json.JSONObject(files)
-            val jsonString = jsonObject.toString()
-
             Thread {
+                // One JSON document per line, so Python can stream the corpus in chunks.
+                // A file per call, so overlapping rebuilds never share one.
+                var corpusFile: java.io.File? = null
                 try {
-                    val pyResult = module.callAttr("train_local_index", dataDir, jsonString)
+                    corpusFile = java.io.File.createTempFile("search_corpus", ".jsonl", cacheDir)
+                    corpusFile.bufferedWriter().use { writer ->
+                        for ((path, text) in files) {
+                            val line = org.json.JSONObject()
+                            line.put("path", path)
+                            line.put("text", text)
+                            writer.write(line.toString())
+                            writer.newLine()
+                        }
+                    }
+
+                    val pyResult = module.callAttr("train_index_from_jsonl", dataDir, corpusFile.absolutePath)
                     runOnUiThread {
                         val status = pyResult?.callAttr("get", "status")?.toString()
                         result.success(status)
@@ -118,6 +142,8 @@ class MainActivity : FlutterActivity() {
                     runOnUiThread {
                         result.error("PY_EXEC_ERROR", e.message, null)
                     }
+                } finally {
+                    corpusFile?.delete()
                 }
             }.start()
 
@@ -127,6 +153,60 @@ class MainActivity : FlutterActivity() {
         }
     }
 
+    private fun handleStartIndexJob(args: Map<*, *>, result: MethodChannel.Result) {
+        try {
+            @Suppress("UNCHECKED_CAST")
+            val files = args["files"] as? Map<String, String> ?: emptyMap<String, String>()
+
+            val dataDir = applicationContext.filesDir.absolutePath
+            val module = python.getModule("index_jobs")
+
+            Thread {
+                // The job copies the corpus, so it can be deleted once the job has started.
+                // A file per call, so overlapping starts never share one.
+                var corpusFile: java.io.File? = null
+                try {
+                    corpusFile = java.io.File.createTempFile("index_job_corpus", ".jsonl", cacheDir)
+                    corpusFile.bufferedWriter().use { writer ->
+                        for ((path, text) in files) {
+                            val line = org.json.JSONObject()
+                            line.put("path", path)
+                            line.put("text", text)
+                            writer.write(line.toString())
+                            writer.newLine()
+                        }
+                    }
+
+                    val pyResult = module.callAttr("start_index_job", dataDir, corpusFile.absolutePath)
+                    val response = python.getModule("json").callAttr("dumps", pyResult).toString()
+                    runOnUiThread { result.success(response) }
+                } catch (e: Exception) {
+                    Log.e(TAG, "Error starting index job", e)
+                    runOnUiThread {
+                        result.error("PY_EXEC_ERROR", e.message, null)
+                    }
+                } finally {
+                    corpusFile?.delete()
+                }
+            }.start()
+
+        } catch (e: Exception) {
+            Log.e(TAG, "Error initiating index job", e)
+            result.error("TRAIN_ERROR", e.message, null)
+        }
+    }
+
+    private fun handleIndexJobCall(function: String, result: MethodChannel.Result) {
+        try {
+            val dataDir = applicationContext.filesDir.absolutePath
+            val pyResult = python.getModule("index_jobs").callAttr(function, dataDir)
+            result.success(python.getModule("json").callAttr("dumps", pyResult).toString())
+        } catch (e: Exception) {
+            Log.e(TAG, "Error in $function", e)
+            result.error("INDEX_JOB_ERROR", e.message, null)
+        }
+    }
+
     private fun handleClassifyFile(args: Map<*, *>, result: MethodChannel.Result) {
         try {
             val text = args["text"] as? String ?: ""
@@ -153,11 +233,39 @@ class MainActivity : FlutterActivity() {
         }
     }
 
+    private fun handleClassifyFiles(args: Map<*, *>, result: MethodChannel.Result) {
+        try {
+            val texts = (args["texts"] as? List<*>)?.map { it as? String ?: "" } ?: emptyList()
+            val modelDir = getModelDir()
+
+            val module = python.getModule("classifier")
+            val pyResult = module.callAttr("classify_files", modelDir, texts.toTypedArray())
+            val pyList = pyResult?.asList() ?: emptyList<PyObject>()
+
+            fun topicOf(item: PyObject): Map<String, Any> {
+                val topicNumber = item.callAttr("get", "topic_number")?.toString()?.toIntOrNull() ?: -1
+                val confidence = item.callAttr("get", "confidence")?.toString()?.toDoubleOrNull() ?: 0.0
+                return mapOf("topic_number" to topicNumber, "confidence" to confidence)
+            }
+
+            val response = pyList.map { item ->
+                val topics = item.callAttr("get", "topics")?.asList()?.map { topicOf(it) } ?: emptyList()
+                topicOf(item) + ("topics" to topics)
+            }
+
+            result.success(response)
+        } catch (e: Exception) {
+            Log.e(TAG, "Error classifying files", e)
+            result.error("CLASSIFY_ERROR", e.message, null)
+        }
+    }
+
     private fun handleSummarizeFile(args: Map<*, *>, result: MethodChannel.Result) {
         try {
             val text = args["text"] as? String ?: ""
+            val cacheDir = applicationContext.cacheDir.absolutePath
             val module = python.getModule("summarizer")
-            val pyResult = module.callAttr("summarize_file", text)
+            val pyResult = module.callAttr("summarize_file", text, Kwarg("cache_dir", cacheDir))
             val summary = pyResult?.callAttr("get", "summary")?.toString() ?: ""
             val response = mapOf("summary" to summary)
             result.success(response)
@@ -167,11 +275,37 @@ class MainActivity : FlutterActivity() {
         }
     }
 
+    private fun handleSummarizeFiles(args: Map<*, *>, result: MethodChannel.Result) {
+        try {
+            val texts = (args["texts"] as? List<*>)?.map { it as? String ?: "" } ?: emptyList()
+            val cacheDir = applicationContext.cacheDir.absolutePath
+            val module = python.getModule("summarizer")
+
+            Thread {
+                try {
+                    val pyResult = module.callAttr("summarize_files", texts.toTypedArray(),
+                        Kwarg("cache_dir", cacheDir))
+                    val pyList = pyResult?.callAttr("get", "summaries")?.asList() ?: emptyList<PyObject>()
+                    val summaries = pyList.map { it.toString() }
+                    runOnUiThread { result.success(summaries) }
+                } catch (e: Exception) {
+                    Log.e(TAG, "Error summarizing files", e)
+                    runOnUiThread { result.error("SUMMARIZE_ERROR", e.message, null) }
+                }
+            }.start()
+        } catch (e: Exception) {
+            Log.e(TAG, "Error initiating batch summaries", e)
+            result.error("SUMMARIZE_ERROR", e.message, null)
+        }
+    }
+
     private fun handleReadFile(args: Map<*, *>, result: MethodChannel.Result) {
         try {
             val filePath = args["file_path"] as? String ?: ""
+            val maxChars = (args["max_chars"] as? Number)?.toInt() ?: 10000
+            val cacheDir = applicationContext.cacheDir.absolutePath
             val module = python.getModule("file_reader")
-            val pyResult = module.callAttr("read_file", filePath)
+            val pyResult = module.callAttr("read_file", filePath, cacheDir, maxChars)
             val content = pyResult?.callAttr("get", "content")?.toString() ?: ""
             val response = mapOf("content" to content)
             result.success(response)
@@ -181,12 +315,42 @@ class MainActivity : FlutterActivity() {
         }
     }
 
+    private fun handleReadFiles(args: Map<*, *>, result: MethodChannel.Result) {
+        try {
+            val paths = (args["paths"] as? List<*>)?.mapNotNull { it as? String } ?: emptyList()
+            val cacheDir = applicationContext.cacheDir.absolutePath
+            val module = python.getModule("file_reader")
+
+            Thread {
+                try {
+                    val contents = mutableMapOf<String, String>()
+                    val pyResult = module.callAttr("read_files", paths.toTypedArray(),
+                        Kwarg("cache_dir", cacheDir))
+                    val pyList = pyResult?.callAttr("get", "results")?.asList() ?: emptyList<PyObject>()
+                    for (item in pyList) {
+                        val path = item.callAttr("get", "path")?.toString() ?: continue
+                        contents[path] = item.callAttr("get", "content")?.toString() ?: ""
+                    }
+                    runOnUiThread { result.success(contents) }
+                } catch (e: Exception) {
+                    Log.e(TAG, "Error reading files", e)
+                    runOnUiThread { result.error("READ_ERROR", e.message, null) }
+                }
+            }.start()
+        } catch (e: Exception) {
+            Log.e(TAG, "Error initiating bulk read", e)
+            result.error("READ_ERROR", e.message, null)
+        }
+    }
+
     private fun handleSearchDocuments(args: Map<*, *>, result: MethodChannel.Result) {
         try {
             val query = args["query"] as? String ?: ""
+            val mode = args["mode"] as? String ?: "exact"
             val dataDir = applicationContext.filesDir.absolutePath
             val module = python.getModule("search_engine")
-            val pyResult = module.callAttr("search_documents", dataDir, query)
+            val pyResult = module.callAttr("search_documents", dataDir, query, Kwarg("mode", mode),
+                Kwarg("filters", searchFilters(args)))
 
             val pyList = pyResult?.callAttr("get", "results")?.asList() ?: emptyList<PyObject>()
             val results = pyList.map { it.toString() }
@@ -199,6 +363,32 @@ class MainActivity : FlutterActivity() {
         }
     }
 
+    private fun handleSearchMany(args: Map<*, *>, result: MethodChannel.Result) {
+        try {
+            val queries = (args["queries"] as? List<*>)?.map { it as? String ?: "" } ?: emptyList()
+            val mode = args["mode"] as? String ?: "exact"
+            val dataDir = applicationContext.filesDir.absolutePath
+            val module = python.getModule("search_engine")
+            val pyResult = module.callAttr("search_many", dataDir, queries.toTypedArray(), Kwarg("mode", mode),
+                Kwarg("filters", searchFilters(args)))
+
+            val pyLists = pyResult?.callAttr("get", "results")?.asList() ?: emptyList<PyObject>()
+            val results = pyLists.map { list -> list.asList().map { it.toString() } }
+
+            val response = mapOf("results" to results)
+            result.success(response)
+        } catch (e: Exception) {
+            Log.e(TAG, "Error searching documents", e)
+            result.error("SEARCH_ERROR", e.message, null)
+        }
+    }
+
+    // Optional {"topics", "extensions", "folder", "modified_after", "modified_before"} map, as a Python dict
+    private fun searchFilters(args: Map<*, *>): PyObject? {
+        val filters = args["filters"] as? Map<*, *> ?: return null
+        return python.getModule("json").callAttr("loads", org.json.JSONObject(filters).toString())
+    }
+
     private fun handleAddToIndex(args: Map<*, *>, result: MethodChannel.Result) {
         try {
             val filePath = args["file_path"] as? String ?: ""
@@ -228,6 +418,30 @@ class MainActivity : FlutterActivity() {
         }
     }
 
+    private fun handleGetMetrics(result: MethodChannel.Result) {
+        try {
+            val pyResult = python.getModule("metrics").callAttr("get_metrics")
+            // Nested span summaries travel as one JSON string
+            result.success(python.getModule("json").callAttr("dumps", pyResult).toString())
+        } catch (e: Exception) {
+            Log.e(TAG, "Error getting metrics", e)
+            result.error("METRICS_ERROR", e.message, null)
+        }
+    }
+
+    private fun handleConfigureMetrics(args: Map<*, *>, result: MethodChannel.Result) {
+        try {
+            val enabled = args["enabled"] as? Boolean
+            val logLevel = args["log_level"] as? String
+            val pyResult = python.getModule("metrics").callAttr(
+                "configure", Kwarg("enabled", enabled), Kwarg("log_level", logLevel))
+            result.success(python.getModule("json").callAttr("dumps", pyResult).toString())
+        } catch (e: Exception) {
+            Log.e(TAG, "Error configuring metrics", e)
+            result.error("METRICS_ERROR", e.message, null)
+        }
+    }
+
     private fun openAllFilesAccessSettings(result: MethodChannel.Result) {
         try {
             val intent = if (Build.VERSION.SDK_INT >= Build.VERSION_CODES.R) {
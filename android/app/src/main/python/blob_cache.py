@@ -0,0 +1,121 @@
+import os
+import zlib
+import hashlib
+import threading
+import metrics
+
+log = metrics.get_logger("blob_cache")
+
+# Persistent key -> bytes cache: one zlib-compressed file per entry, named by
+# the SHA-1 of its key. A hit touches the file's mtime, so when the directory
+# grows past max_bytes the least recently used entries are the first removed.
+BLOB_SUFFIX = ".z"
+EVICT_TO = 0.9  # Fraction of max_bytes left after an eviction pass
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class BlobCache:
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._total_bytes = None  # Counted lazily on the first write
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + BLOB_SUFFIX)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = zlib.decompress(f.read())
+            os.utime(path)
+        except (OSError, zlib.error):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        blob = zlib.compress(data)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("Blob cache write failed: %s", e)
+            return
+
+        with self._lock:
+            self.writes += 1
+            if self._total_bytes is None:
+                self._total_bytes = self._directory_bytes()
+            else:
+                self._total_bytes += len(blob) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(BLOB_SUFFIX):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+        return entries
+
+    def _directory_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes * EVICT_TO:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        self._total_bytes = total
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes if self._total_bytes is not None else self._directory_bytes(),
+                "max_bytes": self.max_bytes,
+            }
+
+
+def open_cache(directory, max_bytes):
+    """The process-wide BlobCache for `directory`, so its counters accumulate across calls."""
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = _caches[directory] = BlobCache(directory, max_bytes)
+        return cache
@@ -0,0 +1,350 @@
+import re
+from collections import Counter
+import numpy as np
+import classifier
+import metrics
+import scoring
+
+# Keyword search: an inverted index from terms to the rows that contain them,
+# scored with Okapi BM25. Terms are lower-cased runs of letters and digits, so
+# invoice numbers, names and identifiers the word vectors have never seen
+# can still be found.
+#
+# The main segment's postings are stored term by term in sorted term order:
+#
+#   terms         uint8   sorted terms, UTF-8, concatenated
+#   term_offsets  int64   (terms + 1,)  start of each term in `terms`, then its length
+#   posting_starts int64  (terms + 1,)  first posting of each term in `tfs`
+#   byte_starts   int64   (terms + 1,)  first byte of each term in `postings`
+#   postings      uint8   row gaps as LEB128 varints; each term's first row is absolute
+#   tfs           uint16  term frequency of every posting
+#   lengths       int32   (rows,)  term count of every main-segment row
+#
+# Rows in the delta segment keep their terms as text lines ("term:tf ..."),
+# one per row, which are parsed on the first keyword query against them.
+
+TERM_PATTERN = re.compile(r'[a-z0-9]+')
+MIN_TERM_LEN = 2
+MAX_TERM_LEN = 32
+MAX_TF = np.iinfo(np.uint16).max
+
+K1 = 1.2
+B = 0.75
+
+ARRAYS = ("terms", "term_offsets", "posting_starts", "byte_starts", "postings", "tfs", "lengths")
+
+
+def tokenize(text):
+    tokens = TERM_PATTERN.findall(text.lower())
+    return [t for t in tokens if MIN_TERM_LEN <= len(t) <= MAX_TERM_LEN and t not in classifier.STOPWORDS]
+
+
+def term_counts(text):
+    """{term: frequency} of `text`."""
+    return dict(Counter(tokenize(text or "")))
+
+
+def encode_counts(counts):
+    """One delta-segment line for a row with these term counts."""
+    return " ".join(f"{term}:{tf}" for term, tf in counts.items()) + "\n"
+
+
+def decode_counts(line):
+    """{term: tf} of one line written by encode_counts."""
+    counts = {}
+    for item in line.split():
+        term, tf = item.rsplit(":", 1)
+        counts[term] = int(tf)
+    return counts
+
+
+def _encode_varints(values):
+    """(bytes, size of each value) of non-negative `values` as LEB128 varints."""
+    values = np.asarray(values, dtype=np.int64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 5):
+        sizes += values >= (1 << (7 * k))
+
+    data = np.empty(int(sizes.sum()), dtype=np.uint8)
+    starts = np.cumsum(sizes) - sizes
+    for k in range(int(sizes.max(initial=0))):
+        mask = sizes > k
+        byte = (values[mask] >> (7 * k)) & 0x7F
+        byte |= np.where(sizes[mask] > k + 1, 0x80, 0)
+        data[starts[mask] + k] = byte
+    return data, sizes
+
+
+def _decode_varints(data, count):
+    """The `count` values varint-encoded in `data`."""
+    data = np.asarray(data, dtype=np.uint8)
+    if len(data) == count:
+        return data.astype(np.int64)  # Every value fit in one byte
+
+    ends = np.flatnonzero((data & 0x80) == 0)
+    starts = np.zeros(count, dtype=np.int64)
+    starts[1:] = ends[:-1] + 1
+    shifts = (np.arange(len(data)) - np.repeat(starts, ends - starts + 1)) * 7
+    return np.bitwise_or.reduceat((data & 0x7F).astype(np.int64) << shifts, starts)
+
+
+def pack(terms, term_ids, rows, tfs, lengths):
+    """Main-segment arrays (see ARRAYS) for postings given as parallel arrays.
+
+    `terms[term_ids[i]]` occurs `tfs[i]` times in row `rows[i]`; terms left
+    without postings are dropped.
+    """
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int64)
+    tfs = np.minimum(np.asarray(tfs, dtype=np.int64), MAX_TF).astype(np.uint16)
+
+    used = np.flatnonzero(np.bincount(term_ids, minlength=len(terms)))
+    order = sorted(used.tolist(), key=terms.__getitem__)
+    rank = np.full(len(terms), -1, dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    term_ids = rank[term_ids]
+
+    sort = np.lexsort((rows, term_ids))
+    term_ids, rows, tfs = term_ids[sort], rows[sort], tfs[sort]
+
+    posting_starts = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(order)), out=posting_starts[1:])
+    gaps = np.diff(rows, prepend=0)
+    firsts = posting_starts[:-1]
+    gaps[firsts] = rows[firsts]
+    postings, sizes = _encode_varints(gaps)
+    byte_ends = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=byte_ends[1:])
+
+    encoded = [terms[i].encode("utf-8") for i in order]
+    term_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum([len(t) for t in encoded], out=term_offsets[1:])
+
+    return {
+        "terms": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "term_offsets": term_offsets,
+        "posting_starts": posting_starts,
+        "byte_starts": byte_ends[posting_starts],
+        "postings": postings,
+        "tfs": tfs,
+        "lengths": np.asarray(lengths, dtype=np.int32),
+    }
+
+
+class PostingsBuilder:
+    """Collects the term counts of rows appended in order, then packs them.
+
+    Postings are held as compact arrays (10 bytes each) until pack().
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._terms = []
+        self._term_ids = {}
+        self._parts = []
+        self._lengths = []
+
+    def add(self, counts_list):
+        """Append one row per {term: tf} dict in `counts_list`."""
+        terms, rows, tfs = [], [], []
+        for counts in counts_list:
+            terms.extend(counts)
+            tfs.extend(counts.values())
+            rows.extend([self.count] * len(counts))
+            self._lengths.append(sum(counts.values()))
+            self.count += 1
+
+        ids = self._term_ids
+        for term in terms:
+            if term not in ids:
+                ids[term] = len(self._terms)
+                self._terms.append(term)
+        self._parts.append((np.array([ids[t] for t in terms], dtype=np.int32),
+                            np.array(rows, dtype=np.int32),
+                            np.minimum(np.array(tfs, dtype=np.int64), MAX_TF).astype(np.uint16)))
+
+    def pack(self):
+        if self._parts:
+            columns = [np.concatenate(column) for column in zip(*self._parts)]
+        else:
+            columns = [np.empty(0, dtype=np.int64)] * 3
+        return pack(self._terms, *columns, self._lengths)
+
+
+class LexicalIndex:
+    """Postings of one SearchIndex: the packed main segment plus delta-segment lines."""
+
+    def __init__(self, arrays, delta_text="", delta_count=0):
+        self.terms = np.asarray(arrays["terms"]).tobytes()
+        self.term_offsets = memoryview(np.ascontiguousarray(arrays["term_offsets"]))
+        self.posting_starts = arrays["posting_starts"]
+        self.byte_starts = arrays["byte_starts"]
+        self.row_gaps = arrays["postings"]
+        self.tfs = arrays["tfs"]
+        self.main_lengths = arrays["lengths"]
+        self.main_count = len(self.main_lengths)
+
+        self._delta_text = delta_text
+        self._delta_count = delta_count
+        self._delta = None
+        self._lengths = None
+        self._norms = None
+
+    def __len__(self):
+        return self.main_count + self._delta_count
+
+    @property
+    def term_count(self):
+        return len(self.term_offsets) - 1
+
+    def term(self, position):
+        return self.terms[self.term_offsets[position]:self.term_offsets[position + 1]].decode("utf-8")
+
+    def _position(self, term_bytes):
+        """Sorted position of `term_bytes` in the main segment, or -1."""
+        offsets, terms = self.term_offsets, self.terms
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if terms[offsets[mid]:offsets[mid + 1]] < term_bytes:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.term_count and terms[offsets[lo]:offsets[lo + 1]] == term_bytes:
+            return lo
+        return -1
+
+    def _delta_postings(self):
+        """{term: ([rows], [tfs])} and row lengths of the delta segment, parsed once."""
+        if self._delta is None:
+            postings = {}
+            lengths = np.zeros(self._delta_count, dtype=np.int32)
+            lines = self._delta_text.split("\n")[:self._delta_count]
+            for i, line in enumerate(lines):
+                row = self.main_count + i
+                for term, tf in decode_counts(line).items():
+                    entry = postings.get(term)
+                    if entry is None:
+                        entry = postings[term] = ([], [])
+                    entry[0].append(row)
+                    entry[1].append(tf)
+                    lengths[i] += tf
+            self._delta = (postings, lengths)
+        return self._delta
+
+    def delta_counts(self, rows):
+        """{term: tf} of each delta-segment row in `rows` (numbered across the whole index)."""
+        lines = self._delta_text.split("\n")
+        return [decode_counts(lines[row - self.main_count]) for row in rows]
+
+    def lengths(self):
+        """Term count of every row, main segment first."""
+        if self._lengths is None:
+            self._lengths = np.concatenate([np.asarray(self.main_lengths, dtype=np.int32),
+                                            self._delta_postings()[1]])
+        return self._lengths
+
+    def length_norms(self):
+        """BM25 length normalisation K1 * (1 - B + B * length / average length) of every row."""
+        if self._norms is None:
+            lengths = self.lengths()
+            average = lengths.mean() if len(lengths) else 1.0
+            self._norms = K1 * (1 - B + B * lengths / max(average, 1e-9))
+        return self._norms
+
+    def postings(self, term):
+        """(rows, tfs) of `term` in row order."""
+        parts_rows, parts_tfs = [], []
+        position = self._position(term.encode("utf-8"))
+        if position >= 0:
+            lo, hi = self.posting_starts[position], self.posting_starts[position + 1]
+            gaps = _decode_varints(self.row_gaps[self.byte_starts[position]:self.byte_starts[position + 1]], hi - lo)
+            parts_rows.append(np.cumsum(gaps))
+            parts_tfs.append(np.asarray(self.tfs[lo:hi], dtype=np.float64))
+
+        if self._delta_count:
+            delta = self._delta_postings()[0].get(term)
+            if delta is not None:
+                parts_rows.append(np.array(delta[0], dtype=np.int64))
+                parts_tfs.append(np.array(delta[1], dtype=np.float64))
+
+        if not parts_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return np.concatenate(parts_rows), np.concatenate(parts_tfs)
+
+    def all_postings(self):
+        """(terms, term_ids, rows, tfs) of every posting, main segment then delta."""
+        counts = np.diff(self.posting_starts)
+        term_ids = np.repeat(np.arange(self.term_count), counts)
+        gaps = _decode_varints(self.row_gaps, int(self.posting_starts[-1]))
+        ends = np.cumsum(gaps)
+        firsts = np.asarray(self.posting_starts[:-1])[counts > 0]
+        rows = ends - np.repeat(ends[firsts] - gaps[firsts], counts[counts > 0])
+        tfs = np.asarray(self.tfs, dtype=np.int64)
+
+        terms = [self.term(i) for i in range(self.term_count)]
+        if self._delta_count:
+            ids = {t: i for i, t in enumerate(terms)}
+            delta_ids, delta_rows, delta_tfs = [], [], []
+            for term, (term_rows, term_tfs) in self._delta_postings()[0].items():
+                if term not in ids:
+                    ids[term] = len(terms)
+                    terms.append(term)
+                delta_ids.extend([ids[term]] * len(term_rows))
+                delta_rows.extend(term_rows)
+                delta_tfs.extend(term_tfs)
+            term_ids = np.concatenate([term_ids, np.array(delta_ids, dtype=np.int64)])
+            rows = np.concatenate([rows, np.array(delta_rows, dtype=np.int64)])
+            tfs = np.concatenate([tfs, np.array(delta_tfs, dtype=np.int64)])
+        return terms, term_ids, rows, tfs
+
+    def nbytes(self):
+        return int(len(self.terms) + self.term_offsets.nbytes + sum(
+            np.asarray(a).nbytes for a in (self.posting_starts, self.byte_starts, self.row_gaps,
+                                           self.tfs, self.main_lengths)))
+
+
+def merge(lexical, keep):
+    """Packed arrays for a new main segment holding rows `keep` (sorted), renumbered 0..n-1."""
+    terms, term_ids, rows, tfs = lexical.all_postings()
+    new_rows = np.full(len(lexical), -1, dtype=np.int64)
+    new_rows[keep] = np.arange(len(keep))
+    rows = new_rows[rows]
+    kept = rows >= 0
+    return pack(terms, term_ids[kept], rows[kept], tfs[kept], lexical.lengths()[keep])
+
+
+def score(index, terms):
+    """BM25 score of every row of `index` for the query `terms`; deleted rows score 0."""
+    lexical = index.lexical
+    scores = np.zeros(len(index), dtype=np.float64)
+    if lexical is None or not len(index):
+        return scores
+
+    live_count = len(index) if index.live is None else int(index.live.sum())
+    norm = lexical.length_norms()
+
+    for term in dict.fromkeys(terms):
+        rows, tfs = lexical.postings(term)
+        if not len(rows):
+            continue
+        idf = np.log(1 + (live_count - len(rows) + 0.5) / (len(rows) + 0.5))
+        scores[rows] += idf * tfs * (K1 + 1) / (tfs + norm[rows])
+
+    if index.live is not None:
+        scores[~index.live] = 0
+    return scores
+
+
+def search(index, query, top_k, rows=None):
+    """Rows matching any term of `query`, best BM25 score first.
+
+    With `rows` (sorted), only those rows are ranked; term statistics still
+    cover the whole index.
+    """
+    terms = tokenize(query or "")
+    with metrics.span("bm25"):
+        scores = score(index, terms)
+    if rows is not None:
+        return rows[scoring.top_k_rows(scores[rows], top_k, 0.0)]
+    return scoring.top_k_rows(scores, top_k, 0.0)
@@ -1,11 +1,39 @@
 import os
 import json
+import hashlib
 import numpy as np
 import re
+import metrics
+import rwlock
+import scoring
+import vocab_store
+
+log = metrics.get_logger("classifier")
 
 _vocab = None
 _word_vectors = None
+_word_scales = None
 _topic_vectors = None
+_topic_norms = None
+_model_version = None
+_token_ids = {}  # token -> vocab id, or -1 for stopwords and unknown words
+
+# Embedding and classification hold this shared; a model is published under
+# it exclusively, so no reader mixes the vocabulary of one model with the
+# vectors of another.
+_resources_lock = rwlock.ReadWriteLock()
+
+TOKEN_PATTERN = re.compile(r'\b[a-z]{3,}\b')
+TOKEN_ID_CACHE_SIZE = 200000
+GATHER_BLOCK_IDS = 16384  # Word-vector rows gathered at once by mean_vectors
+
+# Optional quantized copies of word_vectors.npy (see export_quantized_word_vectors).
+# When one is present next to the model it is loaded instead of the float32 file.
+QUANTIZED_WORD_VECTOR_FILES = {
+    "float16": "word_vectors.f16.npy",
+    "int8": "word_vectors.i8.npy",
+}
+WORD_SCALES_FILE = "word_vectors.scale.npy"
 
 STOPWORDS = {
     'the', 'and', 'to', 'of', 'a', 'in', 'is', 'that', 'for', 'it', 'on', 'with', 'as',
@@ -23,37 +51,237 @@ STOPWORDS = {
 }
 
 
+def _word_vector_files(asset_path):
+    """Files load_resources reads the word vectors from, in load order."""
+    for dtype, name in QUANTIZED_WORD_VECTOR_FILES.items():
+        if os.path.exists(os.path.join(asset_path, name)):
+            return [name, WORD_SCALES_FILE] if dtype == "int8" else [name]
+    return ["word_vectors.npy"]
+
+
+def _load_word_vectors(asset_path):
+    """(vectors, scales) preferring a quantized export over word_vectors.npy.
+
+    The vectors are memory-mapped, so only rows that are looked up get paged in.
+    """
+    files = [os.path.join(asset_path, name) for name in _word_vector_files(asset_path)]
+    scales = np.load(files[1]) if len(files) > 1 else None
+    return np.load(files[0], mmap_mode="r"), scales
+
+
+def _vocab_files(asset_path):
+    """vocab.json when shipped (the compact files are derived from it), else the compact files.
+
+    Decided from the files on disk alone, so reloading an unchanged model keeps its version.
+    """
+    if os.path.exists(os.path.join(asset_path, "vocab.json")):
+        return ["vocab.json"]
+    return vocab_store.COMPACT_FILES
+
+
+def _load_vocab(asset_path):
+    """The compact vocabulary if it is up to date, else vocab.json (exporting it for next time)."""
+    json_path = os.path.join(asset_path, "vocab.json")
+    source = vocab_store.file_digest(json_path) if os.path.exists(json_path) else None
+    if vocab_store.has_compact_vocab(asset_path) and source in (None, vocab_store.source_digest(asset_path)):
+        return vocab_store.CompactVocab(asset_path)
+
+    with open(json_path, "r") as f:
+        vocab = json.load(f)
+    try:
+        vocab_store.export_vocab(vocab, asset_path, source)
+        log.info("Exported compact vocabulary")
+    except OSError as e:
+        log.warning("Could not export compact vocabulary: %s", e)
+    return vocab
+
+
+def _model_fingerprint(asset_path, samples=16, sample_bytes=4096):
+    """Short hash of the name, size and sampled content of every file document vectors depend on.
+
+    Content rather than mtime, so re-copying identical assets keeps the version.
+    """
+    digest = hashlib.sha1()
+    for name in _vocab_files(asset_path) + _word_vector_files(asset_path):
+        path = os.path.join(asset_path, name)
+        size = os.path.getsize(path)
+        digest.update(f"{name}:{size};".encode("utf-8"))
+        with open(path, "rb") as f:
+            for i in range(samples):
+                f.seek(size * i // samples)
+                digest.update(f.read(sample_bytes))
+    return digest.hexdigest()[:16]
+
+
+def export_quantized_word_vectors(asset_path, dtype):
+    """Write a float16 or int8 copy of word_vectors.npy that load_resources will prefer."""
+    vectors = np.load(os.path.join(asset_path, "word_vectors.npy"))
+    data, scales = scoring.quantize(vectors, dtype)
+    np.save(os.path.join(asset_path, QUANTIZED_WORD_VECTOR_FILES[dtype]), data)
+    if scales is not None:
+        np.save(os.path.join(asset_path, WORD_SCALES_FILE), scales)
+    return int(vectors.nbytes), int(data.nbytes + (0 if scales is None else scales.nbytes))
+
+
+def _read_resources(asset_path):
+    vocab = _load_vocab(asset_path)
+    model_version = _model_fingerprint(asset_path)
+    word_vectors, word_scales = _load_word_vectors(asset_path)
+    topic_vectors = np.load(os.path.join(asset_path, "topic_vectors.npy"))
+    return vocab, model_version, word_vectors, word_scales, topic_vectors
+
+
+def _publish(vocab, model_version, word_vectors, word_scales, topic_vectors):
+    """Swap in a model; the caller holds the write lock."""
+    global _vocab, _word_vectors, _word_scales, _topic_vectors, _topic_norms, _model_version, _token_ids
+    _token_ids = {}
+    _model_version = model_version
+    _word_vectors, _word_scales = word_vectors, word_scales
+    _topic_vectors = topic_vectors
+    _topic_norms = np.linalg.norm(topic_vectors, axis=1)
+    _vocab = vocab  # Last: load_resources checks it without the lock
+
+
 def load_resources(asset_path):
-    global _vocab, _word_vectors, _topic_vectors
-    if _vocab is None:
-        try:
-            print(f"DEBUG: Loading model from {asset_path}...")
-            with open(os.path.join(asset_path, "vocab.json"), "r") as f:
-                _vocab = json.load(f)
-            _word_vectors = np.load(os.path.join(asset_path, "word_vectors.npy"))
-            _topic_vectors = np.load(os.path.join(asset_path, "topic_vectors.npy"))
-            return True
-        except Exception as e:
-            print(f"CRITICAL ERROR loading model: {e}")
-            return False
+    if _vocab is not None:
+        return True
+    with _resources_lock.write_locked():
+        if _vocab is None:
+            try:
+                log.info("Loading model from %s...", asset_path)
+                _publish(*_read_resources(asset_path))
+            except Exception as e:
+                log.error("Error loading model: %s", e)
+                return False
     return True
 
 
+def reload_resources(asset_path):
+    """Replace the loaded model with the one at `asset_path`.
+
+    The new model is read while queries keep using the old one; the swap
+    waits for in-flight embeddings to finish.
+    """
+    try:
+        log.info("Reloading model from %s...", asset_path)
+        resources = _read_resources(asset_path)
+    except Exception as e:
+        log.error("Error loading model: %s", e)
+        return False
+    with _resources_lock.write_locked():
+        _publish(*resources)
+    return True
+
+
+def resource_info():
+    """Whether the model is loaded and how many bytes its arrays hold."""
+    with _resources_lock.read_locked():
+        return _resource_info()
+
+
+def _resource_info():
+    if _vocab is None:
+        return {"loaded": False}
+    return {
+        "loaded": True,
+        "model_version": _model_version,
+        "vocab_size": len(_vocab),
+        "vocab_format": "compact" if isinstance(_vocab, vocab_store.CompactVocab) else "json",
+        "word_vectors_dtype": str(_word_vectors.dtype),
+        "word_vectors_bytes": int(_word_vectors.nbytes) + (0 if _word_scales is None else int(_word_scales.nbytes)),
+        "topic_vectors_bytes": int(_topic_vectors.nbytes),
+    }
+
+
 def simple_preprocess(text):
-    tokens = re.findall(r'\b[a-z]{3,}\b', text.lower())
+    tokens = TOKEN_PATTERN.findall(text.lower())
     return [t for t in tokens if t not in STOPWORDS]
 
 
-def infer_vector_manual(words):
-    global _vocab, _word_vectors
-    vectors = []
-    for word in words:
-        if word in _vocab:
-            idx = _vocab[word]
-            vectors.append(_word_vectors[idx])
+def _token_id(token):
+    idx = -1 if token in STOPWORDS else _vocab.get(token, -1)
+    if len(_token_ids) < TOKEN_ID_CACHE_SIZE:
+        _token_ids[token] = idx
+    return idx
+
+
+def text_to_ids(text):
+    """int32 vocab ids of the tokens simple_preprocess keeps that the model knows, in order."""
+    with metrics.span("tokenize"):
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        ids = list(map(_token_ids.get, tokens))
+        if None in ids:
+            ids = [_token_id(token) if idx is None else idx for token, idx in zip(tokens, ids)]
+        ids = np.array(ids, dtype=np.int32)
+        return ids[ids >= 0]
+
+
+def mean_vectors(id_arrays):
+    """Mean word vector of each id array, gathering rows for many documents at once.
+
+    Returns a float32 (len(id_arrays), dim) matrix and a mask of the rows
+    that had any ids; other rows are zero. Each row is bit-identical to
+    np.mean over that document's word vectors, which is why segments are
+    summed with np.add.reduce (as np.mean does) rather than np.add.reduceat,
+    whose summation order differs.
+    """
+    lengths = np.array([len(ids) for ids in id_arrays], dtype=np.int64)
+    valid = lengths > 0
+    matrix = np.zeros((len(id_arrays), _word_vectors.shape[1]), dtype=np.float32)
+
+    docs = np.flatnonzero(valid)
+    block_start = 0
+    while block_start < len(docs):
+        # Whole documents, up to GATHER_BLOCK_IDS ids (at least one document)
+        block_stop = block_start + 1
+        total = lengths[docs[block_start]]
+        while block_stop < len(docs) and total + lengths[docs[block_stop]] <= GATHER_BLOCK_IDS:
+            total += lengths[docs[block_stop]]
+            block_stop += 1
+        block = docs[block_start:block_stop]
+        block_start = block_stop
+
+        flat = np.concatenate([id_arrays[i] for i in block])
+        scales = None if _word_scales is None else _word_scales[flat]
+        rows = scoring.dequantize(_word_vectors[flat], scales)
 
-    if not vectors: return None
-    return np.mean(vectors, axis=0)
+        counts = lengths[block]
+        stops = np.cumsum(counts)
+        sums = np.empty((len(block), rows.shape[1]), dtype=rows.dtype)
+        for k, (start, stop) in enumerate(zip(stops - counts, stops)):
+            np.add.reduce(rows[start:stop], axis=0, out=sums[k])
+        matrix[block] = sums / counts.astype(np.float32)[:, None]
+
+    return matrix, valid
+
+
+def mean_vector(ids):
+    """Mean word vector of one id array, or None if it is empty."""
+    if not len(ids):
+        return None
+    matrix, _ = mean_vectors([ids])
+    return matrix[0]
+
+
+def embed_text(text):
+    with _resources_lock.read_locked():
+        ids = text_to_ids(text)
+        with metrics.span("embed"):
+            return mean_vector(ids)
+
+
+def embed_texts(texts):
+    """mean_vectors of many texts; see text_to_ids."""
+    with _resources_lock.read_locked():
+        id_arrays = [text_to_ids(text) for text in texts]
+        with metrics.span("embed"):
+            return mean_vectors(id_arrays)
+
+
+def infer_vector_manual(words):
+    with _resources_lock.read_locked():
+        ids = [idx for idx in map(_vocab.get, words) if idx is not None]
+        return mean_vector(np.array(ids, dtype=np.int32))
 
 
 def classify_file(asset_path, text_content):
@@ -63,20 +291,62 @@ def classify_file(asset_path, text_content):
     if not load_resources(asset_path):
         return {"topic_number": -1, "confidence": 0.0}
 
-    tokens = simple_preprocess(text_content)
-    if not tokens:
-        return {"topic_number": -1, "confidence": 0.0}
+    with _resources_lock.read_locked():
+        return _classify(text_content)
+
 
-    doc_vector = infer_vector_manual(tokens)
+def _classify(text_content):
+    doc_vector = embed_text(text_content)
     if doc_vector is None:
         return {"topic_number": -1, "confidence": 0.0}
 
     norm_doc = np.linalg.norm(doc_vector)
     if norm_doc == 0: return {"topic_number": -1, "confidence": 0.0}
 
-    scores = np.dot(_topic_vectors, doc_vector) / (np.linalg.norm(_topic_vectors, axis=1) * norm_doc)
+    scores = np.dot(_topic_vectors, doc_vector) / (_topic_norms * norm_doc)
     best_topic_id = int(np.argmax(scores))
     confidence = float(scores[best_topic_id])
 
-    print(f"DEBUG: Classified as Topic {best_topic_id} with conf {confidence:.2f}")
     return {"topic_number": best_topic_id, "confidence": confidence}
+
+
+def classify_files(asset_path, texts, top_k=3):
+    """Classify many texts at once with a single documents-by-topics product.
+
+    Returns one dict per text, in order, with the same topic_number and
+    confidence classify_file would give plus the `top_k` best topics.
+    """
+    unclassified = {"topic_number": -1, "confidence": 0.0, "topics": []}
+    if not load_resources(asset_path):
+        return [dict(unclassified) for _ in texts]
+
+    with _resources_lock.read_locked():
+        return _classify_many(texts, top_k, unclassified)
+
+
+def _classify_many(texts, top_k, unclassified):
+    eligible = [i for i, text in enumerate(texts) if text and len(text.strip()) >= 5]
+    doc_matrix, valid = embed_texts([texts[i] for i in eligible])
+    rows = [i for i, ok in zip(eligible, valid) if ok]
+    doc_matrix = doc_matrix[valid]
+
+    results = [dict(unclassified) for _ in texts]
+    if not rows:
+        return results
+
+    doc_norms = np.linalg.norm(doc_matrix, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = (doc_matrix @ _topic_vectors.T) / (doc_norms[:, None] * _topic_norms[None, :])
+
+    top_k = max(1, min(top_k, scores.shape[1]))
+    ranked = np.argsort(-scores, axis=1, kind="stable")[:, :top_k]
+
+    for row, doc_scores, best, norm in zip(rows, scores, ranked, doc_norms):
+        if norm == 0:
+            continue
+        topics = [{"topic_number": int(t), "confidence": float(doc_scores[t])} for t in best]
+        results[row] = {"topic_number": topics[0]["topic_number"],
+                        "confidence": topics[0]["confidence"],
+                        "topics": topics}
+
+    return results
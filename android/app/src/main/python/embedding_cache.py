@@ -0,0 +1,132 @@
+import os
+import hashlib
+import numpy as np
+import metrics
+
+log = metrics.get_logger("embedding_cache")
+
+# Document vectors from earlier index builds, keyed by a hash of the text.
+#
+#   embedding_cache.npz   keys     (n, 16) u8    blake2b digest of the UTF-8 text
+#                         vectors  (n, dim) f32  unit document vector (zeros if none)
+#                         valid    (n,) bool     False for texts with no known words
+#                         used     (n,) int64    tick of the last lookup or insert
+#                         meta     ()  str       model version the vectors came from
+#
+# The whole file is dropped when the model version or dimension changes, and
+# the least recently used entries are evicted past MAX_ENTRIES.
+CACHE_FILE = "embedding_cache.npz"
+MAX_ENTRIES = 50000
+KEY_BYTES = 16
+
+
+def content_key(text):
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=KEY_BYTES).digest()
+
+
+class EmbeddingCache:
+    """Text hash -> document vector, for one model version."""
+
+    def __init__(self, path, model_version, dim, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.model_version = model_version
+        self.dim = dim
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._rows = {}
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._valid = np.empty(0, dtype=bool)
+        self._used = np.empty(0, dtype=np.int64)
+        self._new = []  # [key, vector or None, tick] added since load; rows past the loaded arrays
+        self._tick = 0
+
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        try:
+            with np.load(self.path) as data:
+                if str(data["meta"]) != self.model_version or data["vectors"].shape[1:] != (self.dim,):
+                    log.info("Embedding cache is from another model, starting empty")
+                    return
+                keys = data["keys"].tobytes()
+                self._vectors = data["vectors"]
+                self._valid = data["valid"]
+                self._used = data["used"]
+        except Exception as e:
+            log.warning("Embedding Cache Error: %s", e)
+            return
+
+        self._rows = {keys[row * KEY_BYTES:(row + 1) * KEY_BYTES]: row for row in range(len(self._vectors))}
+        self._tick = int(self._used.max()) + 1 if len(self._used) else 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def lookup(self, key):
+        """(found, vector) where vector is None for a cached text with no known words."""
+        row = self._rows.get(key)
+        if row is None:
+            self.misses += 1
+            return False, None
+
+        self.hits += 1
+        self._tick += 1
+        if row >= len(self._vectors):
+            entry = self._new[row - len(self._vectors)]
+            entry[2] = self._tick
+            return True, entry[1]
+
+        self._used[row] = self._tick
+        return True, self._vectors[row] if self._valid[row] else None
+
+    def insert(self, key, vector):
+        if key in self._rows:
+            return
+        self._tick += 1
+        self._rows[key] = len(self._vectors) + len(self._new)
+        self._new.append([key, None if vector is None else np.asarray(vector, dtype=np.float32), self._tick])
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_hit_rate": self.hits / total if total else 0.0,
+            "cache_entries": min(len(self), self.max_entries),
+            "cache_evictions": self.evictions,
+        }
+
+    def save(self):
+        keys = sorted(self._rows, key=self._rows.get)
+        vectors = np.concatenate([
+            self._vectors,
+            np.array([np.zeros(self.dim, np.float32) if v is None else v for _, v, _ in self._new],
+                     dtype=np.float32).reshape(len(self._new), self.dim),
+        ])
+        valid = np.concatenate([self._valid, np.array([v is not None for _, v, _ in self._new], dtype=bool)])
+        used = np.concatenate([self._used, np.array([t for _, _, t in self._new], dtype=np.int64)])
+
+        if len(keys) > self.max_entries:
+            keep = np.sort(np.argsort(-used, kind="stable")[:self.max_entries])
+            self.evictions += len(keys) - len(keep)
+            keys = [keys[i] for i in keep]
+            vectors, valid, used = vectors[keep], valid[keep], used[keep]
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            key_bytes = np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(len(keys), KEY_BYTES)
+            np.savez(f, keys=key_bytes, vectors=vectors, valid=valid, used=used,
+                     meta=np.array(self.model_version))
+        os.replace(tmp_path, self.path)
+
+        self._rows = {key: row for row, key in enumerate(keys)}
+        self._vectors, self._valid, self._used = vectors, valid, used
+        self._new = []
+
+
+def open_cache(app_files_dir, model_version, dim, max_entries=MAX_ENTRIES):
+    return EmbeddingCache(os.path.join(app_files_dir, CACHE_FILE), model_version, dim, max_entries)
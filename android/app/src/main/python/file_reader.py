@@ -1,9 +1,122 @@
 import os
-import traceback
+import time
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import blob_cache
+import metrics
 
+log = metrics.get_logger("file_reader")
 
-def read_file(file_path):
-    print(f"DEBUG: Python reading file: {file_path}")
+TEXT_EXTENSIONS = (
+    '.txt', '.md', '.csv',
+    '.py', '.dart', '.java', '.kt', '.swift',
+    '.c', '.cpp', '.h', '.cs',
+    '.js', '.ts', '.html', '.css',
+    '.json', '.xml', '.yaml', '.yml',
+    '.sql', '.properties', '.gradle', '.sh', '.bat'
+)
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx') + TEXT_EXTENSIONS
+
+# Extraction stops once this many characters are collected, or after MAX_PDF_PAGES.
+MAX_CHARS = 10000
+MAX_PDF_PAGES = 15
+
+# Extracted text is cached under <cache_dir>/extract_cache, keyed by path, size and mtime.
+EXTRACT_CACHE_DIR = "extract_cache"
+EXTRACT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Bulk reads: PDF/DOCX parsing goes to processes, plain text to threads.
+PARSED_EXTENSIONS = ('.pdf', '.docx')
+READ_WORKERS = min(4, os.cpu_count() or 1)
+READ_TIMEOUT = 30.0
+_POLL_SECONDS = 0.05
+
+# Timing span of each extraction (see metrics.py); everything else is "read.text".
+READ_SPANS = {'.pdf': "read.pdf", '.docx': "read.docx"}
+
+
+def _bounded_join(pieces, max_chars, separator=""):
+    """Join `pieces` with `separator`, pulling no more of them than max_chars needs."""
+    chunks = []
+    size = 0
+    for piece in pieces:
+        if size >= max_chars:
+            break
+        if chunks and separator:
+            chunks.append(separator)
+            size += len(separator)
+        chunks.append(piece)
+        size += len(piece)
+    return "".join(chunks)[:max_chars]
+
+
+def _extract(file_path, max_chars=MAX_CHARS):
+    """First `max_chars` characters of `file_path`, or None if parsing it failed."""
+    extension = os.path.splitext(file_path)[1].lower()
+    with metrics.span(READ_SPANS.get(extension, "read.text")):
+        return _parse(file_path, max_chars)
+
+
+def _parse(file_path, max_chars):
+    if file_path.lower().endswith('.pdf'):
+        try:
+            log.debug("Attempting to read PDF with pypdf...")
+            from pypdf import PdfReader
+
+            with open(file_path, 'rb') as f:
+                pdf = PdfReader(f)
+                num_pages = len(pdf.pages)
+                log.debug("PDF has %d pages", num_pages)
+
+                def page_texts():
+                    for i in range(min(num_pages, MAX_PDF_PAGES)):
+                        extracted = pdf.pages[i].extract_text()
+                        if extracted:
+                            yield extracted + "\n"
+
+                text = _bounded_join(page_texts(), max_chars)
+                log.debug("Extracted %d chars from PDF", len(text))
+                return text
+        except Exception as e:
+            log.warning("PDF reading error: %s", e, exc_info=True)
+            return None
+
+    elif file_path.lower().endswith('.docx'):
+        try:
+            log.debug("Attempting to read DOCX...")
+            from docx import Document
+            doc = Document(file_path)
+            text = _bounded_join((p.text for p in doc.paragraphs), max_chars, '\n')
+            log.debug("Extracted %d chars from DOCX", len(text))
+            return text
+        except Exception as e:
+            log.warning("DOCX reading error: %s", e, exc_info=True)
+            return None
+
+    else:
+        try:
+            log.debug("Reading as text/code file...")
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                content = f.read(max_chars)
+                log.debug("Extracted %d chars", len(content))
+                return content
+        except Exception as e:
+            log.warning("Text reading error: %s", e)
+            return None
+
+
+def _extract_cache(cache_dir):
+    return blob_cache.open_cache(os.path.join(cache_dir, EXTRACT_CACHE_DIR), EXTRACT_CACHE_MAX_BYTES)
+
+
+def read_file(file_path, cache_dir=None, max_chars=MAX_CHARS):
+    """{"content": text} with up to `max_chars` characters of a supported file.
+
+    With `cache_dir`, text extracted earlier from the same unchanged file
+    (same path, size and mtime) is returned without parsing it again.
+    """
+    log.debug("Python reading file: %s", file_path)
 
     try:
         if not file_path:
@@ -12,68 +125,145 @@ def read_file(file_path):
         file_path = file_path.strip()
 
         if not os.path.exists(file_path):
-            print(f"DEBUG: File does not exist at path: {file_path}")
+            log.debug("File does not exist at path: %s", file_path)
             return {"content": ""}
 
-        if file_path.lower().endswith('.pdf'):
-            try:
-                print("DEBUG: Attempting to read PDF with pypdf...")
-                from pypdf import PdfReader
+        if not file_path.lower().endswith(SUPPORTED_EXTENSIONS):
+            log.debug("Unsupported file type for text extraction: %s", file_path)
+            return {"content": ""}
 
-                with open(file_path, 'rb') as f:
-                    pdf = PdfReader(f)
-                    text = ''
-                    num_pages = len(pdf.pages)
-                    print(f"DEBUG: PDF has {num_pages} pages")
+        if cache_dir is None:
+            return {"content": _extract(file_path, max_chars) or ""}
 
-                    for i, page in enumerate(pdf.pages[:15]):
-                        extracted = page.extract_text()
-                        if extracted:
-                            text += extracted + "\n"
-
-                    print(f"DEBUG: Extracted {len(text)} chars from PDF")
-                    return {"content": text[:10000]}
-            except Exception as e:
-                print(f"DEBUG: PDF reading error: {e}")
-                traceback.print_exc()
-                return {"content": ""}
-
-        elif file_path.lower().endswith('.docx'):
-            try:
-                print("DEBUG: Attempting to read DOCX...")
-                from docx import Document
-                doc = Document(file_path)
-                text = '\n'.join([p.text for p in doc.paragraphs])
-                print(f"DEBUG: Extracted {len(text)} chars from DOCX")
-                return {"content": text[:10000]}
-            except Exception as e:
-                print(f"DEBUG: DOCX reading error: {e}")
-                traceback.print_exc()
-                return {"content": ""}
-
-        elif file_path.lower().endswith((
-                '.txt', '.md', '.csv',
-                '.py', '.dart', '.java', '.kt', '.swift',
-                '.c', '.cpp', '.h', '.cs',
-                '.js', '.ts', '.html', '.css',
-                '.json', '.xml', '.yaml', '.yml',
-                '.sql', '.properties', '.gradle', '.sh', '.bat'
-        )):
-            try:
-                print("DEBUG: Reading as text/code file...")
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    print(f"DEBUG: Extracted {len(content)} chars")
-                    return {"content": content[:10000]}
-            except Exception as e:
-                print(f"DEBUG: Text reading error: {e}")
-                return {"content": ""}
-
-        else:
-            print(f"DEBUG: Unsupported file type for text extraction: {file_path}")
+        cache = _extract_cache(cache_dir)
+        stat = os.stat(file_path)
+        key = f"{file_path}\0{stat.st_size}\0{stat.st_mtime_ns}\0{max_chars}"
+
+        cached = cache.get(key)
+        if cached is not None:
+            log.debug("Extraction cache hit")
+            return {"content": cached.decode("utf-8", "surrogatepass")}
+
+        content = _extract(file_path, max_chars)
+        if content is None:
             return {"content": ""}
+        cache.put(key, content.encode("utf-8", "surrogatepass"))
+        return {"content": content}
 
     except Exception as e:
-        print(f"DEBUG: Critical file reading error: {e}")
-        traceback.print_exc()
+        log.error("Critical file reading error: %s", e, exc_info=True)
         return {"content": ""}
+
+
+def extraction_cache_info(cache_dir):
+    """Hit/miss counters and size of the extraction cache under `cache_dir`."""
+    try:
+        return _extract_cache(cache_dir).stats()
+    except Exception as e:
+        log.warning("Extraction cache info error: %s", e)
+        return {}
+
+
+class _ReadTimeout(BaseException):
+    """Raised by SIGALRM inside a worker; a BaseException so read_file's handlers let it through."""
+
+
+def _raise_timeout(signum, frame):
+    raise _ReadTimeout()
+
+
+def _timed_read(file_path, cache_dir, max_chars, timeout, started=None):
+    """read_file for a pool worker, tagged with its path.
+
+    In a worker process the read is interrupted with SIGALRM after
+    `timeout` seconds. Threads cannot be interrupted, so they note their
+    start time in `started` and iter_read_files stops waiting for them;
+    it applies the same deadline to process jobs from when they start.
+    """
+    if started is not None:
+        started[file_path] = time.monotonic()
+
+    use_alarm = (timeout and hasattr(signal, "setitimer")
+                 and threading.current_thread() is threading.main_thread())
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        result = read_file(file_path, cache_dir, max_chars)
+    except _ReadTimeout:
+        log.warning("Timed out reading %s", file_path)
+        return {"path": file_path, "content": "", "error": "timeout"}
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+    result["path"] = file_path
+    return result
+
+
+def iter_read_files(paths, max_workers=READ_WORKERS, timeout=READ_TIMEOUT, cache_dir=None, max_chars=MAX_CHARS):
+    """Read many files concurrently, yielding {"path", "content"} as each one finishes.
+
+    Files still unread after `timeout` seconds are yielded with empty
+    content and "error": "timeout" so one bad file cannot stall the batch.
+    """
+    paths = [p.strip() for p in paths if p]
+    parsed = [p for p in paths if p.lower().endswith(PARSED_EXTENSIONS)]
+    plain = [p for p in paths if not p.lower().endswith(PARSED_EXTENSIONS)]
+
+    threads = ThreadPoolExecutor(max(1, max_workers))
+    processes = None
+    if parsed and max_workers > 1:
+        try:
+            processes = ProcessPoolExecutor(max_workers)
+        except (ImportError, NotImplementedError, OSError) as e:
+            log.info("No process pool for file reading (%s), parsing in threads", e)
+
+    started = {}
+    futures = {}
+    try:
+        # Process jobs first: the fork happens on the first submit, before any
+        # reader thread exists that could hold a lock in the child.
+        for file_path in parsed if processes else []:
+            future = processes.submit(_timed_read, file_path, cache_dir, max_chars, timeout)
+            futures[future] = (file_path, False)
+        for file_path in plain + ([] if processes else parsed):
+            future = threads.submit(_timed_read, file_path, cache_dir, max_chars, timeout, started)
+            futures[future] = (file_path, True)
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path, _ = futures[future]
+                try:
+                    yield future.result()
+                except Exception as e:
+                    log.warning("Bulk read error for %s: %s", file_path, e)
+                    yield {"path": file_path, "content": "", "error": str(e)}
+
+            if timeout:
+                now = time.monotonic()
+                for future in list(pending):
+                    file_path, in_thread = futures[future]
+                    if not in_thread and future.running():
+                        started.setdefault(file_path, now)  # Backstop for a child SIGALRM cannot interrupt
+                    start = started.get(file_path)
+                    if start is not None and now - start > timeout:
+                        pending.discard(future)
+                        log.warning("Timed out reading %s", file_path)
+                        yield {"path": file_path, "content": "", "error": "timeout"}
+    finally:
+        threads.shutdown(wait=False, cancel_futures=True)
+        if processes:
+            processes.shutdown(wait=False, cancel_futures=True)
+
+
+def read_files(paths, max_workers=READ_WORKERS, timeout=READ_TIMEOUT, cache_dir=None, max_chars=MAX_CHARS):
+    """{"results": [{"path", "content"}, ...]} for `paths`, in completion order."""
+    try:
+        return {"results": list(iter_read_files(paths, max_workers, timeout, cache_dir, max_chars))}
+    except Exception as e:
+        log.error("Bulk file reading error: %s", e, exc_info=True)
+        return {"results": []}
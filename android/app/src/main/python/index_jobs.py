@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import itertools
+import threading
+import numpy as np
+import bm25
+import classifier
+import embedding_cache
+import index_store
+import metrics
+import neighbors
+import search_engine
+
+log = metrics.get_logger("index_jobs")
+
+# Background index builds that survive the app being killed.
+#
+#   <app files>/index_job/
+#     job.json      options, progress and the valid prefix of the files below
+#     corpus.jsonl  the job's own copy of its {"path", "text"} lines
+#     vectors.f32   unit vectors of the rows embedded so far, row-major
+#     paths.bin     their paths, NUL-terminated
+#     terms.txt     their keyword term counts, one bm25.encode_counts line each
+#
+# Rows are appended as each chunk is embedded, but only the prefix recorded in
+# job.json is ever read, and job.json is rewritten every CHECKPOINT_DOCUMENTS
+# documents. A job started again on the same corpus (or resumed) skips the
+# documents its checkpoint covers and drops anything appended after it. Once
+# every document is embedded the rows are streamed into an IndexWriter and
+# published like train_index_from_documents would, and the directory is removed.
+
+JOB_DIR = "index_job"
+JOB_FILE = "job.json"
+CORPUS_FILE = "corpus.jsonl"
+VECTORS_FILE = "vectors.f32"
+PATHS_FILE = "paths.bin"
+TERMS_FILE = "terms.txt"
+
+CHECKPOINT_DOCUMENTS = 2048
+PUBLISH_BLOCK_ROWS = 4096  # Checkpointed rows handed to the IndexWriter at once
+
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_CANCELLED = "cancelled"
+STATE_ERROR = "error"
+STATE_INTERRUPTED = "interrupted"  # Checkpointed on disk, not running in this process
+
+_jobs_lock = threading.Lock()
+_jobs = {}  # app_files_dir -> the _Job started for it in this process
+
+
+class _Job:
+    def __init__(self, app_files_dir, state, chunk_size, workers):
+        self.app_files_dir = app_files_dir
+        self.directory = job_dir(app_files_dir)
+        self.state = state
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.status = STATE_RUNNING
+        self.processed = state["consumed"]
+        self.resumed_from = state["consumed"]
+        self.started = time.perf_counter()
+        self.finished = None
+        self.result = None
+        self.cancel = threading.Event()
+        self.thread = threading.Thread(target=_run, args=(self,), daemon=True)
+
+
+def job_dir(app_files_dir):
+    return os.path.join(app_files_dir, JOB_DIR)
+
+
+def _corpus_digest(jsonl_path):
+    digest = hashlib.sha1()
+    with open(jsonl_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _count_documents(jsonl_path):
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def _read_job(directory):
+    try:
+        with open(os.path.join(directory, JOB_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_job(directory, state):
+    index_store._replace_file(os.path.join(directory, JOB_FILE),
+                              lambda f: f.write(json.dumps(state).encode("utf-8")))
+
+
+def _reset_checkpoint(state):
+    state.update(consumed=0, count=0, paths_bytes=0, terms_bytes=0)
+
+
+def _append_rows(directory, state, paths, vectors, counts):
+    """Append embedded rows after the valid prefix recorded in `state`."""
+    path_bytes = index_store._encode_paths(paths)
+    term_bytes = "".join(bm25.encode_counts(c) for c in counts).encode("utf-8")
+    index_store._append_file(os.path.join(directory, VECTORS_FILE),
+                             state["count"] * state["dim"] * 4, vectors.tobytes())
+    index_store._append_file(os.path.join(directory, PATHS_FILE), state["paths_bytes"], path_bytes)
+    index_store._append_file(os.path.join(directory, TERMS_FILE), state["terms_bytes"], term_bytes)
+    state["count"] += len(paths)
+    state["paths_bytes"] += len(path_bytes)
+    state["terms_bytes"] += len(term_bytes)
+
+
+def _publish(job):
+    """Stream the checkpointed rows into a new main segment and commit it."""
+    state, directory = job.state, job.directory
+    count, dim = state["count"], state["dim"]
+
+    with open(os.path.join(directory, PATHS_FILE), "rb") as f:
+        paths = index_store._decode_paths(f.read(state["paths_bytes"]), count)
+    with open(os.path.join(directory, TERMS_FILE), "rb") as f:
+        lines = f.read(state["terms_bytes"]).decode("utf-8").split("\n")[:count]
+    vectors = np.empty((0, dim), dtype=np.float32)
+    if count:
+        vectors = np.memmap(os.path.join(directory, VECTORS_FILE), dtype=np.float32, mode="r",
+                            shape=(count, dim))
+
+    writer = index_store.IndexWriter(job.app_files_dir, dim, state["vector_dtype"], lexical=True, metadata=True)
+    try:
+        for start in range(0, count, PUBLISH_BLOCK_ROWS):
+            stop = start + PUBLISH_BLOCK_ROWS
+            counts = [bm25.decode_counts(line) for line in lines[start:stop]]
+            writer.append(paths[start:stop], vectors[start:stop], counts)
+        del vectors
+        search_engine._publish_index(writer, state["neighbor_k"], state["ivf_subclusters"])
+    except Exception:
+        writer.abort()
+        raise
+
+
+def _run(job):
+    state, directory = job.state, job.directory
+    try:
+        models_dir = os.path.join(job.app_files_dir, "models")
+        if not classifier.load_resources(models_dir):
+            raise RuntimeError("Could not load model for search training")
+
+        dim = classifier._word_vectors.shape[1]
+        if state["consumed"] and (state["model_version"], state["dim"]) != (classifier._model_version, dim):
+            log.info("Model changed since the last checkpoint, indexing from the start")
+            _reset_checkpoint(state)
+            job.processed = job.resumed_from = 0
+        state.update(dim=int(dim), model_version=classifier._model_version)
+
+        documents = search_engine._read_jsonl(os.path.join(directory, CORPUS_FILE))
+        seen = set()
+        for path, _ in itertools.islice(documents, state["consumed"]):
+            seen.add(path)
+        skipped = state["consumed"]
+        checkpointed = skipped
+
+        cache = embedding_cache.open_cache(job.app_files_dir, classifier._model_version, dim)
+        for paths, vectors, counts, consumed in search_engine._embedded_batches(
+                models_dir, documents, dim, job.chunk_size, job.workers, cache, seen):
+            _append_rows(directory, state, paths, vectors, counts)
+            state["consumed"] = job.processed = skipped + consumed
+            if job.cancel.is_set():
+                break
+            if state["consumed"] - checkpointed >= CHECKPOINT_DOCUMENTS:
+                _write_job(directory, state)
+                checkpointed = state["consumed"]
+
+        if job.cancel.is_set():
+            shutil.rmtree(directory, ignore_errors=True)
+            job.status = STATE_CANCELLED
+            log.info("Index job %s cancelled after %d documents", state["job_id"], job.processed)
+            return
+
+        job.processed = state["consumed"] = state["total"]
+        _write_job(directory, state)
+        _publish(job)
+        cache.save()
+        shutil.rmtree(directory, ignore_errors=True)
+
+        job.result = {"documents": len(seen), "indexed": state["count"]}
+        job.status = STATE_DONE
+        log.info("Index job %s saved %d of %d files", state["job_id"], state["count"], len(seen))
+    except Exception as e:
+        log.error("Index Job Error: %s", e, exc_info=True)
+        job.status = STATE_ERROR
+        job.result = {"error": str(e)}
+    finally:
+        job.finished = time.perf_counter()
+
+
+def _start(app_files_dir, state, chunk_size, workers):
+    job = _Job(app_files_dir, state, chunk_size, workers)
+    _jobs[app_files_dir] = job
+    job.thread.start()
+    return {"status": "started", "job_id": state["job_id"], "resumed_from": job.resumed_from}
+
+
+def start_index_job(app_files_dir, jsonl_path, neighbor_k=neighbors.NEIGHBOR_K, ivf_subclusters=0,
+                    vector_dtype="float32", chunk_size=search_engine.INGEST_CHUNK_SIZE,
+                    workers=search_engine.INGEST_WORKERS):
+    """Index the {"path", "text"} lines of `jsonl_path` in the background.
+
+    The corpus is copied, so the caller may delete it once this returns. A
+    checkpointed job for the same corpus is resumed rather than restarted;
+    one for another corpus is discarded. Only one job runs per directory.
+    """
+    try:
+        with _jobs_lock:
+            running = _jobs.get(app_files_dir)
+            if running is not None and running.status == STATE_RUNNING:
+                return {"status": "running", "job_id": running.state["job_id"]}
+
+            directory = job_dir(app_files_dir)
+            digest = _corpus_digest(jsonl_path)
+            state = _read_job(directory)
+            if state is not None and state["corpus_digest"] == digest:
+                log.info("Resuming index job %s at document %d", state["job_id"], state["consumed"])
+                return _start(app_files_dir, state, chunk_size, workers)
+
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            shutil.copyfile(jsonl_path, os.path.join(directory, CORPUS_FILE))
+            state = {
+                "job_id": uuid.uuid4().hex,
+                "corpus_digest": digest,
+                "total": _count_documents(jsonl_path),
+                "neighbor_k": int(neighbor_k),
+                "ivf_subclusters": int(ivf_subclusters),
+                "vector_dtype": vector_dtype,
+                "dim": 0,
+                "model_version": None,
+            }
+            _reset_checkpoint(state)
+            _write_job(directory, state)
+            log.info("Indexing %d files for search as job %s", state["total"], state["job_id"])
+            return _start(app_files_dir, state, chunk_size, workers)
+
+    except Exception as e:
+        log.error("Index Job Error: %s", e)
+        return {"status": "error"}
+
+
+def resume_index_job(app_files_dir, chunk_size=search_engine.INGEST_CHUNK_SIZE,
+                     workers=search_engine.INGEST_WORKERS):
+    """Continue a job interrupted by the process exiting, from its last checkpoint."""
+    with _jobs_lock:
+        running = _jobs.get(app_files_dir)
+        if running is not None and running.status == STATE_RUNNING:
+            return {"status": "running", "job_id": running.state["job_id"]}
+
+        state = _read_job(job_dir(app_files_dir))
+        if state is None:
+            return {"status": "none"}
+        log.info("Resuming index job %s at document %d", state["job_id"], state["consumed"])
+        return _start(app_files_dir, state, chunk_size, workers)
+
+
+def job_status(app_files_dir):
+    """Progress of the latest job: state, processed/total, docs/sec and ETA."""
+    job = _jobs.get(app_files_dir)
+    if job is None:
+        state = _read_job(job_dir(app_files_dir))
+        if state is None:
+            return {"state": "none"}
+        return {
+            "job_id": state["job_id"],
+            "state": STATE_INTERRUPTED,
+            "processed": state["consumed"],
+            "total": state["total"],
+            "indexed": state["count"],
+        }
+
+    elapsed = (job.finished or time.perf_counter()) - job.started
+    rate = (job.processed - job.resumed_from) / elapsed if elapsed > 0 else 0.0
+    status = {
+        "job_id": job.state["job_id"],
+        "state": job.status,
+        "processed": job.processed,
+        "total": job.state["total"],
+        "indexed": job.state["count"],
+        "resumed_from": job.resumed_from,
+        "seconds": elapsed,
+        "docs_per_sec": rate,
+        "eta_seconds": None,
+    }
+    if job.status == STATE_RUNNING and rate > 0:
+        status["eta_seconds"] = (job.state["total"] - job.processed) / rate
+    elif job.status == STATE_DONE:
+        status["eta_seconds"] = 0.0
+    if job.result is not None:
+        status.update(job.result)
+    return status
+
+
+def cancel_job(app_files_dir):
+    """Stop the running job and discard its checkpoint (or an interrupted job's)."""
+    with _jobs_lock:
+        job = _jobs.get(app_files_dir)
+        if job is not None and job.status == STATE_RUNNING:
+            job.cancel.set()
+            return {"status": "cancelling", "job_id": job.state["job_id"]}
+
+        state = _read_job(job_dir(app_files_dir))
+        if state is None:
+            return {"status": "none"}
+        shutil.rmtree(job_dir(app_files_dir), ignore_errors=True)
+        return {"status": "cancelled", "job_id": state["job_id"]}
@@ -0,0 +1,991 @@
+import os
+import re
+import sys
+import json
+import tempfile
+import threading
+import numpy as np
+import bm25
+import ivf
+import metadata
+import metrics
+import scoring
+
+log = metrics.get_logger("index_store")
+
+# On-disk layout of the search index (inside app_files_dir):
+#
+#   search_index/header.json        small header: format version, dimension, counts
+#   search_index/vectors.npy        main segment: contiguous matrix, one unit vector per
+#                                   row, stored as float32 (default), float16 or int8
+#   search_index/scales.npy         float32 per-row scales when vectors.npy is int8
+#   search_index/paths.bin          NUL-terminated UTF-8 paths, row-aligned with vectors
+#   search_index/delta_vectors.f32  delta segment: raw float32 rows appended by
+#                                   incremental updates
+#   search_index/delta_paths.bin    NUL-terminated paths, row-aligned with the delta rows
+#   search_index/tombstones.i64     int64 ids of deleted rows (main rows first, then delta)
+#   search_index/neighbors_ids.npy  optional int32 table of each row's top-K neighbour rows
+#   search_index/neighbors_scores.npy  float16 scores matching neighbors_ids, best first
+#   search_index/neighbors_patch.npz   rows of the table rewritten by incremental updates
+#   search_index/ivf_centroids.npy  optional float32 coarse quantizer for approximate search
+#   search_index/ivf_offsets.npy    int64 start of each centroid's list in ivf_rows.npy
+#   search_index/ivf_rows.npy       int32 main-segment rows grouped by nearest centroid
+#   search_index/bm25_*.npy         optional keyword postings of the main segment (see bm25.py)
+#   search_index/bm25_delta.txt     term counts of the delta rows, one line per row
+#   search_index/meta.npy           per-row metadata records of the main segment (see
+#                                   metadata.py)
+#   search_index/delta_meta.bin     raw metadata records of the delta rows
+#   search_index/meta_extensions.bin  NUL-terminated extension names the records' codes index
+#   search_index/meta_folders.bin   NUL-terminated folder names the records' ids index
+#
+# The header is written last and carries a generation counter that every
+# write bumps; get_index() keeps one open SearchIndex per directory and only
+# reopens it after header.json has been replaced. Delta, tombstone and name table files are append-only and
+# only the prefix recorded in the header is ever read, so a crash halfway
+# through an append leaves the previous index intact.
+#
+# Files are never rewritten in place. Each commit writes its segment files
+# under generation-stamped names (vectors.g12.npy, ...) and the header's
+# "files" manifest maps every name above to the file of its snapshot, so a
+# reader that opened generation N keeps a consistent view while N+1 is
+# built and published. Files referenced by neither the current nor the
+# previous header are deleted after each publish; a reader that loses that
+# race finds a newer header and loads again.
+
+INDEX_DIR = "search_index"
+LEGACY_INDEX_FILE = "search_index.json"
+FORMAT_VERSION = 1
+
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+PATHS_FILE = "paths.bin"
+DELTA_VECTORS_FILE = "delta_vectors.f32"
+DELTA_PATHS_FILE = "delta_paths.bin"
+TOMBSTONES_FILE = "tombstones.i64"
+NEIGHBOR_IDS_FILE = "neighbors_ids.npy"
+NEIGHBOR_SCORES_FILE = "neighbors_scores.npy"
+NEIGHBOR_PATCH_FILE = "neighbors_patch.npz"
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_OFFSETS_FILE = "ivf_offsets.npy"
+IVF_ROWS_FILE = "ivf_rows.npy"
+BM25_FILES = {name: f"bm25_{name}.npy" for name in bm25.ARRAYS}
+BM25_DELTA_FILE = "bm25_delta.txt"
+META_FILE = "meta.npy"
+DELTA_META_FILE = "delta_meta.bin"
+META_EXTENSIONS_FILE = "meta_extensions.bin"
+META_FOLDERS_FILE = "meta_folders.bin"
+INDEX_FILES = [VECTORS_FILE, SCALES_FILE, PATHS_FILE, DELTA_VECTORS_FILE, DELTA_PATHS_FILE, TOMBSTONES_FILE,
+               NEIGHBOR_IDS_FILE, NEIGHBOR_SCORES_FILE, NEIGHBOR_PATCH_FILE,
+               IVF_CENTROIDS_FILE, IVF_OFFSETS_FILE, IVF_ROWS_FILE, BM25_DELTA_FILE,
+               META_FILE, DELTA_META_FILE, META_EXTENSIONS_FILE, META_FOLDERS_FILE] + list(BM25_FILES.values())
+_GENERATION_TAG = re.compile(r"\.g\d+\.")
+
+# Attempts to open a snapshot whose files were removed by a newer publish.
+LOAD_RETRIES = 5
+
+# IndexWriter streams rows into these before commit() publishes them.
+STAGING_PREFIX = "staging_"
+
+# The delta segment is merged into the main segment once it holds more than
+# this many rows, or more than DELTA_MERGE_RATIO of the main segment.
+DELTA_MERGE_MIN_ROWS = 256
+DELTA_MERGE_RATIO = 0.1
+
+# Times merge_delta rebuilds when a full rebuild publishes before it does.
+MERGE_RETRIES = 3
+
+_write_lock = threading.RLock()
+_merging = set()
+_staging_files = set()
+
+_cache_lock = threading.Lock()
+_cache = {}
+_cache_stats = {"hits": 0, "reloads": 0}
+
+
+class SearchIndex:
+    def __init__(self, header, paths, main_vectors, delta_vectors=None, tombstones=None,
+                 neighbors=None, neighbor_patch=None, ivf_lists=None, main_scales=None, lexical=None,
+                 columns=None):
+        self.header = header
+        self.paths = paths
+        self.main_vectors = main_vectors
+        self.main_scales = main_scales
+        if delta_vectors is None:
+            delta_vectors = np.empty((0, main_vectors.shape[1]), dtype=np.float32)
+        self.delta_vectors = delta_vectors
+
+        self.live = None
+        if tombstones is not None and len(tombstones):
+            self.live = np.ones(len(paths), dtype=bool)
+            self.live[tombstones] = False
+
+        # Base neighbour table (ids, scores) and {row: (ids, scores)} overrides.
+        self.neighbors = neighbors
+        self.neighbor_patch = neighbor_patch or {}
+
+        # (centroids, offsets, rows) inverted lists over the main segment.
+        self.ivf = ivf_lists
+
+        # bm25.LexicalIndex over every row, or None for indexes built without one.
+        self.lexical = lexical
+
+        # (metadata records, extension names, folder names) of every row.
+        self._columns = columns
+
+        self._positions = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def dim(self):
+        return self.header["dim"]
+
+    @property
+    def generation(self):
+        return self.header["generation"]
+
+    @property
+    def segments(self):
+        """(first_row, matrix, row scales or None) for each segment, in row order."""
+        return [(0, self.main_vectors, self.main_scales),
+                (len(self.main_vectors), self.delta_vectors, None)]
+
+    def vector(self, row):
+        """Row `row` as a float32 vector."""
+        return self.gather(np.array([row]))[0]
+
+    def gather(self, rows):
+        """float32 matrix of the given rows, which must be sorted."""
+        rows = np.asarray(rows, dtype=np.int64)
+        main_count = len(self.main_vectors)
+        split = np.searchsorted(rows, main_count)
+        main_rows = rows[:split]
+        scales = None if self.main_scales is None else self.main_scales[main_rows]
+        return np.concatenate([scoring.dequantize(self.main_vectors[main_rows], scales),
+                               self.delta_vectors[rows[split:] - main_count]])
+
+    def is_live(self, row):
+        return self.live is None or bool(self.live[row])
+
+    def live_paths(self):
+        if self.live is None:
+            return list(self.paths)
+        return [path for path, alive in zip(self.paths, self.live) if alive]
+
+    def position(self, path):
+        """Live row of `path` in the index, or None if it is not indexed."""
+        if self._positions is None:
+            self._positions = {p: i for i, p in enumerate(self.paths) if self.is_live(i)}
+        return self._positions.get(path)
+
+    def metadata(self):
+        """(records, extension names, folder names) of every row; see metadata.py.
+
+        Indexes written before the columns existed derive them on first use.
+        """
+        if self._columns is None:
+            extensions, folders = [], []
+            records = metadata.encode(self.paths, self.gather(np.arange(len(self))), extensions, folders)
+            self._columns = (records, extensions, folders)
+        return self._columns
+
+    @property
+    def neighbor_k(self):
+        return self.header["neighbor_k"]
+
+    def has_neighbors(self):
+        """True if the neighbour table covers every row of the index."""
+        return self.neighbor_k > 0 and self.header["neighbor_rows"] == len(self)
+
+    def neighbor_list(self, row):
+        """(ids, scores) of `row`'s precomputed neighbours, best first."""
+        if row in self.neighbor_patch:
+            return self.neighbor_patch[row]
+        ids, scores = self.neighbors
+        return ids[row], scores[row]
+
+    def neighbor_table(self):
+        """In-memory copy of the table for the covered rows, patches applied."""
+        rows = self.header["neighbor_rows"]
+        k = self.neighbor_k
+        ids = np.full((rows, k), -1, dtype=np.int32)
+        scores = np.full((rows, k), -np.inf, dtype=np.float16)
+        if self.neighbors is not None:
+            base_rows = len(self.neighbors[0])
+            ids[:base_rows] = self.neighbors[0]
+            scores[:base_rows] = self.neighbors[1]
+        for row, (row_ids, row_scores) in self.neighbor_patch.items():
+            ids[row] = row_ids
+            scores[row] = row_scores
+        return ids, scores
+
+    def memory_footprint(self):
+        """Approximate bytes held by this index, split by component."""
+        footprint = {
+            "main_vectors": int(self.main_vectors.nbytes),
+            "main_vectors_mapped": isinstance(self.main_vectors, np.memmap),
+            "main_scales": 0 if self.main_scales is None else int(self.main_scales.nbytes),
+            "delta_vectors": int(self.delta_vectors.nbytes),
+            "paths": sys.getsizeof(self.paths) + sum(sys.getsizeof(p) for p in self.paths),
+            "live_mask": 0 if self.live is None else int(self.live.nbytes),
+            "positions": 0 if self._positions is None else sys.getsizeof(self._positions),
+            "neighbors": 0 if self.neighbors is None else int(sum(a.nbytes for a in self.neighbors)),
+            "neighbor_patch": 18 * self.neighbor_k * len(self.neighbor_patch),
+            "ivf": 0 if self.ivf is None else int(sum(a.nbytes for a in self.ivf)),
+            "bm25": 0 if self.lexical is None else self.lexical.nbytes(),
+            "metadata": 0 if self._columns is None else int(self._columns[0].nbytes),
+        }
+        footprint["total"] = sum(v for k, v in footprint.items() if k != "main_vectors_mapped")
+        return footprint
+
+
+def index_dir(app_files_dir):
+    return os.path.join(app_files_dir, INDEX_DIR)
+
+
+def _replace_file(path, write):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _current_header(directory):
+    try:
+        return _read_header(directory)
+    except (OSError, ValueError):
+        return None
+
+
+def _next_generation(directory):
+    current = _current_header(directory)
+    return (current["generation"] if current else 0) + 1
+
+
+def _write_header(directory, header):
+    """Publish `header` under the next generation number."""
+    header["generation"] = _next_generation(directory)
+    _replace_file(os.path.join(directory, HEADER_FILE),
+                  lambda f: f.write(json.dumps(header).encode("utf-8")))
+
+
+def _generation_name(name, generation):
+    """`name` stamped with `generation`: vectors.npy -> vectors.g12.npy."""
+    stem, ext = name.split(".", 1)
+    return f"{stem}.g{generation}.{ext}"
+
+
+def _file(directory, header, name):
+    """Path of index file `name` in the snapshot described by `header`."""
+    return os.path.join(directory, header["files"].get(name, name))
+
+
+def _remove_unreferenced(directory, *headers):
+    """Delete index files that none of `headers` refer to."""
+    keep = set()
+    for header in headers:
+        if header is not None:
+            keep.update(header["files"].get(name, name) for name in INDEX_FILES)
+
+    for name in os.listdir(directory):
+        if name not in keep and _GENERATION_TAG.sub(".", name, count=1) in INDEX_FILES:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def _read_header(directory):
+    with open(os.path.join(directory, HEADER_FILE), "r") as f:
+        header = json.load(f)
+
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported search index version: {header.get('version')}")
+
+    header.setdefault("generation", 0)
+    header.setdefault("vector_dtype", "float32")
+    header.setdefault("delta_count", 0)
+    header.setdefault("delta_paths_bytes", 0)
+    header.setdefault("tombstone_count", 0)
+    header.setdefault("neighbor_k", 0)
+    header.setdefault("neighbor_rows", 0)
+    header.setdefault("neighbor_patch_rows", 0)
+    header.setdefault("ivf_lists", 0)
+    header.setdefault("bm25", False)
+    header.setdefault("bm25_delta_bytes", 0)
+    header.setdefault("metadata", False)
+    header.setdefault("extension_count", 0)
+    header.setdefault("extension_bytes", 0)
+    header.setdefault("folder_count", 0)
+    header.setdefault("folder_bytes", 0)
+    header.setdefault("files", {})  # Written before the manifest: every file under its plain name
+    return header
+
+
+def _append_file(path, valid_bytes, data):
+    """Append `data` after the first `valid_bytes` bytes, dropping any torn tail."""
+    with open(path, "ab") as f:
+        f.truncate(valid_bytes)
+        f.write(data)
+
+
+def _encode_paths(paths):
+    return b"".join(path.encode("utf-8") + b"\0" for path in paths)
+
+
+def _decode_paths(data, count):
+    if count == 0:
+        return []
+    return data.decode("utf-8").split("\0")[:count]
+
+
+def _write_matrix(path, staged, vector_dtype):
+    """Copy float32 rows from `staged` into a .npy of `vector_dtype`, block by block.
+
+    Returns the per-row scales for int8, otherwise None.
+    """
+    dtype = np.dtype(vector_dtype)
+    scales = np.empty(len(staged), dtype=np.float32) if vector_dtype == "int8" else None
+
+    tmp_path = path + ".tmp"
+    if not len(staged):
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.empty(staged.shape, dtype=dtype))
+    else:
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=staged.shape)
+        for start in range(0, len(staged), scoring.SCORE_BLOCK_ROWS):
+            stop = start + scoring.SCORE_BLOCK_ROWS
+            data, block_scales = scoring.quantize(staged[start:stop], vector_dtype)
+            out[start:stop] = data
+            if scales is not None:
+                scales[start:stop] = block_scales
+        out.flush()
+        del out
+    os.replace(tmp_path, path)
+    return scales
+
+
+class IndexWriter:
+    """Builds a new main segment from streamed rows.
+
+    Rows are appended to staging files on disk, so memory stays bounded by
+    the size of each append. Nothing is visible to readers until commit(),
+    which replaces the whole index (main and delta segments) at once.
+    """
+
+    def __init__(self, app_files_dir, dim, vector_dtype="float32", lexical=False, metadata=False):
+        if vector_dtype not in scoring.VECTOR_DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {vector_dtype}")
+
+        self.app_files_dir = app_files_dir
+        self.directory = index_dir(app_files_dir)
+        self.dim = int(dim)
+        self.vector_dtype = vector_dtype
+        self.count = 0
+        self._postings = bm25.PostingsBuilder() if lexical else None
+        self._records = [] if metadata else None
+        self._extensions = []
+        self._folders = []
+
+        os.makedirs(self.directory, exist_ok=True)
+        _remove_abandoned_staging(self.directory)
+
+        fd, self._vectors_path = tempfile.mkstemp(prefix=STAGING_PREFIX, suffix=".f32", dir=self.directory)
+        self._vectors_file = os.fdopen(fd, "wb")
+        fd, self._paths_path = tempfile.mkstemp(prefix=STAGING_PREFIX, suffix=".bin", dir=self.directory)
+        self._paths_file = os.fdopen(fd, "wb")
+        _staging_files.update((self._vectors_path, self._paths_path))
+
+    def append(self, paths, vectors, term_counts=None):
+        """Stage rows; `term_counts` ({term: tf} per path) is required for a lexical writer."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(paths), self.dim):
+            raise ValueError(f"Expected {len(paths)} vectors of dim {self.dim}, got {vectors.shape}")
+        if self._postings is not None:
+            if term_counts is None or len(term_counts) != len(paths):
+                raise ValueError(f"Expected term counts for {len(paths)} paths")
+            self._postings.add(term_counts)
+        if self._records is not None:
+            self._records.append(metadata.encode(paths, vectors, self._extensions, self._folders))
+
+        self._vectors_file.write(vectors.tobytes())
+        self._paths_file.write(_encode_paths(paths))
+        self.count += len(paths)
+
+    def staged_vectors(self):
+        """float32 matrix of every row appended so far, memory-mapped from disk."""
+        if not self._vectors_file.closed:
+            self._vectors_file.flush()
+        if not self.count:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+
+    def _close(self):
+        self._vectors_file.close()
+        self._paths_file.close()
+
+    def abort(self):
+        self._close()
+        for path in (self._vectors_path, self._paths_path):
+            _staging_files.discard(path)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def commit(self, neighbors=None, neighbor_rows=None, ivf_lists=None, lexical=None, columns=None):
+        """Publish the staged rows as the index.
+
+        `neighbors` is an optional (ids, scores) table for the first
+        `neighbor_rows` rows (all of them by default). `ivf_lists` is an
+        optional (centroids, offsets, rows) coarse quantizer over all rows.
+        `lexical` is packed keyword postings (see bm25.pack) over all rows;
+        a lexical writer packs the term counts it was given. `columns` is
+        (metadata records, extension names, folder names) over all rows; a
+        metadata writer encodes the rows it was given.
+        """
+        self._close()
+        directory = self.directory
+        staged = self.staged_vectors()
+        if lexical is None and self._postings is not None:
+            lexical = self._postings.pack()
+        if columns is None and self._records is not None:
+            records = np.concatenate(self._records) if self._records else np.zeros(0, dtype=metadata.META_DTYPE)
+            columns = (records, self._extensions, self._folders)
+
+        header = {
+            "version": FORMAT_VERSION,
+            "generation": 0,
+            "vector_dtype": self.vector_dtype,
+            "dim": self.dim,
+            "count": self.count,
+            "delta_count": 0,
+            "delta_paths_bytes": 0,
+            "tombstone_count": 0,
+            "neighbor_k": 0,
+            "neighbor_rows": 0,
+            "neighbor_patch_rows": 0,
+            "ivf_lists": 0,
+            "bm25": False,
+            "bm25_delta_bytes": 0,
+            "metadata": False,
+            "extension_count": 0,
+            "extension_bytes": 0,
+            "folder_count": 0,
+            "folder_bytes": 0,
+        }
+
+        with _write_lock:
+            previous = _current_header(directory)
+            generation = _next_generation(directory)
+            header["files"] = files = {name: _generation_name(name, generation) for name in INDEX_FILES}
+
+            def path(name):
+                return os.path.join(directory, files[name])
+
+            scales = _write_matrix(path(VECTORS_FILE), staged, self.vector_dtype)
+            os.replace(self._paths_path, path(PATHS_FILE))
+
+            if scales is not None:
+                _replace_file(path(SCALES_FILE), lambda f: np.save(f, scales))
+
+            if neighbors is not None:
+                ids, scores = neighbors
+                _replace_file(path(NEIGHBOR_IDS_FILE),
+                              lambda f: np.save(f, np.ascontiguousarray(ids, dtype=np.int32)))
+                _replace_file(path(NEIGHBOR_SCORES_FILE),
+                              lambda f: np.save(f, np.ascontiguousarray(scores, dtype=np.float16)))
+                header["neighbor_k"] = int(ids.shape[1])
+                header["neighbor_rows"] = self.count if neighbor_rows is None else int(neighbor_rows)
+
+            if ivf_lists is not None:
+                centroids, offsets, rows = ivf_lists
+                _replace_file(path(IVF_CENTROIDS_FILE),
+                              lambda f: np.save(f, np.ascontiguousarray(centroids, dtype=np.float32)))
+                _replace_file(path(IVF_OFFSETS_FILE),
+                              lambda f: np.save(f, np.ascontiguousarray(offsets, dtype=np.int64)))
+                _replace_file(path(IVF_ROWS_FILE),
+                              lambda f: np.save(f, np.ascontiguousarray(rows, dtype=np.int32)))
+                header["ivf_lists"] = len(centroids)
+
+            if lexical is not None:
+                if len(lexical["lengths"]) != self.count:
+                    raise ValueError(f"Keyword postings cover {len(lexical['lengths'])} of {self.count} rows")
+                for name, file_name in BM25_FILES.items():
+                    _replace_file(path(file_name),
+                                  lambda f: np.save(f, np.ascontiguousarray(lexical[name])))
+                header["bm25"] = True
+
+            if columns is not None:
+                records, extensions, folders = columns
+                if len(records) != self.count:
+                    raise ValueError(f"Metadata covers {len(records)} of {self.count} rows")
+                _replace_file(path(META_FILE),
+                              lambda f: np.save(f, np.ascontiguousarray(records, dtype=metadata.META_DTYPE)))
+                extension_bytes, folder_bytes = _encode_paths(extensions), _encode_paths(folders)
+                _replace_file(path(META_EXTENSIONS_FILE), lambda f: f.write(extension_bytes))
+                _replace_file(path(META_FOLDERS_FILE), lambda f: f.write(folder_bytes))
+                header.update(metadata=True, extension_count=len(extensions), extension_bytes=len(extension_bytes),
+                              folder_count=len(folders), folder_bytes=len(folder_bytes))
+
+            _write_header(directory, header)
+            # Readers may still be opening the previous generation; older ones are gone.
+            _remove_unreferenced(directory, header, previous)
+
+            legacy_path = os.path.join(self.app_files_dir, LEGACY_INDEX_FILE)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+
+        self.abort()  # Drops the staging vectors; the paths file has been moved
+        return header
+
+
+def _remove_abandoned_staging(directory):
+    """Delete staging files left behind by a writer that never committed."""
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith(STAGING_PREFIX) and path not in _staging_files:
+            os.remove(path)
+
+
+def save_index(app_files_dir, paths, vectors, neighbors=None, neighbor_rows=None, ivf_lists=None,
+               vector_dtype="float32", lexical=None, columns=None):
+    """Write `vectors` as the whole index, replacing the main and delta segments.
+
+    See IndexWriter.commit for `neighbors`, `neighbor_rows`, `ivf_lists`,
+    `lexical` and `columns`; metadata is encoded from `paths` and `vectors`
+    when `columns` is not given. `vector_dtype` picks the storage of the
+    main segment (see scoring.VECTOR_DTYPES).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2 or len(paths) != vectors.shape[0]:
+        raise ValueError(f"{len(paths)} paths for {vectors.shape[0]} vectors")
+
+    writer = IndexWriter(app_files_dir, vectors.shape[1], vector_dtype, metadata=columns is None)
+    try:
+        writer.append(paths, vectors)
+        return writer.commit(neighbors, neighbor_rows, ivf_lists, lexical, columns)
+    except Exception:
+        writer.abort()
+        raise
+
+
+def migrate_legacy_index(app_files_dir):
+    """Convert a search_index.json written by older builds, once."""
+    legacy_path = os.path.join(app_files_dir, LEGACY_INDEX_FILE)
+    if not os.path.exists(legacy_path):
+        return False
+
+    with open(legacy_path, "r") as f:
+        index_data = json.load(f)
+
+    paths = [item["path"] for item in index_data]
+    vectors = np.array([item["vector"] for item in index_data], dtype=np.float32)
+    if not paths:
+        vectors = vectors.reshape(0, 0)
+
+    save_index(app_files_dir, paths, vectors)
+    log.info("Migrated %d vectors from %s", len(paths), LEGACY_INDEX_FILE)
+    return True
+
+
+def load_index(app_files_dir):
+    """Open the search index, or return None if nothing has been indexed yet."""
+    directory = index_dir(app_files_dir)
+
+    if not os.path.exists(os.path.join(directory, HEADER_FILE)):
+        if not migrate_legacy_index(app_files_dir):
+            return None
+
+    for attempt in range(LOAD_RETRIES):
+        header = _read_header(directory)
+        try:
+            return _open_snapshot(directory, header)
+        except (OSError, ValueError):
+            # A newer publish removed files of this generation while they were
+            # being opened; any other failure keeps the header unchanged.
+            if attempt == LOAD_RETRIES - 1 or _read_header(directory)["generation"] == header["generation"]:
+                raise
+
+
+def _open_snapshot(directory, header):
+    dim = header["dim"]
+
+    count = header["count"]
+    if count == 0:
+        vectors = np.empty((0, dim), dtype=np.float32)
+    else:
+        vectors = np.load(_file(directory, header, VECTORS_FILE), mmap_mode="r")
+
+    scales = None
+    if header["vector_dtype"] == "int8":
+        scales = np.load(_file(directory, header, SCALES_FILE)) if count else np.empty(0, np.float32)
+
+    with open(_file(directory, header, PATHS_FILE), "rb") as f:
+        paths = _decode_paths(f.read(), count)
+
+    if vectors.shape[0] != count or len(paths) != count:
+        raise ValueError("Search index files do not match their header")
+
+    delta_vectors = None
+    tombstones = None
+
+    delta_count = header["delta_count"]
+    if delta_count:
+        delta_vectors = np.fromfile(_file(directory, header, DELTA_VECTORS_FILE),
+                                    dtype=np.float32, count=delta_count * dim)
+        delta_vectors = delta_vectors.reshape(delta_count, dim)
+        with open(_file(directory, header, DELTA_PATHS_FILE), "rb") as f:
+            delta_paths = _decode_paths(f.read(header["delta_paths_bytes"]), delta_count)
+        if len(delta_paths) != delta_count:
+            raise ValueError("Delta segment does not match its header")
+        paths = paths + delta_paths
+
+    if header["tombstone_count"]:
+        tombstones = np.fromfile(_file(directory, header, TOMBSTONES_FILE),
+                                 dtype=np.int64, count=header["tombstone_count"])
+
+    neighbors = None
+    neighbor_patch = None
+    if header["neighbor_k"]:
+        neighbors = (np.load(_file(directory, header, NEIGHBOR_IDS_FILE), mmap_mode="r"),
+                     np.load(_file(directory, header, NEIGHBOR_SCORES_FILE), mmap_mode="r"))
+        if header["neighbor_patch_rows"]:
+            with np.load(_file(directory, header, NEIGHBOR_PATCH_FILE)) as patch:
+                neighbor_patch = {int(row): (ids, scores) for row, ids, scores
+                                  in zip(patch["rows"], patch["ids"], patch["scores"])}
+
+    ivf_lists = None
+    if header["ivf_lists"]:
+        ivf_lists = (np.load(_file(directory, header, IVF_CENTROIDS_FILE)),
+                     np.load(_file(directory, header, IVF_OFFSETS_FILE)),
+                     np.load(_file(directory, header, IVF_ROWS_FILE), mmap_mode="r"))
+
+    lexical = None
+    if header["bm25"]:
+        arrays = {name: np.load(_file(directory, header, file_name), mmap_mode="r")
+                  for name, file_name in BM25_FILES.items()}
+        delta_text = ""
+        if header["bm25_delta_bytes"]:
+            with open(_file(directory, header, BM25_DELTA_FILE), "rb") as f:
+                delta_text = f.read(header["bm25_delta_bytes"]).decode("utf-8")
+        lexical = bm25.LexicalIndex(arrays, delta_text, delta_count)
+
+    columns = None
+    if header["metadata"]:
+        records = np.zeros(0, dtype=metadata.META_DTYPE)
+        if count:
+            records = np.load(_file(directory, header, META_FILE), mmap_mode="r")
+        if delta_count:
+            delta_records = np.fromfile(_file(directory, header, DELTA_META_FILE),
+                                        dtype=metadata.META_DTYPE, count=delta_count)
+            records = np.concatenate([records, delta_records])
+        if len(records) != count + delta_count:
+            raise ValueError("Metadata columns do not match their header")
+        with open(_file(directory, header, META_EXTENSIONS_FILE), "rb") as f:
+            extensions = _decode_paths(f.read(header["extension_bytes"]), header["extension_count"])
+        with open(_file(directory, header, META_FOLDERS_FILE), "rb") as f:
+            folders = _decode_paths(f.read(header["folder_bytes"]), header["folder_count"])
+        if len(extensions) != header["extension_count"] or len(folders) != header["folder_count"]:
+            raise ValueError("Metadata name tables do not match their header")
+        columns = (records, extensions, folders)
+
+    return SearchIndex(header, paths, vectors, delta_vectors, tombstones,
+                       neighbors, neighbor_patch, ivf_lists, scales, lexical, columns)
+
+
+def _header_stamp(app_files_dir):
+    try:
+        st = os.stat(os.path.join(index_dir(app_files_dir), HEADER_FILE))
+    except FileNotFoundError:
+        return None
+    # header.json is always replaced, never rewritten, so its inode changes too.
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def get_index(app_files_dir):
+    """Process-wide cached index for `app_files_dir`.
+
+    The open index is reused until header.json changes on disk; the new one is
+    loaded completely before it replaces the cached entry, so callers never
+    see a half-loaded index.
+    """
+    stamp = _header_stamp(app_files_dir)
+    cached = _cache.get(app_files_dir)
+    if cached is not None and stamp is not None and cached[0] == stamp:
+        _cache_stats["hits"] += 1
+        return cached[1]
+
+    with _cache_lock:
+        stamp = _header_stamp(app_files_dir)
+        cached = _cache.get(app_files_dir)
+        if cached is not None and stamp is not None and cached[0] == stamp:
+            _cache_stats["hits"] += 1
+            return cached[1]
+
+        with metrics.span("index.load"):
+            index = load_index(app_files_dir)
+        if index is None:
+            _cache.pop(app_files_dir, None)
+            return None
+
+        if stamp is None:
+            stamp = _header_stamp(app_files_dir)  # Created by the legacy migration
+        _cache[app_files_dir] = (stamp, index)
+        _cache_stats["reloads"] += 1
+        return index
+
+
+def invalidate_cache(app_files_dir=None):
+    with _cache_lock:
+        if app_files_dir is None:
+            _cache.clear()
+        else:
+            _cache.pop(app_files_dir, None)
+
+
+def cache_info():
+    """Generation, size and memory footprint of every cached index."""
+    entries = []
+    for app_files_dir, (_, index) in list(_cache.items()):
+        entries.append({
+            "app_files_dir": app_files_dir,
+            "generation": index.generation,
+            "count": len(index),
+            "memory": index.memory_footprint(),
+        })
+    return {"entries": entries, "hits": _cache_stats["hits"], "reloads": _cache_stats["reloads"]}
+
+
+def _append_names(directory, header, table, name, names):
+    """Append the names added to a metadata name table since `header` was written."""
+    added = names[header[f"{table}_count"]:]
+    if added:
+        data = _encode_paths(added)
+        _append_file(_file(directory, header, name), header[f"{table}_bytes"], data)
+        header[f"{table}_count"] += len(added)
+        header[f"{table}_bytes"] += len(data)
+
+
+def _needs_merge(header):
+    delta_count = header["delta_count"]
+    return delta_count > max(DELTA_MERGE_MIN_ROWS, DELTA_MERGE_RATIO * header["count"])
+
+
+def _update(app_files_dir, remove, add_paths=(), add_vectors=None, add_term_counts=None):
+    """Tombstone the live rows of `remove`, then append `add_paths` to the delta segment.
+
+    `add_term_counts` ({term: tf} per path) feeds the keyword index, if the
+    index has one; rows added without them have no keyword postings.
+    """
+    directory = index_dir(app_files_dir)
+
+    with _write_lock:
+        index = get_index(app_files_dir)
+        if index is None or not len(index):
+            if not add_paths:
+                return 0
+            lexical = bm25.PostingsBuilder().pack() if add_term_counts is not None else None
+            save_index(app_files_dir, [], np.empty((0, add_vectors.shape[1]), dtype=np.float32),
+                       lexical=lexical)
+            index = get_index(app_files_dir)
+
+        header = dict(index.header)
+
+        dead = sorted({index.position(path) for path in remove} - {None})
+        if dead:
+            _append_file(_file(directory, header, TOMBSTONES_FILE),
+                         header["tombstone_count"] * 8,
+                         np.asarray(dead, dtype=np.int64).tobytes())
+            header["tombstone_count"] += len(dead)
+
+        if add_paths:
+            add_vectors = np.ascontiguousarray(add_vectors, dtype=np.float32)
+            if add_vectors.shape != (len(add_paths), header["dim"]):
+                raise ValueError(f"Expected {len(add_paths)} vectors of dim {header['dim']}")
+
+            path_bytes = _encode_paths(add_paths)
+            _append_file(_file(directory, header, DELTA_VECTORS_FILE),
+                         header["delta_count"] * header["dim"] * 4,
+                         add_vectors.tobytes())
+            _append_file(_file(directory, header, DELTA_PATHS_FILE),
+                         header["delta_paths_bytes"], path_bytes)
+            if header["bm25"]:
+                counts = add_term_counts or [{}] * len(add_paths)
+                term_bytes = "".join(bm25.encode_counts(c) for c in counts).encode("utf-8")
+                _append_file(_file(directory, header, BM25_DELTA_FILE),
+                             header["bm25_delta_bytes"], term_bytes)
+                header["bm25_delta_bytes"] += len(term_bytes)
+            if header["metadata"]:
+                _, extensions, folders = index.metadata()
+                extensions, folders = list(extensions), list(folders)
+                records = metadata.encode(add_paths, add_vectors, extensions, folders)
+                _append_file(_file(directory, header, DELTA_META_FILE),
+                             header["delta_count"] * metadata.META_DTYPE.itemsize, records.tobytes())
+                _append_names(directory, header, "extension", META_EXTENSIONS_FILE, extensions)
+                _append_names(directory, header, "folder", META_FOLDERS_FILE, folders)
+            header["delta_count"] += len(add_paths)
+            header["delta_paths_bytes"] += len(path_bytes)
+
+        if dead or add_paths:
+            _write_header(directory, header)
+
+        if _needs_merge(header):
+            _start_background_merge(app_files_dir)
+
+        return len(dead)
+
+
+def save_neighbor_patch(app_files_dir, patch, neighbor_rows):
+    """Replace the table overrides with `patch` ({row: (ids, scores)}).
+
+    `neighbor_rows` is the number of rows the patched table now covers.
+    """
+    directory = index_dir(app_files_dir)
+
+    with _write_lock:
+        previous = _read_header(directory)
+        header = dict(previous, files=dict(previous["files"]))
+        if not header["neighbor_k"]:
+            raise ValueError("Search index has no neighbour table to patch")
+
+        rows = np.array(sorted(patch), dtype=np.int64)
+        ids = np.array([patch[row][0] for row in rows], dtype=np.int32).reshape(-1, header["neighbor_k"])
+        scores = np.array([patch[row][1] for row in rows], dtype=np.float16).reshape(-1, header["neighbor_k"])
+
+        header["files"][NEIGHBOR_PATCH_FILE] = _generation_name(NEIGHBOR_PATCH_FILE, _next_generation(directory))
+        _replace_file(_file(directory, header, NEIGHBOR_PATCH_FILE),
+                      lambda f: np.savez(f, rows=rows, ids=ids, scores=scores))
+        header["neighbor_rows"] = int(neighbor_rows)
+        header["neighbor_patch_rows"] = len(rows)
+        _write_header(directory, header)
+        _remove_unreferenced(directory, header, previous)
+
+
+def upsert(app_files_dir, paths, vectors, term_counts=None):
+    """Add or replace the vectors (and keyword term counts) of `paths` without rebuilding the index."""
+    return _update(app_files_dir, paths, paths, vectors, term_counts)
+
+
+def remove(app_files_dir, paths):
+    """Delete `paths` from the index. Returns how many were indexed."""
+    return _update(app_files_dir, paths)
+
+
+def _merged_segment(app_files_dir, index):
+    """Stage the live rows of `index` as a new main segment; (writer, commit kwargs, row count)."""
+    rows = np.arange(len(index)) if index.live is None else np.flatnonzero(index.live)
+    vectors = index.gather(rows)
+    paths = index.live_paths()
+
+    neighbors = None
+    neighbor_rows = None
+    if index.neighbor_k:
+        # Renumber the neighbour table instead of recomputing it. Deleted
+        # neighbours become -1 but keep their score, so each row still
+        # knows the lowest score it has seen.
+        ids, scores = index.neighbor_table()
+        covered = len(ids)
+        keep = np.arange(covered) if index.live is None else np.flatnonzero(index.live[:covered])
+        # One extra slot so that empty (-1) entries map to -1 again.
+        new_rows = np.full(len(index) + 1, -1, dtype=np.int32)
+        if index.live is None:
+            new_rows[:-1] = np.arange(len(index))
+        else:
+            new_rows[np.flatnonzero(index.live)] = np.arange(len(paths))
+        ids = new_rows[ids[keep]]
+        neighbors = (ids, scores[keep])
+        neighbor_rows = len(keep)
+
+    ivf_lists = None
+    if index.ivf is not None:
+        # Keep the centroids and refile every row under them.
+        centroids = index.ivf[0]
+        ivf_lists = (centroids,) + ivf.inverted_lists(ivf.assign(vectors, centroids), len(centroids))
+
+    lexical = None
+    if index.lexical is not None:
+        lexical = bm25.merge(index.lexical, rows)
+
+    columns = None
+    if index.header["metadata"]:
+        records, extensions, folders = index.metadata()
+        columns = (records[rows], extensions, folders)
+
+    writer = IndexWriter(app_files_dir, index.dim, index.header["vector_dtype"], metadata=columns is None)
+    try:
+        writer.append(paths, vectors)
+    except Exception:
+        writer.abort()
+        raise
+    commit_args = {"neighbors": neighbors, "neighbor_rows": neighbor_rows, "ivf_lists": ivf_lists,
+                   "lexical": lexical, "columns": columns}
+    return writer, commit_args, len(paths)
+
+
+def _changes_since(snapshot, current):
+    """(removed paths, added rows) of `current` since `snapshot`, which shares its main segment."""
+    live_before = np.ones(len(snapshot), dtype=bool) if snapshot.live is None else snapshot.live
+    live_now = np.ones(len(snapshot), dtype=bool) if current.live is None else current.live[:len(snapshot)]
+    added = [row for row in range(len(snapshot), len(current)) if current.is_live(row)]
+    return [snapshot.paths[row] for row in np.flatnonzero(live_before & ~live_now)], added
+
+
+def merge_delta(app_files_dir):
+    """Fold the delta segment and tombstones into a new main segment.
+
+    The segment is built from a snapshot without holding the write lock, so
+    updates carry on meanwhile; rows added or removed since the snapshot are
+    replayed onto the merged segment when it is published. A merge overtaken
+    by a full rebuild is dropped and retried on the new index.
+    """
+    for _ in range(MERGE_RETRIES):
+        with _write_lock:
+            index = get_index(app_files_dir)
+            if index is None or not (index.header["delta_count"] or index.header["tombstone_count"]):
+                return False
+
+        writer, commit_args, count = _merged_segment(app_files_dir, index)
+
+        with _write_lock:
+            current = get_index(app_files_dir)
+            main_segment = index.header["files"].get(VECTORS_FILE)
+            if current is None or current.header["files"].get(VECTORS_FILE) != main_segment:
+                writer.abort()
+                continue
+
+            removed, added = _changes_since(index, current)
+            try:
+                writer.commit(**commit_args)
+            except Exception:
+                writer.abort()
+                raise
+            if removed or added:
+                counts = current.lexical.delta_counts(added) if current.lexical is not None else None
+                _update(app_files_dir, removed, [current.paths[row] for row in added],
+                        current.gather(np.asarray(added, dtype=np.int64)), counts)
+            log.info("Merged delta segment, index now holds %d vectors.", count + len(added) - len(removed))
+            return True
+
+    log.info("Index kept changing, delta merge postponed.")
+    return False
+
+
+def _merge_in_background(app_files_dir):
+    try:
+        merge_delta(app_files_dir)
+    except Exception as e:
+        log.error("Index Merge Error: %s", e)
+    finally:
+        with _write_lock:
+            _merging.discard(app_files_dir)
+
+
+def _start_background_merge(app_files_dir):
+    with _write_lock:
+        if app_files_dir in _merging:
+            return
+        _merging.add(app_files_dir)
+
+    threading.Thread(target=_merge_in_background, args=(app_files_dir,), daemon=True).start()
@@ -0,0 +1,104 @@
+import numpy as np
+import metrics
+import scoring
+
+# Approximate search: every document is filed under its nearest centroid
+# (one of the classifier's topic vectors, or a k-means sub-cluster of one),
+# and a query only scores the documents filed under its `nprobe` best
+# centroids. Rows in the delta segment are always scored.
+
+NPROBE = 3
+KMEANS_ITERATIONS = 10
+
+
+def _kmeans(vectors, clusters, seed=0):
+    """Spherical k-means; returns unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = np.array(vectors[rng.choice(len(vectors), clusters, replace=False)], dtype=np.float32)
+
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(clusters):
+            members = vectors[assignment == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.where(norms > 0, norms, 1)
+
+    return centroids
+
+
+def assign(vectors, centroids):
+    """Nearest centroid of every row."""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    block_rows = scoring.SCORE_BLOCK_ROWS
+    for start in range(0, len(vectors), block_rows):
+        block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+def inverted_lists(assignment, list_count):
+    """(offsets, rows): rows of list i are rows[offsets[i]:offsets[i + 1]]."""
+    rows = np.argsort(assignment, kind="stable").astype(np.int32)
+    offsets = np.zeros(list_count + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(assignment, minlength=list_count))
+    return offsets, rows
+
+
+def build(vectors, topic_vectors, subclusters=0):
+    """Centroids and inverted lists for `vectors`.
+
+    With `subclusters`, each topic's documents are split further by k-means
+    so that lists stay short on large corpora.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = np.asarray(topic_vectors, dtype=np.float32)
+    assignment = assign(vectors, centroids)
+
+    if subclusters > 1:
+        refined = []
+        for topic in range(len(centroids)):
+            members = vectors[assignment == topic]
+            if len(members) > subclusters:
+                refined.append(_kmeans(members, subclusters, seed=topic))
+            elif len(members):
+                refined.append(centroids[topic:topic + 1])
+        centroids = np.concatenate(refined) if refined else centroids
+        assignment = assign(vectors, centroids)
+
+    offsets, rows = inverted_lists(assignment, len(centroids))
+    return centroids, offsets, rows
+
+
+def candidate_rows(index, query_vec, nprobe):
+    """Sorted rows worth scoring for `query_vec`, or None without IVF lists."""
+    if index.ivf is None:
+        return None
+
+    centroids, offsets, rows = index.ivf
+    nprobe = min(nprobe, len(centroids))
+    probed = np.argpartition(-(centroids @ np.asarray(query_vec, dtype=np.float32)), nprobe - 1)[:nprobe]
+
+    parts = [rows[offsets[c]:offsets[c + 1]] for c in probed]
+    main_count = len(index.main_vectors)
+    parts.append(np.arange(main_count, len(index), dtype=np.int32))
+
+    candidates = np.sort(np.concatenate(parts))
+    if index.live is not None:
+        candidates = candidates[index.live[candidates]]
+    return candidates
+
+
+def search(index, query_vec, top_k, threshold, nprobe=NPROBE, exclude_row=None):
+    """Approximate top-k rows; None if the index has no IVF lists."""
+    candidates = candidate_rows(index, query_vec, nprobe)
+    if candidates is None:
+        return None
+    if exclude_row is not None:
+        candidates = candidates[candidates != exclude_row]
+
+    with metrics.span("score"):
+        scores = scoring.score_vectors(index.gather(candidates), query_vec)
+    return candidates[scoring.top_k_rows(scores, top_k, threshold)]
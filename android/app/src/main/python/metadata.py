@@ -0,0 +1,136 @@
+import os
+import numpy as np
+import classifier
+import metrics
+
+# Per-document metadata columns for filtered search.
+#
+# Every row of the index carries one META_DTYPE record: its classifier topic,
+# the code of its file extension, the id of its folder and its modification
+# time. Extension codes and folder ids index name tables kept next to the
+# columns (in their own index files), so a record is 16 bytes whatever the path.
+#
+# Filters are a dict of predicates, all of which must hold:
+#
+#   {"topics": [3, 7], "extensions": [".pdf", ".docx"], "folder": "/storage/Work",
+#    "modified_after": 1700000000, "modified_before": 1710000000}
+#
+# filter_rows() turns them into the sorted live rows that match, evaluated on
+# the columns and name tables alone; search then scores only those rows.
+
+META_DTYPE = np.dtype([("topic", "<i2"), ("extension", "<i2"), ("folder", "<i4"), ("mtime", "<i8")])
+
+FILTER_KEYS = ("topics", "extensions", "folder", "modified_after", "modified_before")
+
+
+def extension_of(path):
+    return os.path.splitext(path)[1].lower()
+
+
+def folder_of(path):
+    return os.path.dirname(path)
+
+
+def file_mtime(path):
+    """Modification time of `path` in whole seconds, or 0 if it cannot be read."""
+    try:
+        return int(os.stat(path).st_mtime)
+    except OSError:
+        return 0
+
+
+def topics_of(vectors):
+    """Best classifier topic of each row of `vectors`, or -1 without a loaded model."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    topics = np.full(len(vectors), -1, dtype=np.int16)
+    if classifier._topic_vectors is None or not len(vectors):
+        return topics
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = (vectors @ classifier._topic_vectors.T) / classifier._topic_norms
+    known = np.abs(vectors).sum(axis=1) > 0
+    topics[known] = np.argmax(scores[known], axis=1)
+    return topics
+
+
+def _codes(names, table):
+    """Position of each name in `table`, appending names it does not hold yet."""
+    positions = {name: i for i, name in enumerate(table)}
+    codes = []
+    for name in names:
+        code = positions.get(name)
+        if code is None:
+            code = positions[name] = len(table)
+            table.append(name)
+        codes.append(code)
+    return codes
+
+
+def encode(paths, vectors, extensions, folders):
+    """META_DTYPE records for `paths` and their vectors.
+
+    `extensions` and `folders` are the name tables; names not in them yet are
+    appended in place.
+    """
+    records = np.zeros(len(paths), dtype=META_DTYPE)
+    records["topic"] = topics_of(vectors)
+    records["extension"] = _codes([extension_of(p) for p in paths], extensions)
+    records["folder"] = _codes([folder_of(p) for p in paths], folders)
+    records["mtime"] = [file_mtime(p) for p in paths]
+    return records
+
+
+def _dotted(extension):
+    return extension if not extension or extension.startswith(".") else "." + extension
+
+
+def _matching(table, wanted):
+    return np.array([i for i, name in enumerate(table) if name in wanted], dtype=np.int64)
+
+
+def _under(table, prefix):
+    """Ids of the folders at or below `prefix`."""
+    prefix = prefix.rstrip("/")
+    return np.array([i for i, name in enumerate(table)
+                     if name == prefix or name.startswith(prefix + "/")], dtype=np.int64)
+
+
+def filter_mask(records, extensions, folders, filters):
+    """Boolean mask of the records that satisfy every predicate in `filters`."""
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown search filters: {sorted(unknown)}")
+
+    mask = np.ones(len(records), dtype=bool)
+    if filters.get("topics") is not None:
+        mask &= np.isin(records["topic"], np.asarray(filters["topics"], dtype=np.int64))
+    if filters.get("extensions") is not None:
+        wanted = {_dotted(e.lower()) for e in filters["extensions"]}
+        mask &= np.isin(records["extension"], _matching(extensions, wanted))
+    if filters.get("folder"):
+        mask &= np.isin(records["folder"], _under(folders, filters["folder"]))
+    if filters.get("modified_after") is not None:
+        mask &= records["mtime"] >= filters["modified_after"]
+    if filters.get("modified_before") is not None:
+        mask &= records["mtime"] < filters["modified_before"]
+    return mask
+
+
+def filter_rows(index, filters):
+    """Sorted live rows of `index` matching `filters`, or None when there are no filters."""
+    if not filters:
+        return None
+    with metrics.span("filter"):
+        records, extensions, folders = index.metadata()
+        mask = filter_mask(records, extensions, folders, filters)
+        if index.live is not None:
+            mask &= index.live
+        return np.flatnonzero(mask)
+
+
+def filter_key(filters):
+    """Hashable form of `filters` for the query cache."""
+    if not filters:
+        return None
+    return tuple(sorted((key, tuple(value) if isinstance(value, (list, tuple)) else value)
+                        for key, value in filters.items()))
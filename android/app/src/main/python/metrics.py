@@ -0,0 +1,172 @@
+import os
+import sys
+import time
+import logging
+import threading
+
+# Timing spans and logging for the hot paths.
+#
+#   with metrics.span("embed"):
+#       ...
+#
+# While disabled (the default) span() hands back one shared no-op context
+# manager, so an instrumented call costs a global lookup and a function call.
+# While enabled each span adds its duration to a per-name histogram of
+# power-of-two microsecond buckets: bucket i counts durations below 2^i us.
+#
+# Log lines go through the "smartfind" logger, printed to stdout as
+# "LEVEL: message" at or above the configured level.
+
+LOGGER_NAME = "smartfind"
+DEFAULT_LOG_LEVEL = "WARNING"
+HISTOGRAM_BUCKETS = 32  # Up to 2^31 us, about 36 minutes
+
+_enabled = os.environ.get("SMARTFIND_METRICS", "") not in ("", "0")
+_lock = threading.Lock()
+_spans = {}
+
+
+class _Histogram:
+    __slots__ = ("count", "total_ns", "min_ns", "max_ns", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, elapsed_ns):
+        self.count += 1
+        self.total_ns += elapsed_ns
+        if self.min_ns is None or elapsed_ns < self.min_ns:
+            self.min_ns = elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        self.buckets[min((elapsed_ns // 1000).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentile_ms(self, q):
+        """Upper bound of the bucket holding the q-th percentile, capped at the slowest span."""
+        target = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return min(2 ** i / 1000, self.max_ns / 1e6)
+        return self.max_ns / 1e6
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total_ns / 1e6,
+            "mean_ms": self.total_ns / 1e6 / self.count if self.count else 0.0,
+            "min_ms": (self.min_ns or 0) / 1e6,
+            "max_ms": self.max_ns / 1e6,
+            "p50_ms": self.percentile_ms(50),
+            "p95_ms": self.percentile_ms(95),
+            "p99_ms": self.percentile_ms(99),
+            # {upper bound in us: count} of the non-empty buckets
+            "buckets": {str(2 ** i): n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+def record(name, elapsed_ns):
+    """Add one `elapsed_ns` duration to span `name`."""
+    with _lock:
+        histogram = _spans.get(name)
+        if histogram is None:
+            histogram = _spans[name] = _Histogram()
+        histogram.add(elapsed_ns)
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter_ns() - self.start)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name):
+    """Context manager timing its block under `name` while metrics are enabled."""
+    if not _enabled:
+        return _NOOP
+    return _Span(name)
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+
+
+def get_metrics():
+    """{"enabled", "log_level", "spans": {name: counts and latency summary}}."""
+    with _lock:
+        spans = {name: histogram.summary() for name, histogram in sorted(_spans.items())}
+    return {
+        "enabled": _enabled,
+        "log_level": logging.getLevelName(logging.getLogger(LOGGER_NAME).level),
+        "spans": spans,
+    }
+
+
+def get_logger(module):
+    return logging.getLogger(f"{LOGGER_NAME}.{module}")
+
+
+def set_log_level(level):
+    """Show log lines at `level` ("DEBUG", "INFO", ... or a logging constant) and above."""
+    if isinstance(level, str):
+        level = level.upper()
+    logging.getLogger(LOGGER_NAME).setLevel(level)
+
+
+def configure(enabled=None, log_level=None):
+    """Switch span recording and/or the log level; returns get_metrics()."""
+    if enabled is not None:
+        set_enabled(enabled)
+    if log_level is not None:
+        set_log_level(log_level)
+    return get_metrics()
+
+
+def _setup_logging():
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(os.environ.get("SMARTFIND_LOG_LEVEL", DEFAULT_LOG_LEVEL).upper())
+
+
+_setup_logging()
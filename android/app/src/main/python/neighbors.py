@@ -0,0 +1,131 @@
+import numpy as np
+import index_store
+import scoring
+
+# Neighbours kept per document. get_similar_files asks for 5; the extra
+# slots absorb deletions before a lookup has to fall back to a full scan.
+NEIGHBOR_K = 10
+
+# Upper bound on the float32 similarity block (rows x index size) computed at once.
+BLOCK_ELEMENTS = 1 << 24
+
+
+def build_table(vectors, k=NEIGHBOR_K):
+    """Top-k neighbour rows and float16 scores for every row of `vectors`.
+
+    Rows tied on score are kept in row order, as a full scan ranks them.
+    """
+    count = len(vectors)
+    ids = np.full((count, k), -1, dtype=np.int32)
+    scores = np.full((count, k), -np.inf, dtype=np.float16)
+
+    width = min(k, count - 1)
+    if width <= 0:
+        return ids, scores
+
+    block_rows = max(1, BLOCK_ELEMENTS // count)
+    for start in range(0, count, block_rows):
+        stop = min(start + block_rows, count)
+        sims = np.asarray(vectors[start:stop], dtype=np.float32) @ np.asarray(vectors).T
+        sims[np.arange(stop - start), np.arange(start, stop)] = -np.inf  # Skip self
+
+        best = np.argpartition(-sims, width - 1, axis=1)[:, :width]
+        best_scores = np.take_along_axis(sims, best, axis=1)
+        order = np.lexsort((best, -best_scores), axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+        # argpartition keeps an arbitrary subset of the rows tied with the
+        # k-th score; pick those rows again with the full-scan tie-break.
+        tied = np.flatnonzero((sims >= best_scores[:, -1:]).sum(axis=1) > width)
+        all_rows = np.arange(count)
+        for i in tied:
+            best[i] = scoring._best(all_rows, sims[i], width)
+            best_scores[i] = sims[i, best[i]]
+
+        ids[start:stop, :width] = best
+        scores[start:stop, :width] = best_scores
+
+    return ids, scores
+
+
+def sync(app_files_dir):
+    """Extend the neighbour table to rows appended since it was last written.
+
+    Each new row costs one pass over the index: its own neighbours are
+    selected from that pass, and it is inserted into the lists of existing
+    rows whose lowest stored score it beats.
+    """
+    with index_store._write_lock:
+        index = index_store.get_index(app_files_dir)
+        if index is None or not index.neighbor_k or index.has_neighbors():
+            return 0
+
+        k = index.neighbor_k
+        ids, scores = index.neighbor_table()
+        covered = len(ids)
+        patch = dict(index.neighbor_patch)
+
+        new_ids = np.full((len(index) - covered, k), -1, dtype=np.int32)
+        new_scores = np.full((len(index) - covered, k), -np.inf, dtype=np.float16)
+        ids = np.concatenate([ids, new_ids])
+        scores = np.concatenate([scores, new_scores])
+
+        for row in range(covered, len(index)):
+            if not index.is_live(row):
+                patch[row] = (ids[row], scores[row])
+                continue
+
+            sims = scoring.score_index(index, index.vector(row))
+            sims[row:] = -np.inf  # Later rows are inserted when their turn comes
+            sims[row] = -np.inf
+
+            own = scoring.top_k_rows(sims, k, -np.inf)
+            ids[row, :len(own)] = own
+            scores[row, :len(own)] = sims[own]
+            patch[row] = (ids[row], scores[row])
+
+            for other in np.flatnonzero(sims[:row] > scores[:row, -1]):
+                merged_ids = np.append(ids[other, :-1], row)
+                merged_scores = np.append(scores[other, :-1], sims[other]).astype(np.float16)
+                order = np.argsort(-merged_scores.astype(np.float32), kind="stable")
+                ids[other] = merged_ids[order]
+                scores[other] = merged_scores[order]
+                patch[int(other)] = (ids[other], scores[other])
+
+        index_store.save_neighbor_patch(app_files_dir, patch, len(index))
+        return len(index) - covered
+
+
+def similar_rows(index, row, top_k, threshold):
+    """Rows most similar to `row` from the precomputed table.
+
+    Candidates are re-scored exactly, so the ranking matches a full scan.
+    Returns None when the table cannot answer on its own, e.g. when too many
+    stored neighbours have since been deleted.
+    """
+    if not index.has_neighbors():
+        return None
+
+    ids, stored_scores = index.neighbor_list(row)
+    candidates = np.sort(np.asarray(ids)[np.asarray(ids) >= 0])
+    if index.live is not None:
+        candidates = candidates[index.live[candidates]]
+
+    exact = scoring.score_vectors(index.gather(candidates), index.vector(row))
+    best = scoring.top_k_rows(exact, top_k, threshold)
+    picked = candidates[best]
+
+    lowest = stored_scores[-1]
+    if lowest == -np.inf:  # The table holds every other row
+        return picked
+
+    # Rows outside the table never score above its lowest stored entry, which
+    # is rounded to float16. A row tied with it could still outrank a pick,
+    # so the table only answers when the picks clear it by the rounding.
+    bound = float(lowest) + float(np.abs(np.spacing(lowest)))
+    if len(picked) >= top_k and exact[best[-1]] > bound:
+        return picked
+    if len(picked) < top_k and bound <= threshold:
+        return picked
+    return None
@@ -0,0 +1,70 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer.
+
+    Writers are preferred: once a writer is waiting, new readers queue
+    behind it, so a steady stream of queries cannot starve a model swap.
+    A thread that already holds the read lock may take it again (nested
+    calls do), which would otherwise deadlock behind a waiting writer.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writers_waiting = 0
+        self._held = threading.local()
+
+    def acquire_read(self):
+        depth = getattr(self._held, "depth", 0)
+        if depth or self._writer == threading.get_ident():
+            self._held.depth = depth + 1
+            return
+        with self._cond:
+            while self._writer is not None or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        self._held.depth = 1
+
+    def release_read(self):
+        self._held.depth -= 1
+        if self._held.depth or self._writer == threading.get_ident():
+            return
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        if getattr(self._held, "depth", 0):
+            raise RuntimeError("Cannot take the write lock while holding the read lock")
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = threading.get_ident()
+
+    def release_write(self):
+        with self._cond:
+            self._writer = None
+            self._cond.notify_all()
+
+    @contextmanager
+    def read_locked(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,163 @@
+import numpy as np
+import metrics
+
+# Rows scored per matrix-vector product; bounds the working copy of each block.
+SCORE_BLOCK_ROWS = 65536
+
+# Queries scored together per matrix product in top_k_rows_many.
+QUERY_BLOCK = 64
+
+# Storage types for vector matrices. int8 rows carry a float32 scale each.
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+
+def quantize(vectors, dtype):
+    """(data, scales) for storing `vectors` as `dtype`; scales is None unless int8."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float32":
+        return np.ascontiguousarray(vectors), None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = (np.abs(vectors).max(axis=1, initial=0) / 127).astype(np.float32)
+        data = np.rint(vectors / np.where(scales > 0, scales, 1)[:, None]).astype(np.int8)
+        return data, scales
+    raise ValueError(f"Unsupported vector dtype: {dtype}")
+
+
+def dequantize(data, scales=None):
+    vectors = np.asarray(data, dtype=np.float32)
+    if scales is not None:
+        vectors = vectors * np.asarray(scales, dtype=np.float32).reshape(-1, 1)
+    return vectors
+
+
+def _picked(start, rows):
+    """Rows of one scoring block: a slice of the matrix, or of the sorted `rows`."""
+    if rows is None:
+        return slice(start, start + SCORE_BLOCK_ROWS)
+    return rows[start:start + SCORE_BLOCK_ROWS]
+
+
+def score_vectors(vectors, query_vec, scales=None, rows=None):
+    """Dot product of every row (or of the sorted `rows` only) with a float32 query.
+
+    Full-precision rows are accumulated in float64. Quantized rows are scored
+    as stored (float16, or int8 times its row scale) against the float32 query.
+    """
+    exact = scales is None and vectors.dtype in (np.float32, np.float64)
+    dtype = np.float64 if exact else np.float32
+
+    query_vec = np.asarray(query_vec, dtype=dtype)
+    count = vectors.shape[0] if rows is None else len(rows)
+    scores = np.empty(count, dtype=dtype)
+    for start in range(0, count, SCORE_BLOCK_ROWS):
+        picked = _picked(start, rows)
+        block = np.asarray(vectors[picked], dtype=dtype)
+        block_scores = block @ query_vec
+        if scales is not None:
+            block_scores *= scales[picked]
+        scores[start:start + len(block)] = block_scores
+    return scores
+
+
+def _segment_rows(index, rows):
+    """(first_row, matrix, scales, local rows or None for all) of each segment of `index`."""
+    for first, vectors, scales in index.segments:
+        if rows is None:
+            yield first, vectors, scales, None
+        else:
+            lo, hi = np.searchsorted(rows, [first, first + vectors.shape[0]])
+            yield first, vectors, scales, rows[lo:hi] - first
+
+
+def score_index(index, query_vec, rows=None):
+    """Scores for every row of `index`, or for the sorted `rows` only; deleted rows score -inf."""
+    with metrics.span("score"):
+        scores = np.asarray(np.concatenate([score_vectors(vectors, query_vec, scales, local)
+                                            for _, vectors, scales, local in _segment_rows(index, rows)]),
+                            dtype=np.float64)
+        if index.live is not None:
+            scores[~(index.live if rows is None else index.live[rows])] = -np.inf
+        return scores
+
+
+def top_k_rows(scores, k, threshold):
+    """Rows scoring above `threshold`, best first, ties in index order.
+
+    Uses argpartition so only the candidates that can make the cut are sorted.
+    """
+    with metrics.span("topk"):
+        candidates = np.flatnonzero(scores > threshold)
+        if k <= 0:
+            return candidates[:0]
+        return candidates[_best(candidates, scores[candidates], k)]
+
+
+def _best(rows, row_scores, k):
+    """Positions of the k best `row_scores`, best first, ties in `rows` order."""
+    positions = np.arange(len(rows))
+    if len(rows) > k:
+        best = np.argpartition(-row_scores, k - 1)[:k]
+        # Keep every row tied with the k-th score so the stable order below
+        # picks the same ones a full sort would.
+        positions = np.flatnonzero(row_scores >= row_scores[best].min())
+
+    order = np.lexsort((rows[positions], -row_scores[positions]))
+    return positions[order[:k]]
+
+
+def _top_k_block(index, queries, k, threshold, rows):
+    """Best k rows per query of one block of queries; one pass over the index."""
+    found = [([], []) for _ in range(len(queries))]
+    for first, vectors, scales, local in _segment_rows(index, rows):
+        exact = scales is None and vectors.dtype in (np.float32, np.float64)
+        dtype = np.float64 if exact else np.float32
+        query_block = np.asarray(queries, dtype=dtype)
+
+        count = vectors.shape[0] if local is None else len(local)
+        for start in range(0, count, SCORE_BLOCK_ROWS):
+            picked = _picked(start, local)
+            block = np.asarray(vectors[picked], dtype=dtype)
+            block_scores = query_block @ block.T
+            if scales is not None:
+                block_scores *= scales[picked]
+            block_scores = np.asarray(block_scores, dtype=np.float64)
+
+            block_rows = first + (np.arange(start, start + len(block)) if local is None else picked)
+            live = None if index.live is None else index.live[block_rows]
+            for (found_rows, found_scores), scores in zip(found, block_scores):
+                keep = scores > threshold
+                if live is not None:
+                    keep &= live
+                candidates = np.flatnonzero(keep)
+                if len(candidates) > k:
+                    candidates = candidates[_best(candidates, scores[candidates], k)]
+                found_rows.append(block_rows[candidates])
+                found_scores.append(scores[candidates])
+
+    results = []
+    for found_rows, found_scores in found:
+        query_rows = np.concatenate(found_rows) if found_rows else np.empty(0, dtype=np.int64)
+        query_scores = np.concatenate(found_scores) if found_scores else np.empty(0, dtype=np.float64)
+        results.append(query_rows[_best(query_rows, query_scores, k)])
+    return results
+
+
+def top_k_rows_many(index, query_matrix, k, threshold, rows=None):
+    """top_k_rows(score_index(index, q), k, threshold) for every row q of `query_matrix`.
+
+    With `rows` (sorted), only those rows of the index are considered.
+
+    Each block of index rows is scored against up to QUERY_BLOCK queries with
+    one matrix product and only every query's best k rows of the block are
+    kept, so the index is read once per query block instead of once per
+    query and no full score vector is held.
+    """
+    with metrics.span("score_many"):
+        if k <= 0:
+            return [np.empty(0, dtype=np.int64) for _ in range(len(query_matrix))]
+        results = []
+        for start in range(0, len(query_matrix), QUERY_BLOCK):
+            results += _top_k_block(index, query_matrix[start:start + QUERY_BLOCK], k, threshold, rows)
+        return results
@@ -1,122 +1,563 @@
 import os
 import json
+import time
+import itertools
+import threading
+from collections import OrderedDict
 import numpy as np
 import re
+from concurrent.futures import ProcessPoolExecutor
+import bm25
 import classifier
-
-
-def train_local_index(app_files_dir, documents_json):
+import embedding_cache
+import index_store
+import ivf
+import metadata
+import metrics
+import neighbors
+import scoring
+
+log = metrics.get_logger("search_engine")
+
+SEARCH_TOP_K = 10
+SEARCH_THRESHOLD = 0.01
+SIMILAR_TOP_K = 5
+SIMILAR_THRESHOLD = 0.1
+
+# Search modes: brute-force cosine over every row, IVF probing (see ivf.py),
+# or cosine fused with BM25 keyword ranking (see bm25.py).
+MODE_EXACT = "exact"
+MODE_IVF = "ivf"
+MODE_HYBRID = "hybrid"
+
+# Reciprocal-rank fusion: each ranking adds 1 / (RRF_K + rank) to a row's
+# score, over its first HYBRID_DEPTH rows.
+RRF_K = 60
+HYBRID_DEPTH = 100
+
+# Ranked results of the most recent queries, keyed on their normalized tokens
+# and the index generation, so repeated queries skip embedding and scoring.
+QUERY_CACHE_SIZE = 256
+
+# Streaming ingestion: documents embedded per task, and the default pool size.
+INGEST_CHUNK_SIZE = 256
+INGEST_WORKERS = min(4, os.cpu_count() or 1)
+
+_query_cache_lock = threading.Lock()
+_query_cache = OrderedDict()
+_query_cache_size = QUERY_CACHE_SIZE
+_query_cache_generations = {}
+_query_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def document_vector(text):
+    """Unit-length embedding of `text`, or None if none of its words are known."""
+    vector = classifier.embed_text(text)
+    if vector is None:
+        return None
+
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return None
+    return vector / norm
+
+
+def _init_embed_worker(models_dir):
+    classifier.load_resources(models_dir)
+
+
+def _embed_chunk(texts):
+    """Embed a list of texts; returns a float32 matrix and a mask of rows that have a vector."""
+    matrix, valid = classifier.embed_texts(texts)
+    for i in np.flatnonzero(valid):
+        # Row by row, so each vector is exactly what document_vector gives
+        norm = np.linalg.norm(matrix[i])
+        if norm == 0:
+            valid[i] = False
+        else:
+            matrix[i] /= norm
+    return matrix, valid
+
+
+def _chunks(documents, chunk_size):
+    documents = iter(documents)
+    while True:
+        chunk = list(itertools.islice(documents, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _embedded_chunks(models_dir, jobs, workers):
+    """Embed the texts of each (tag, texts) job, yielding (tag, _embed_chunk result) in order.
+
+    At most 2 * workers jobs are in flight at once.
+    """
+    jobs = iter(jobs)
+    first = next(jobs, None)
+    if first is None:
+        return
+    second = next(jobs, None)
+
+    pool = None
+    if workers > 1 and second is not None:
+        try:
+            pool = ProcessPoolExecutor(workers, initializer=_init_embed_worker, initargs=(models_dir,))
+        except (NotImplementedError, OSError) as e:
+            log.info("No process pool for ingestion (%s), embedding serially", e)
+
+    jobs = itertools.chain([first], [] if second is None else [second], jobs)
+    if pool is None:
+        for tag, texts in jobs:
+            yield tag, _embed_chunk(texts)
+        return
+
+    with pool:
+        pending = [(tag, pool.submit(_embed_chunk, texts)) for tag, texts in itertools.islice(jobs, workers * 2)]
+        while pending:
+            tag, future = pending.pop(0)
+            result = future.result()
+            job = next(jobs, None)
+            if job is not None:
+                pending.append((job[0], pool.submit(_embed_chunk, job[1])))
+            yield tag, result
+
+
+def _embedded_batches(models_dir, documents, dim, chunk_size, workers, cache, seen):
+    """Embed (path, text) documents chunk by chunk, in order.
+
+    Yields (paths, vectors, term counts, consumed) per chunk, where `consumed`
+    is the number of input documents read up to the end of the chunk,
+    repeats included. Paths already in `seen` are skipped, so repeated paths
+    keep their first text; documents without a vector are dropped.
+    """
+    consumed = 0
+
+    def unique(documents):
+        nonlocal consumed
+        for path, text in documents:
+            consumed += 1
+            if path not in seen:
+                seen.add(path)
+                yield path, text
+
+    def jobs():
+        for chunk in _chunks(unique(documents), chunk_size):
+            keys = [None] * len(chunk)
+            found = [(False, None)] * len(chunk)
+            if cache is not None:
+                keys = [embedding_cache.content_key(text) for _, text in chunk]
+                found = [cache.lookup(key) for key in keys]
+            misses = [text for (_, text), (hit, _) in zip(chunk, found) if not hit]
+            yield (chunk, keys, found, consumed), misses
+
+    for (chunk, keys, found, chunk_consumed), (matrix, valid) in _embedded_chunks(models_dir, jobs(), workers):
+        computed = iter(zip(matrix, valid))
+        paths, vectors, counts = [], [], []
+        for (path, text), key, (hit, vector) in zip(chunk, keys, found):
+            if not hit:
+                vector, ok = next(computed)
+                vector = vector if ok else None
+                if cache is not None:
+                    cache.insert(key, vector)
+            if vector is not None:
+                paths.append(path)
+                vectors.append(vector)
+                counts.append(bm25.term_counts(text))
+        yield paths, np.array(vectors, dtype=np.float32).reshape(len(paths), dim), counts, chunk_consumed
+
+
+def _publish_index(writer, neighbor_k, ivf_subclusters):
+    """Build the neighbour table and IVF lists over the staged rows and commit them."""
+    matrix = writer.staged_vectors()
+    table = neighbors.build_table(matrix, neighbor_k) if neighbor_k else None
+    ivf_lists = ivf.build(matrix, classifier._topic_vectors, ivf_subclusters) if len(matrix) else None
+    writer.commit(table, ivf_lists=ivf_lists)
+
+
+def train_index_from_documents(app_files_dir, documents, chunk_size=INGEST_CHUNK_SIZE, workers=INGEST_WORKERS,
+                               neighbor_k=neighbors.NEIGHBOR_K, ivf_subclusters=0, vector_dtype="float32",
+                               use_cache=True):
+    """Rebuild the index from an iterable of (path, text) pairs.
+
+    Documents are embedded `chunk_size` at a time across `workers` processes
+    and streamed to disk as they come back, so memory is bounded by the
+    chunks in flight rather than the corpus. Repeated paths keep their first
+    text. With `use_cache`, texts already embedded by this model in an
+    earlier build are taken from the embedding cache instead. Keyword
+    postings for hybrid search are built alongside the vectors.
+    """
+    writer = None
     try:
         models_dir = os.path.join(app_files_dir, "models")
         if not classifier.load_resources(models_dir):
-            print("ERROR: Could not load model for search training")
-            return
+            log.error("Could not load model for search training")
+            return {"status": "error"}
+
+        start = time.perf_counter()
+        dim = classifier._word_vectors.shape[1]
+        cache = embedding_cache.open_cache(app_files_dir, classifier._model_version, dim) if use_cache else None
+        seen = set()
+
+        writer = index_store.IndexWriter(app_files_dir, dim, vector_dtype, lexical=True, metadata=True)
+        for paths, vectors, counts, _ in _embedded_batches(models_dir, documents, dim, chunk_size, workers,
+                                                           cache, seen):
+            writer.append(paths, vectors, counts)
+        total = len(seen)
+
+        _publish_index(writer, neighbor_k, ivf_subclusters)
+        if cache is not None:
+            cache.save()
+
+        seconds = time.perf_counter() - start
+        log.info("Saved search index with %d of %d files in %.1fs", writer.count, total, seconds)
+        result = {
+            "status": "ok",
+            "documents": total,
+            "indexed": writer.count,
+            "seconds": seconds,
+            "docs_per_sec": total / seconds if seconds > 0 else 0.0,
+        }
+        if cache is not None:
+            result.update(cache.stats())
+        return result
 
-        docs = json.loads(documents_json)
-        index_data = []
+    except Exception as e:
+        log.error("Search Training Error: %s", e)
+        if writer is not None:
+            writer.abort()
+        return {"status": "error"}
 
-        print(f"DEBUG: Indexing {len(docs)} files for search...")
 
-        for path, text in docs.items():
-            tokens = classifier.simple_preprocess(text)
-            vector = classifier.infer_vector_manual(tokens)
+def _read_jsonl(jsonl_path):
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                doc = json.loads(line)
+                yield doc["path"], doc["text"]
 
-            if vector is not None:
-                norm = np.linalg.norm(vector)
-                if norm > 0:
-                    vector = vector / norm
-                    index_data.append({
-                        "path": path,
-                        "vector": vector.tolist()
-                    })
 
-        index_path = os.path.join(app_files_dir, "search_index.json")
-        with open(index_path, "w") as f:
-            json.dump(index_data, f)
+def train_index_from_jsonl(app_files_dir, jsonl_path, **kwargs):
+    """train_index_from_documents over a file of {"path": ..., "text": ...} lines."""
+    return train_index_from_documents(app_files_dir, _read_jsonl(jsonl_path), **kwargs)
 
-        print(f"DEBUG: Saved search index with {len(index_data)} vectors.")
 
+def train_local_index(app_files_dir, documents_json, neighbor_k=neighbors.NEIGHBOR_K, ivf_subclusters=0,
+                      vector_dtype="float32"):
+    try:
+        docs = json.loads(documents_json)
     except Exception as e:
-        print(f"Search Training Error: {e}")
+        log.error("Search Training Error: %s", e)
+        return {"status": "error"}
+
+    log.info("Indexing %d files for search...", len(docs))
+    return train_index_from_documents(app_files_dir, docs.items(), neighbor_k=neighbor_k,
+                                      ivf_subclusters=ivf_subclusters, vector_dtype=vector_dtype)
+
+
+def _query_vector(query):
+    """Unit-length embedding of `query`, or None if none of its words are known."""
+    query_vec = classifier.embed_text(query)
+
+    if query_vec is None:
+        return None
+
+    query_norm = np.linalg.norm(query_vec)
+    if query_norm == 0: return None
+    return query_vec / query_norm
+
+
+def _fuse_rankings(rankings, top_k):
+    """Rows of several best-first rankings, ordered by reciprocal-rank fusion."""
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank)
+    return sorted(fused, key=lambda row: (-fused[row], row))[:top_k]
 
 
-def search_documents(app_files_dir, query):
+def _ranked_rows(index, query_vec, top_k, threshold, rows=None):
+    """Best `top_k` rows by cosine, of the whole index or of the sorted `rows` only."""
+    scores = scoring.score_index(index, query_vec, rows)
+    best = scoring.top_k_rows(scores, top_k, threshold)
+    return best if rows is None else rows[best]
+
+
+def _hybrid_rows(index, query, top_k, threshold, rows=None):
+    """Cosine and BM25 rankings of `query` fused; either may be empty on its own."""
+    depth = max(top_k, HYBRID_DEPTH)
+    rankings = [bm25.search(index, query, depth, rows).tolist()]
+
+    query_vec = _query_vector(query)
+    if query_vec is not None:
+        rankings.insert(0, _ranked_rows(index, query_vec, depth, threshold, rows).tolist())
+
+    return _fuse_rankings(rankings, top_k)
+
+
+def _query_key(app_files_dir, index, query, top_k, threshold, mode, nprobe, filters=None):
+    """Cache key: everything the ranked results of `query` depend on."""
+    tokens = tuple(classifier.simple_preprocess(query or ""))
+    if mode == MODE_HYBRID:
+        tokens = (tokens, tuple(bm25.tokenize(query or "")))
+    if mode != MODE_IVF:
+        nprobe = None
+    return (app_files_dir, classifier._model_version, index.generation, mode, tokens, top_k, threshold, nprobe,
+            metadata.filter_key(filters))
+
+
+def _cached_results(key):
+    with _query_cache_lock:
+        app_files_dir, generation = key[0], key[2]
+        if _query_cache_generations.get(app_files_dir) != generation:
+            # The index changed: nothing cached for its older generations can be hit again.
+            for old in [k for k in _query_cache if k[0] == app_files_dir]:
+                del _query_cache[old]
+            _query_cache_generations[app_files_dir] = generation
+
+        results = _query_cache.get(key)
+        if results is None:
+            _query_cache_stats["misses"] += 1
+            return None
+        _query_cache.move_to_end(key)
+        _query_cache_stats["hits"] += 1
+        return list(results)
+
+
+def _store_results(key, results):
+    with _query_cache_lock:
+        if _query_cache_size <= 0 or _query_cache_generations.get(key[0]) != key[2]:
+            return
+        _query_cache[key] = tuple(results)
+        _query_cache.move_to_end(key)
+        while len(_query_cache) > _query_cache_size:
+            _query_cache.popitem(last=False)
+            _query_cache_stats["evictions"] += 1
+
+
+def set_query_cache_size(size):
+    """Keep at most `size` queries' results (0 disables the cache)."""
+    global _query_cache_size
+    with _query_cache_lock:
+        _query_cache_size = max(0, int(size))
+        while len(_query_cache) > _query_cache_size:
+            _query_cache.popitem(last=False)
+            _query_cache_stats["evictions"] += 1
+
+
+def clear_query_cache():
+    with _query_cache_lock:
+        _query_cache.clear()
+        _query_cache_generations.clear()
+
+
+def query_cache_info():
+    """Size and hit/miss counters of the query result cache."""
+    with _query_cache_lock:
+        lookups = _query_cache_stats["hits"] + _query_cache_stats["misses"]
+        return {
+            "entries": len(_query_cache),
+            "max_entries": _query_cache_size,
+            "hits": _query_cache_stats["hits"],
+            "misses": _query_cache_stats["misses"],
+            "hit_rate": _query_cache_stats["hits"] / lookups if lookups else 0.0,
+            "evictions": _query_cache_stats["evictions"],
+        }
+
+
+def _search_rows(index, query, top_k, threshold, mode, nprobe, rows=None):
+    """Best rows for `query`; with `rows` (a filter's matches) only those are scored."""
+    if mode == MODE_HYBRID:
+        return _hybrid_rows(index, query, top_k, threshold, rows)
+
+    query_vec = _query_vector(query)
+    if query_vec is None:
+        return []
+
+    best = None
+    if mode == MODE_IVF and rows is None:
+        best = ivf.search(index, query_vec, top_k, threshold, nprobe)
+    if best is None:
+        best = _ranked_rows(index, query_vec, top_k, threshold, rows)
+    return best
+
+
+def search_documents(app_files_dir, query, top_k=SEARCH_TOP_K, threshold=SEARCH_THRESHOLD,
+                     mode=MODE_EXACT, nprobe=ivf.NPROBE, filters=None):
+    """Paths best matching `query`: {"results": [...]}.
+
+    `filters` (see metadata.py) restricts the search to documents by topic,
+    extension, folder or modification time; only matching rows are scored.
+    """
     try:
         models_dir = os.path.join(app_files_dir, "models")
         if not classifier.load_resources(models_dir):
             return {"results": []}
 
-        index_path = os.path.join(app_files_dir, "search_index.json")
-        if not os.path.exists(index_path):
+        index = index_store.get_index(app_files_dir)
+        if index is None:
             return {"results": []}
 
-        with open(index_path, "r") as f:
-            index_data = json.load(f)
+        key = _query_key(app_files_dir, index, query, top_k, threshold, mode, nprobe, filters)
+        results = _cached_results(key)
+        if results is None:
+            with metrics.span("search"):
+                rows = _search_rows(index, query, top_k, threshold, mode, nprobe,
+                                    metadata.filter_rows(index, filters))
+            results = [index.paths[row] for row in rows]
+            _store_results(key, results)
+
+        return {"results": results}
+
+    except Exception as e:
+        log.error("Search Error: %s", e)
+        return {"results": []}
+
 
-        query_tokens = classifier.simple_preprocess(query)
-        query_vec = classifier.infer_vector_manual(query_tokens)
+def _search_rows_many(index, queries, top_k, threshold, mode, nprobe, rows=None):
+    if mode == MODE_IVF and rows is None:
+        return [_search_rows(index, query, top_k, threshold, mode, nprobe) for query in queries]
 
-        if query_vec is None:
+    depth = max(top_k, HYBRID_DEPTH) if mode == MODE_HYBRID else top_k
+    matrix, valid = _embed_chunk(queries)
+    rankings = [[] for _ in queries]
+    embedded = np.flatnonzero(valid)
+    if len(embedded):
+        for i, best in zip(embedded, scoring.top_k_rows_many(index, matrix[embedded], depth, threshold, rows)):
+            rankings[i] = best.tolist()
+
+    if mode != MODE_HYBRID:
+        return rankings
+    return [_fuse_rankings([ranking, bm25.search(index, query, depth, rows).tolist()], top_k)
+            for query, ranking in zip(queries, rankings)]
+
+
+def search_many(app_files_dir, queries, top_k=SEARCH_TOP_K, threshold=SEARCH_THRESHOLD,
+                mode=MODE_EXACT, nprobe=ivf.NPROBE, filters=None):
+    """search_documents for a list of queries, scored against the index together.
+
+    The queries are embedded as one matrix and scored in blocked matrix
+    products (see scoring.top_k_rows_many), so Q queries cost far less than Q
+    scans. `filters` applies to every query. Returns {"results": [paths of
+    each query, in order]}.
+    """
+    try:
+        models_dir = os.path.join(app_files_dir, "models")
+        if not classifier.load_resources(models_dir):
+            return {"results": [[] for _ in queries]}
+
+        index = index_store.get_index(app_files_dir)
+        if index is None:
+            return {"results": [[] for _ in queries]}
+
+        keys = [_query_key(app_files_dir, index, query, top_k, threshold, mode, nprobe, filters)
+                for query in queries]
+        results = [_cached_results(key) for key in keys]
+        pending = [i for i, cached in enumerate(results) if cached is None]
+        if pending:
+            with metrics.span("search_many"):
+                rows = _search_rows_many(index, [queries[i] for i in pending], top_k, threshold, mode, nprobe,
+                                         metadata.filter_rows(index, filters))
+            for i, query_rows in zip(pending, rows):
+                results[i] = [index.paths[row] for row in query_rows]
+                _store_results(keys[i], results[i])
+
+        return {"results": results}
+
+    except Exception as e:
+        log.error("Search Error: %s", e)
+        return {"results": [[] for _ in queries]}
+
+
+def get_similar_files(app_files_dir, file_path, top_k=SIMILAR_TOP_K, threshold=SIMILAR_THRESHOLD,
+                      mode=MODE_EXACT, nprobe=ivf.NPROBE):
+    try:
+        models_dir = os.path.join(app_files_dir, "models")
+        if not classifier.load_resources(models_dir):
             return {"results": []}
 
-        query_norm = np.linalg.norm(query_vec)
-        if query_norm == 0: return {"results": []}
-        query_vec = query_vec / query_norm
+        index = index_store.get_index(app_files_dir)
+        if index is None:
+            return {"results": []}
 
-        results = []
-        for item in index_data:
-            doc_vec = np.array(item['vector'])
-            score = np.dot(query_vec, doc_vec)
+        target_row = index.position(file_path)
+        if target_row is None:
+            log.debug("File not found in index: %s", file_path)
+            return {"results": []}
 
-            # Threshold for search results
-            if score > 0.01:
-                results.append((item['path'], score))
+        rows = neighbors.similar_rows(index, target_row, top_k, threshold)
+        if rows is None and mode == MODE_IVF:
+            rows = ivf.search(index, index.vector(target_row), top_k, threshold, nprobe,
+                              exclude_row=target_row)
+        if rows is None:
+            scores = scoring.score_index(index, index.vector(target_row))
+            scores[target_row] = -np.inf  # Skip self
+            rows = scoring.top_k_rows(scores, top_k, threshold)
 
-        results.sort(key=lambda x: x[1], reverse=True)
+        top_results = [index.paths[row] for row in rows]
+        log.debug("Semantic recommendations for %s: %s", file_path, top_results)
 
-        return {"results": [r[0] for r in results[:10]]}
+        return {"results": top_results}
 
     except Exception as e:
-        print(f"Search Error: {e}")
+        log.error("Similarity Error: %s", e)
         return {"results": []}
 
 
-def get_similar_files(app_files_dir, file_path):
+def update_index(app_files_dir, file_path, content):
+    """Re-embed one file and swap it into the index in place of its old vector."""
     try:
-        index_path = os.path.join(app_files_dir, "search_index.json")
-        if not os.path.exists(index_path):
-            return {"results": []}
+        models_dir = os.path.join(app_files_dir, "models")
+        if not classifier.load_resources(models_dir):
+            return {"status": "error"}
 
-        with open(index_path, "r") as f:
-            index_data = json.load(f)
+        vector = document_vector(content or "")
+        if vector is None:
+            removed = index_store.remove(app_files_dir, [file_path])
+            return {"status": "removed" if removed else "skipped"}
 
-        target_vec = None
-        for item in index_data:
-            if item['path'] == file_path:
-                target_vec = np.array(item['vector'])
-                break
+        index_store.upsert(app_files_dir, [file_path], vector.reshape(1, -1), [bm25.term_counts(content)])
+        neighbors.sync(app_files_dir)
+        return {"status": "indexed"}
 
-        if target_vec is None:
-            print(f"DEBUG: File not found in index: {file_path}")
-            return {"results": []}
+    except Exception as e:
+        log.error("Index Update Error: %s", e)
+        return {"status": "error"}
 
-        results = []
-        for item in index_data:
-            if item['path'] == file_path: continue  # Skip self
 
-            doc_vec = np.array(item['vector'])
-            score = np.dot(target_vec, doc_vec)
+def add_to_index(app_files_dir, file_path, content):
+    return update_index(app_files_dir, file_path, content)
 
-            if score > 0.1:
-                results.append((item['path'], score))
 
-        results.sort(key=lambda x: x[1], reverse=True)
+def remove_from_index(app_files_dir, file_path):
+    try:
+        removed = index_store.remove(app_files_dir, [file_path])
+        return {"status": "removed" if removed else "skipped"}
 
-        top_results = [r[0] for r in results[:5]]
-        print(f"DEBUG: Semantic recommendations for {file_path}: {top_results}")
+    except Exception as e:
+        log.error("Index Update Error: %s", e)
+        return {"status": "error"}
 
-        return {"results": top_results}
+
+def get_indexed_paths(app_files_dir):
+    try:
+        index = index_store.get_index(app_files_dir)
+        if index is None:
+            return {"paths": []}
+        return {"paths": index.live_paths()}
 
     except Exception as e:
-        print(f"Similarity Error: {e}")
-        return {"results": []}
+        log.error("Index Read Error: %s", e)
+        return {"paths": []}
+
+
+def get_cache_info(app_files_dir):
+    """Memory held by the cached index and model, for the Kotlin side to poll."""
+    try:
+        index_store.get_index(app_files_dir)
+        return {"index": index_store.cache_info(), "model": classifier.resource_info(),
+                "queries": query_cache_info()}
+
+    except Exception as e:
+        log.error("Cache Info Error: %s", e)
+        return {"index": {}, "model": {}, "queries": {}}
@@ -1,7 +1,44 @@
+import os
 import re
+import hashlib
 import numpy as np
-import networkx as nx
-from gensim.utils import simple_preprocess
+from scipy import sparse
+from concurrent.futures import ProcessPoolExecutor
+import blob_cache
+import metrics
+
+log = metrics.get_logger("summarizer")
+
+# Tokens as gensim.utils.simple_preprocess finds them: runs of letters (no
+# digits) in lowercased text, 2 to 15 long, not starting with an underscore.
+TOKEN_PATTERN = re.compile(r'(?:(?!\d)\w)+')
+
+STOPWORDS = {
+    'the', 'and', 'of', 'to', 'a', 'in', 'is', 'that', 'for', 'it', 'on',
+    'with', 'as', 'are', 'was', 'this', 'by', 'be', 'at', 'or', 'from',
+    'an', 'not', 'but', 'can', 'if', 'we', 'has', 'have', 'which', 'their',
+    'will', 'its', 'about', 'would', 'there', 'so', 'what', 'who', 'when',
+    'they', 'he', 'she', 'his', 'her', 'been', 'had', 'were', 'one', 'all',
+    'you', 'your', 'my', 'our', 'me', 'us', 'him', 'them'
+}
+
+# PageRank settings, as in networkx.pagerank.
+PAGERANK_ALPHA = 0.85
+PAGERANK_MAX_ITER = 100
+PAGERANK_TOL = 1.0e-6
+
+# Batch summaries rank at most this many pre-selected sentences per document.
+MAX_CANDIDATES = 200
+SUMMARY_WORKERS = min(4, os.cpu_count() or 1)
+
+# Summaries are cached under <cache_dir>/summary_cache, keyed by content hash and settings.
+SUMMARY_CACHE_DIR = "summary_cache"
+SUMMARY_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+
+def simple_preprocess(text, min_len=2, max_len=15):
+    return [t for t in TOKEN_PATTERN.findall(text.lower())
+            if min_len <= len(t) <= max_len and not t.startswith('_')]
 
 
 def cosine_similarity(v1, v2):
@@ -34,66 +71,200 @@ def sentence_similarity(sent1, sent2, stopwords=None):
     return 1 - cosine_similarity(vector1, vector2)
 
 
-def summarize_file(text, max_sentences=5):
-    try:
-        if not text or len(text.strip()) < 50:
-            return {"summary": text[:500]}
+def _incidence(sentence_tokens, stopwords):
+    """Sparse sentence-by-term matrix of each sentence's distinct non-stopword tokens."""
+    n = len(sentence_tokens)
+    term_ids = {}
+    rows, cols = [], []
+    for i, tokens in enumerate(sentence_tokens):
+        for term in set(t for t in tokens if t not in stopwords):
+            rows.append(i)
+            cols.append(term_ids.setdefault(term, len(term_ids)))
+
+    incidence = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, max(1, len(term_ids))))
+    sizes = np.bincount(np.array(rows, dtype=np.intp), minlength=n)
+    return incidence, sizes
+
+
+def candidate_sentences(sentence_tokens, stopwords, max_candidates):
+    """Indices, in document order, of the `max_candidates` sentences most worth ranking.
+
+    A sentence's score is the number of other sentences sharing each of its
+    words (its row sum in S @ S.T, found without forming that matrix) over
+    the log of its length, a cheap stand-in for its TextRank centrality.
+    """
+    if len(sentence_tokens) <= max_candidates:
+        return np.arange(len(sentence_tokens))
+
+    incidence, sizes = _incidence(sentence_tokens, stopwords)
+    document_frequency = np.asarray(incidence.sum(axis=0)).ravel()
+    shared = incidence @ (document_frequency - 1)
+    scores = shared / (np.log(np.maximum(sizes, 1)) + 1.0)
+    return np.sort(np.argsort(-scores, kind="stable")[:max_candidates])
+
+
+def overlap_matrix(sentence_tokens, stopwords):
+    """TextRank weights: shared distinct words over log(|a|) + log(|b|), for every sentence pair.
+
+    Built from a sparse sentence-by-term incidence matrix S as S @ S.T. Pairs
+    where either sentence has no words left, or both have exactly one,
+    weigh 0, as does the diagonal.
+    """
+    incidence, sizes = _incidence(sentence_tokens, stopwords)
+    intersection = (incidence @ incidence.T).toarray()
+
+    log_sizes = np.log(np.maximum(sizes, 1))
+    log_len = log_sizes[:, None] + log_sizes[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = np.where(log_len > 0, intersection / log_len, 0.0)
+
+    empty = sizes == 0
+    weights[empty, :] = 0.0
+    weights[:, empty] = 0.0
+    np.fill_diagonal(weights, 0.0)
+    return weights
+
 
-        sentences = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?|\!)\s', text)
-        sentences = [s.strip() for s in sentences if len(s.split()) > 4]  # Filter tiny sentences
+def pagerank(weights, alpha=PAGERANK_ALPHA, max_iter=PAGERANK_MAX_ITER, tol=PAGERANK_TOL):
+    """PageRank of a weighted adjacency matrix by power iteration.
 
-        if len(sentences) <= max_sentences:
-            return {"summary": " ".join(sentences)}
+    Follows networkx.pagerank: rows with no out-weight spread their rank
+    uniformly, and iteration stops once the L1 change drops below n * tol
+    (or after max_iter rounds, keeping the last estimate).
+    """
+    n = len(weights)
+    if n == 0:
+        return np.empty(0)
 
-        sentence_tokens = [simple_preprocess(s) for s in sentences]
+    out_weight = weights.sum(axis=1)
+    dangling = out_weight == 0
+    inverse = np.zeros(n)
+    inverse[~dangling] = 1.0 / out_weight[~dangling]
+    transition = weights * inverse[:, None]
 
-        sim_mat = np.zeros([len(sentences), len(sentences)])
+    uniform = np.full(n, 1.0 / n)
+    x = uniform
+    for _ in range(max_iter):
+        last = x
+        x = alpha * (x @ transition + x[dangling].sum() * uniform) + (1 - alpha) * uniform
+        if np.abs(x - last).sum() < n * tol:
+            break
+    return x
 
-        stopwords = {
-            'the', 'and', 'of', 'to', 'a', 'in', 'is', 'that', 'for', 'it', 'on',
-            'with', 'as', 'are', 'was', 'this', 'by', 'be', 'at', 'or', 'from',
-            'an', 'not', 'but', 'can', 'if', 'we', 'has', 'have', 'which', 'their',
-            'will', 'its', 'about', 'would', 'there', 'so', 'what', 'who', 'when',
-            'they', 'he', 'she', 'his', 'her', 'been', 'had', 'were', 'one', 'all',
-            'you', 'your', 'my', 'our', 'me', 'us', 'him', 'them'
-        }
 
-        for i in range(len(sentences)):
-            for j in range(len(sentences)):
-                if i != j:
-                    set_i = set(w for w in sentence_tokens[i] if w not in stopwords)
-                    set_j = set(w for w in sentence_tokens[j] if w not in stopwords)
+def _summarize(text, max_sentences=5, max_candidates=None):
+    if not text or len(text.strip()) < 50:
+        return text[:500]
 
-                    if not set_i or not set_j:
-                        sim_mat[i][j] = 0.0
-                        continue
+    sentences = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?|\!)\s', text)
+    sentences = [s.strip() for s in sentences if len(s.split()) > 4]  # Filter tiny sentences
 
-                    intersection = len(set_i.intersection(set_j))
-                    log_len = np.log(len(set_i)) + np.log(len(set_j))
+    if len(sentences) <= max_sentences:
+        return " ".join(sentences)
 
-                    if log_len == 0:
-                        sim_mat[i][j] = 0.0
-                    else:
-                        sim_mat[i][j] = intersection / log_len
+    sentence_tokens = [simple_preprocess(s) for s in sentences]
+    if max_candidates is not None and len(sentences) > max_candidates:
+        keep = candidate_sentences(sentence_tokens, STOPWORDS, max(max_candidates, max_sentences))
+        sentences = [sentences[i] for i in keep]
+        sentence_tokens = [sentence_tokens[i] for i in keep]
 
-        nx_graph = nx.from_numpy_array(sim_mat)
+    with metrics.span("textrank"):
+        scores = pagerank(overlap_matrix(sentence_tokens, STOPWORDS))
+
+    ranked_sentences = sorted(((scores[i], s) for i, s in enumerate(sentences)), reverse=True)
+
+    # Get top N
+    top_sentences_list = [s[1] for s in ranked_sentences[:max_sentences]]
+
+    final_summary_sentences = []
+    for sent in sentences:
+        if sent in top_sentences_list:
+            final_summary_sentences.append(sent)
+
+    return " ".join(final_summary_sentences)
+
+
+def _cache_key(text, max_sentences, max_candidates):
+    digest = hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest()
+    return f"{digest}:{max_sentences}:{max_candidates}"
+
+
+def _summary_cache(cache_dir):
+    return blob_cache.open_cache(os.path.join(cache_dir, SUMMARY_CACHE_DIR), SUMMARY_CACHE_MAX_BYTES)
+
+
+def _safe_summarize(args):
+    text, max_sentences, max_candidates = args
+    try:
+        return _summarize(text, max_sentences, max_candidates), True
+    except Exception as e:
+        log.error("Summarization Error: %s", e, exc_info=True)
+        return text[:500] + "...", False
+
+
+def summarize_file(text, max_sentences=5, max_candidates=None, cache_dir=None):
+    """{"summary": ...} of the `max_sentences` highest-ranked sentences, in document order.
+
+    With `max_candidates`, long texts only rank that many pre-selected
+    sentences. With `cache_dir`, a text summarized before with the same
+    settings is answered from the summary cache.
+    """
+    text = text or ""
+    cache = _summary_cache(cache_dir) if cache_dir else None
+    key = _cache_key(text, max_sentences, max_candidates)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return {"summary": cached.decode("utf-8", "surrogatepass")}
+
+    summary, ok = _safe_summarize((text, max_sentences, max_candidates))
+    if ok and cache is not None:
+        cache.put(key, summary.encode("utf-8", "surrogatepass"))
+    return {"summary": summary}
+
+
+def summarize_files(texts, max_sentences=5, max_candidates=MAX_CANDIDATES, cache_dir=None,
+                    max_workers=SUMMARY_WORKERS):
+    """{"summaries": [...]} for `texts`, in order, summarized across a process pool.
+
+    Cached summaries are reused; only the rest are sent to the workers.
+    """
+    try:
+        texts = [text or "" for text in texts]
+        summaries = [None] * len(texts)
+        cache = _summary_cache(cache_dir) if cache_dir else None
+        keys = [_cache_key(text, max_sentences, max_candidates) for text in texts]
 
-        scores = nx.pagerank(nx_graph)
+        missing = []
+        for i, key in enumerate(keys):
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                summaries[i] = cached.decode("utf-8", "surrogatepass")
+            else:
+                missing.append(i)
 
-        ranked_sentences = sorted(((scores[i], s) for i, s in enumerate(sentences)), reverse=True)
+        jobs = [(texts[i], max_sentences, max_candidates) for i in missing]
+        pool = None
+        if max_workers > 1 and len(jobs) > 1:
+            try:
+                pool = ProcessPoolExecutor(max_workers)
+            except (ImportError, NotImplementedError, OSError) as e:
+                log.info("No process pool for summaries (%s), summarizing serially", e)
 
-        # Get top N
-        top_sentences_list = [s[1] for s in ranked_sentences[:max_sentences]]
+        if pool is None:
+            results = map(_safe_summarize, jobs)
+        else:
+            with pool:
+                results = list(pool.map(_safe_summarize, jobs, chunksize=max(1, len(jobs) // (max_workers * 4))))
 
-        final_summary_sentences = []
-        for sent in sentences:
-            if sent in top_sentences_list:
-                final_summary_sentences.append(sent)
+        for i, (summary, ok) in zip(missing, results):
+            summaries[i] = summary
+            if ok and cache is not None:
+                cache.put(keys[i], summary.encode("utf-8", "surrogatepass"))
 
-        return {"summary": " ".join(final_summary_sentences)}
+        log.debug("Summarized %d of %d texts (%d cached)", len(missing), len(texts), len(texts) - len(missing))
+        return {"summaries": summaries}
 
     except Exception as e:
-        print(f"Summarization Error: {e}")
-        import traceback
-        traceback.print_exc()
-        return {"summary": text[:500] + "..."}
+        log.error("Batch Summarization Error: %s", e, exc_info=True)
+        return {"summaries": [(text or "")[:500] + "..." for text in texts]}
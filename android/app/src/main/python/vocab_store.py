@@ -0,0 +1,133 @@
+import os
+import zlib
+import hashlib
+import numpy as np
+
+# Compact vocabulary, opened with mmap instead of parsing vocab.json:
+#
+#   vocab_tokens.bin    UTF-8 tokens in sorted order, concatenated
+#   vocab_offsets.npy   int32 (n + 1,)  start of each token in the blob, then the blob length
+#   vocab_ids.npy       int32 (n,)      word-vector row of each sorted token
+#   vocab_hash.npy      int32 (2^k,)    open-addressing table of sorted positions, -1 if empty,
+#                                       probed linearly from crc32(token) & (2^k - 1)
+#   vocab_source.sha1   SHA-1 of the vocab.json the files were exported from
+TOKENS_FILE = "vocab_tokens.bin"
+OFFSETS_FILE = "vocab_offsets.npy"
+IDS_FILE = "vocab_ids.npy"
+HASH_FILE = "vocab_hash.npy"
+SOURCE_FILE = "vocab_source.sha1"
+COMPACT_FILES = [TOKENS_FILE, OFFSETS_FILE, IDS_FILE, HASH_FILE]
+
+
+def has_compact_vocab(directory):
+    return all(os.path.exists(os.path.join(directory, name)) for name in COMPACT_FILES)
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def source_digest(directory):
+    """Digest of the vocab.json the compact files came from, or None if unknown."""
+    try:
+        with open(os.path.join(directory, SOURCE_FILE), "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def export_vocab(vocab, directory, source=None):
+    """Write `vocab` (token -> id) in the compact format; returns the bytes written.
+
+    `source` is the digest of the vocab.json it came from, recorded so a
+    changed vocab.json is noticed and exported again.
+    """
+    tokens = sorted(vocab)
+    encoded = [token.encode("utf-8") for token in tokens]
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int32)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    ids = np.array([vocab[token] for token in tokens], dtype=np.int32)
+
+    size = 1
+    while size < 2 * max(1, len(tokens)):
+        size *= 2
+    table = np.full(size, -1, dtype=np.int32)
+    mask = size - 1
+    for position, token_bytes in enumerate(encoded):
+        slot = zlib.crc32(token_bytes) & mask
+        while table[slot] != -1:
+            slot = (slot + 1) & mask
+        table[slot] = position
+
+    # The blob goes last, so has_compact_vocab only sees a complete export
+    for name, array in ((OFFSETS_FILE, offsets), (IDS_FILE, ids), (HASH_FILE, table)):
+        np.save(os.path.join(directory, name), array)
+    tmp_path = os.path.join(directory, TOKENS_FILE + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(b"".join(encoded))
+    os.replace(tmp_path, os.path.join(directory, TOKENS_FILE))
+    if source is not None:
+        with open(os.path.join(directory, SOURCE_FILE), "w") as f:
+            f.write(source)
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in COMPACT_FILES)
+
+
+class CompactVocab:
+    """Read-only token -> id mapping over the compact files, with the lookups of a dict.
+
+    Tokens found once are remembered in a small dict, so repeated words
+    cost a dict hit rather than a hash-table probe.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, TOKENS_FILE), "rb") as f:
+            self._blob = f.read()
+        self._offsets = memoryview(np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r"))
+        self._ids = memoryview(np.load(os.path.join(directory, IDS_FILE), mmap_mode="r"))
+        self._table = memoryview(np.load(os.path.join(directory, HASH_FILE), mmap_mode="r"))
+        self._mask = len(self._table) - 1
+        self._found = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _position(self, token_bytes):
+        slot = zlib.crc32(token_bytes) & self._mask
+        while True:
+            position = self._table[slot]
+            if position < 0:
+                return -1
+            if self._blob[self._offsets[position]:self._offsets[position + 1]] == token_bytes:
+                return position
+            slot = (slot + 1) & self._mask
+
+    def get(self, token, default=None):
+        found = self._found.get(token)
+        if found is not None:
+            return found
+        position = self._position(token.encode("utf-8"))
+        if position < 0:
+            return default
+        found = self._found[token] = self._ids[position]
+        return found
+
+    def __contains__(self, token):
+        return self.get(token) is not None
+
+    def __getitem__(self, token):
+        found = self.get(token)
+        if found is None:
+            raise KeyError(token)
+        return found
+
+    def tokens(self):
+        """Every token in sorted order."""
+        offsets = self._offsets
+        return [self._blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(self))]
+
+    def items(self):
+        return zip(self.tokens(), self._ids.tolist())
+
+    def nbytes(self):
+        return len(self._blob) + self._offsets.nbytes + self._ids.nbytes + self._table.nbytes
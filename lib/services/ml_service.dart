@@ -1,3 +1,4 @@
+import 'dart:convert';
 import 'dart:io';
 import 'package:flutter/services.dart';
 import 'package:path_provider/path_provider.dart';
@@ -16,6 +17,11 @@ class MLService {
 
     final assets = [
       'vocab.json',
+      'vocab_tokens.bin',
+      'vocab_offsets.npy',
+      'vocab_ids.npy',
+      'vocab_hash.npy',
+      'vocab_source.sha1',
       'word_vectors.npy',
       'topic_vectors.npy',
       'topic_words.npy',
@@ -45,6 +51,29 @@ class MLService {
     }
   }
 
+  Future<List<Map<String, dynamic>>> classifyFiles(List<String> texts) async {
+    try {
+      final List<dynamic> result =
+          await _channel.invokeMethod('classifyFiles', {'texts': texts});
+      return result.map((item) {
+        final classification = Map<String, dynamic>.from(item);
+        classification['topics'] = (classification['topics'] as List? ?? [])
+            .map((topic) => Map<String, dynamic>.from(topic))
+            .toList();
+        return classification;
+      }).toList();
+    } catch (e) {
+      print('Batch classification error: $e');
+      return texts
+          .map((_) => <String, dynamic>{
+                'topic_number': -1,
+                'confidence': 0.0,
+                'topics': <Map<String, dynamic>>[],
+              })
+          .toList();
+    }
+  }
+
   Future<String?> getSummary(String text) async {
     try {
       final result =
@@ -55,26 +84,67 @@ class MLService {
     }
   }
 
-  Future<String?> readFile(String filePath) async {
+  Future<List<String>> summarizeFiles(List<String> texts) async {
     try {
-      final result =
-          await _channel.invokeMethod('readFile', {'file_path': filePath});
+      final List<dynamic> result =
+          await _channel.invokeMethod('summarizeFiles', {'texts': texts});
+      return result.map((item) => item as String).toList();
+    } catch (e) {
+      print('Batch summarization error: $e');
+      return texts.map((_) => '').toList();
+    }
+  }
+
+  Future<String?> readFile(String filePath, {int? maxChars}) async {
+    try {
+      final result = await _channel.invokeMethod('readFile', {
+        'file_path': filePath,
+        if (maxChars != null) 'max_chars': maxChars,
+      });
       return result['content'] as String?;
     } catch (e) {
       return null;
     }
   }
 
-  Future<List<String>> semanticSearch(String query) async {
+  Future<Map<String, String>> readFiles(List<String> filePaths) async {
     try {
       final result =
-          await _channel.invokeMethod('searchDocuments', {'query': query});
+          await _channel.invokeMethod('readFiles', {'paths': filePaths});
+      return Map<String, String>.from(result);
+    } catch (e) {
+      print('Bulk read error: $e');
+      return {};
+    }
+  }
+
+  /// [filters] restricts the search to matching files, e.g.
+  /// `{'extensions': ['.pdf'], 'folder': '/storage/emulated/0/Documents',
+  /// 'topics': [3], 'modified_after': 1700000000, 'modified_before': ...}`.
+  Future<List<String>> semanticSearch(String query,
+      {String mode = 'exact', Map<String, dynamic>? filters}) async {
+    try {
+      final result = await _channel.invokeMethod('searchDocuments',
+          {'query': query, 'mode': mode, 'filters': filters});
       return List<String>.from(result['results']);
     } catch (e) {
       return [];
     }
   }
 
+  Future<List<List<String>>> searchMany(List<String> queries,
+      {String mode = 'exact', Map<String, dynamic>? filters}) async {
+    try {
+      final result = await _channel.invokeMethod('searchMany',
+          {'queries': queries, 'mode': mode, 'filters': filters});
+      return (result['results'] as List)
+          .map((paths) => List<String>.from(paths))
+          .toList();
+    } catch (e) {
+      return List.generate(queries.length, (_) => <String>[]);
+    }
+  }
+
   Future<void> trainSearchIndex(Map<String, String> contentMap) async {
     try {
       print("DEBUG: Sending ${contentMap.length} docs for training...");
@@ -84,6 +154,34 @@ class MLService {
     }
   }
 
+  Future<Map<String, dynamic>> startIndexJob(
+      Map<String, String> contentMap) async {
+    return _indexJobCall('startIndexJob', {'files': contentMap});
+  }
+
+  Future<Map<String, dynamic>> resumeIndexJob() async {
+    return _indexJobCall('resumeIndexJob');
+  }
+
+  Future<Map<String, dynamic>> indexJobStatus() async {
+    return _indexJobCall('indexJobStatus');
+  }
+
+  Future<Map<String, dynamic>> cancelIndexJob() async {
+    return _indexJobCall('cancelIndexJob');
+  }
+
+  Future<Map<String, dynamic>> _indexJobCall(String method,
+      [Map<String, dynamic>? arguments]) async {
+    try {
+      final String result = await _channel.invokeMethod(method, arguments);
+      return jsonDecode(result) as Map<String, dynamic>;
+    } catch (e) {
+      print('Index job error: $e');
+      return {};
+    }
+  }
+
   Future<void> indexFile(String filePath, String content) async {
     try {
       await _channel.invokeMethod('addToIndex', {
@@ -118,4 +216,28 @@ class MLService {
       return [];
     }
   }
+
+  Future<Map<String, dynamic>> getMetrics() async {
+    try {
+      final String result = await _channel.invokeMethod('getMetrics');
+      return jsonDecode(result) as Map<String, dynamic>;
+    } catch (e) {
+      print('Metrics error: $e');
+      return {};
+    }
+  }
+
+  Future<Map<String, dynamic>> configureMetrics(
+      {bool? enabled, String? logLevel}) async {
+    try {
+      final String result = await _channel.invokeMethod('configureMetrics', {
+        if (enabled != null) 'enabled': enabled,
+        if (logLevel != null) 'log_level': logLevel,
+      });
+      return jsonDecode(result) as Map<String, dynamic>;
+    } catch (e) {
+      print('Metrics error: $e');
+      return {};
+    }
+  }
 }
@@ -0,0 +1,127 @@
+import sys
+import os
+import time
+import json
+import argparse
+import tempfile
+import shutil
+import numpy as np
+
+PROJECT_ROOT = os.getcwd()
+PYTHON_SOURCE_DIR = os.path.join(PROJECT_ROOT, "android/app/src/main/python")
+sys.path.extend([PROJECT_ROOT, os.path.dirname(__file__), PYTHON_SOURCE_DIR])
+
+import classifier
+import search_engine
+
+ASSETS_DIR = os.path.join(PROJECT_ROOT, "assets/models")
+MODEL_FILES = ["vocab.json", "word_vectors.npy", "topic_vectors.npy"]
+
+
+def make_app_dir(models_dir):
+    """Temporary app files directory with the model files copied into its models/."""
+    app_dir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(app_dir, "models"))
+    for f in MODEL_FILES:
+        shutil.copy(os.path.join(models_dir, f), os.path.join(app_dir, "models", f))
+    return app_dir
+
+
+def topic_word_pools(models_dir, pool_size=300):
+    """The `pool_size` vocabulary words closest to each topic vector."""
+    classifier.load_resources(models_dir)
+    words = [None] * len(classifier._vocab)
+    for word, idx in classifier._vocab.items():
+        words[idx] = word
+    words = np.array(words, dtype=object)
+
+    known = np.array([w is not None and len(w) >= 3 and w not in classifier.STOPWORDS for w in words])
+    norms = np.linalg.norm(classifier._word_vectors, axis=1)
+    sims = (classifier._topic_vectors @ np.asarray(classifier._word_vectors).T) / np.where(norms > 0, norms, 1)
+    sims[:, ~known] = -np.inf
+
+    pools = [words[np.argsort(-row)[:pool_size]] for row in sims]
+    return pools, words[known]
+
+
+def make_corpus(pools, background, n_docs, words_per_doc=60, topical_share=0.7, seed=0):
+    """Synthetic documents drawn mostly from one topic's words each."""
+    rng = np.random.default_rng(seed)
+    n_topical = int(words_per_doc * topical_share)
+    docs = {}
+    for i in range(n_docs):
+        pool = pools[rng.integers(len(pools))]
+        words = list(rng.choice(pool, n_topical)) + list(rng.choice(background, words_per_doc - n_topical))
+        docs[f"/synthetic/doc{i}.txt"] = " ".join(words)
+    return docs
+
+
+def make_queries(pools, n_queries, words_per_query=4, seed=1):
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(pools[rng.integers(len(pools))], words_per_query)) for _ in range(n_queries)]
+
+
+def timed_search(app_dir, queries, **kwargs):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search_engine.search_documents(app_dir, query, **kwargs)["results"])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, latencies
+
+
+def recall_at_k(approx, exact):
+    recalls = [len(set(a) & set(e)) / len(e) for a, e in zip(approx, exact) if e]
+    return float(np.mean(recalls)) if recalls else 1.0
+
+
+def run_ann_report(models_dir, n_docs, n_queries, nprobes, subclusters):
+    pools, background = topic_word_pools(models_dir)
+    docs = make_corpus(pools, background, n_docs)
+    queries = make_queries(pools, n_queries)
+
+    app_dir = make_app_dir(models_dir)
+    try:
+        start = time.perf_counter()
+        search_engine.train_local_index(app_dir, json.dumps(docs), neighbor_k=0, ivf_subclusters=subclusters)
+        build_seconds = time.perf_counter() - start
+
+        timed_search(app_dir, queries[:5])  # Warm the index and model caches
+        exact, exact_latency = timed_search(app_dir, queries)
+
+        rows = [{"mode": "exact", "nprobe": None, "recall@10": 1.0,
+                 "p50_ms": float(np.percentile(exact_latency, 50)),
+                 "p95_ms": float(np.percentile(exact_latency, 95))}]
+        for nprobe in nprobes:
+            approx, latency = timed_search(app_dir, queries, mode=search_engine.MODE_IVF, nprobe=nprobe)
+            rows.append({"mode": "ivf", "nprobe": nprobe, "recall@10": recall_at_k(approx, exact),
+                         "p50_ms": float(np.percentile(latency, 50)),
+                         "p95_ms": float(np.percentile(latency, 95))})
+    finally:
+        shutil.rmtree(app_dir)
+
+    return {"docs": n_docs, "queries": n_queries, "subclusters": subclusters,
+            "build_seconds": build_seconds, "rows": rows}
+
+
+def print_report(report):
+    print(f"\nIVF recall vs latency: {report['docs']} docs, {report['queries']} queries, "
+          f"subclusters={report['subclusters']}, build {report['build_seconds']:.1f}s")
+    print(f"  {'mode':<6} {'nprobe':>6} {'recall@10':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for row in report["rows"]:
+        nprobe = "-" if row["nprobe"] is None else row["nprobe"]
+        print(f"  {row['mode']:<6} {nprobe:>6} {row['recall@10']:>10.2%} "
+              f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@10 and latency of IVF search against exact search.")
+    parser.add_argument("--models-dir", default=ASSETS_DIR)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 3, 5, 8])
+    parser.add_argument("--subclusters", type=int, nargs="+", default=[0, 8])
+    args = parser.parse_args()
+
+    for sub in args.subclusters:
+        print_report(run_ann_report(args.models_dir, args.docs, args.queries, args.nprobe, sub))
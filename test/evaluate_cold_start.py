@@ -0,0 +1,82 @@
+import sys
+import os
+import json
+import argparse
+import shutil
+import subprocess
+import numpy as np
+
+PROJECT_ROOT = os.getcwd()
+PYTHON_SOURCE_DIR = os.path.join(PROJECT_ROOT, "android/app/src/main/python")
+sys.path.extend([PROJECT_ROOT, os.path.dirname(__file__), PYTHON_SOURCE_DIR])
+
+import vocab_store
+from evaluate_ann import ASSETS_DIR, make_app_dir
+
+SAMPLE_TEXT = ("The quarterly financial report shows revenue growth, lower operating expenses "
+               "and a stronger balance sheet after the investment in new software systems.")
+
+# Each probe runs in a fresh interpreter and prints {"import_ms", "first_call_ms"}.
+PROBE = """
+import json, os, sys, time
+sys.path.insert(0, {source!r})
+start = time.perf_counter()
+import numpy as np
+import classifier
+imported = time.perf_counter()
+{load}
+result = classifier.classify_file({models!r}, {text!r})
+done = time.perf_counter()
+assert result["topic_number"] >= 0, result
+print(json.dumps({{"import_ms": (imported - start) * 1000, "first_call_ms": (done - imported) * 1000}}))
+"""
+
+# What load_resources did before the compact vocabulary: parse vocab.json, read every array.
+LEGACY_LOAD = """
+with open(os.path.join({models!r}, "vocab.json"), "r") as f:
+    classifier._vocab = json.load(f)
+classifier._word_vectors = np.load(os.path.join({models!r}, "word_vectors.npy"))
+classifier._topic_vectors = np.load(os.path.join({models!r}, "topic_vectors.npy"))
+classifier._topic_norms = np.linalg.norm(classifier._topic_vectors, axis=1)
+"""
+
+
+def probe(models_dir, legacy, runs):
+    load = LEGACY_LOAD.format(models=models_dir) if legacy else ""
+    code = PROBE.format(source=PYTHON_SOURCE_DIR, load=load, models=models_dir, text=SAMPLE_TEXT)
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    return {key: float(np.median([s[key] for s in samples])) for key in samples[0]}
+
+
+def run_cold_start_report(models_dir, runs):
+    app_dir = make_app_dir(models_dir)
+    work_dir = os.path.join(app_dir, "models")
+    try:
+        with open(os.path.join(work_dir, "vocab.json"), "r") as f:
+            vocab = json.load(f)
+        compact_bytes = vocab_store.export_vocab(vocab, work_dir,
+                                                 vocab_store.file_digest(os.path.join(work_dir, "vocab.json")))
+
+        rows = [("json + np.load (before)", probe(work_dir, True, runs)),
+                ("compact + mmap (after)", probe(work_dir, False, runs))]
+    finally:
+        shutil.rmtree(app_dir)
+
+    print(f"\nCold start, median of {runs} fresh interpreters "
+          f"(vocab.json {os.path.getsize(os.path.join(models_dir, 'vocab.json'))} B, compact {compact_bytes} B)")
+    print(f"  {'loader':<26} {'import ms':>10} {'first call ms':>14} {'total ms':>9}")
+    for name, row in rows:
+        print(f"  {name:<26} {row['import_ms']:>10.1f} {row['first_call_ms']:>14.1f} "
+              f"{row['import_ms'] + row['first_call_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import and first-classify time with each vocabulary format.")
+    parser.add_argument("--models-dir", default=ASSETS_DIR)
+    parser.add_argument("--runs", type=int, default=7)
+    args = parser.parse_args()
+
+    run_cold_start_report(args.models_dir, args.runs)
@@ -0,0 +1,188 @@
+import sys
+import os
+import time
+import logging
+import argparse
+import shutil
+import threading
+import numpy as np
+
+PROJECT_ROOT = os.getcwd()
+PYTHON_SOURCE_DIR = os.path.join(PROJECT_ROOT, "android/app/src/main/python")
+sys.path.extend([PROJECT_ROOT, os.path.dirname(__file__), PYTHON_SOURCE_DIR])
+
+import classifier
+import metrics
+import rwlock
+import search_engine
+from evaluate_ann import ASSETS_DIR, make_app_dir, topic_word_pools, make_corpus, make_queries
+
+
+class ErrorCounter(logging.Handler):
+    """Counts ERROR records logged anywhere under the "smartfind" logger."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def _finishes(target, timeout=2.0):
+    """Run `target` on a thread; True if it returned within `timeout` seconds."""
+    worker = threading.Thread(target=target, daemon=True)
+    worker.start()
+    worker.join(timeout)
+    return not worker.is_alive()
+
+
+def check_lock():
+    """Writer re-entry, nested reads and writer preference of rwlock.ReadWriteLock."""
+    failures = []
+
+    lock = rwlock.ReadWriteLock()
+
+    def write_then_read():
+        with lock.write_locked():
+            with lock.read_locked():
+                with lock.read_locked():
+                    pass
+
+    if not _finishes(write_then_read):
+        failures.append("writer could not take the read lock")
+
+    lock = rwlock.ReadWriteLock()
+    order = []
+    reading, writer_waiting = threading.Event(), threading.Event()
+
+    def first_reader():
+        with lock.read_locked():
+            reading.set()
+            writer_waiting.wait()
+            time.sleep(0.1)
+            with lock.read_locked():  # Nested read while a writer waits
+                order.append("nested read")
+            order.append("first read")
+
+    def writer():
+        reading.wait()
+        writer_waiting.set()
+        with lock.write_locked():
+            order.append("write")
+
+    def late_reader():
+        writer_waiting.wait()
+        time.sleep(0.05)
+        with lock.read_locked():
+            order.append("late read")
+
+    workers = [threading.Thread(target=t, daemon=True) for t in (first_reader, writer, late_reader)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(2.0)
+    if any(worker.is_alive() for worker in workers):
+        failures.append("reader/writer threads deadlocked")
+    elif order != ["nested read", "first read", "write", "late read"]:
+        failures.append(f"writer not preferred: {order}")
+    return failures
+
+
+def query_loop(app_dir, queries, paths, stop, latencies, empty, seed):
+    """Alternate searches and similar-file lookups until `stop` is set."""
+    rng = np.random.default_rng(seed)
+    while not stop.is_set():
+        start = time.perf_counter()
+        if rng.random() < 0.5:
+            results = search_engine.search_documents(app_dir, queries[rng.integers(len(queries))])["results"]
+        else:
+            results = search_engine.get_similar_files(app_dir, paths[rng.integers(len(paths))])["results"]
+        latencies.append((time.perf_counter() - start) * 1000)
+        empty[0] += not results
+
+
+def rebuild_loop(app_dir, corpora, stop, counts):
+    """Retrain over alternating corpora with the same paths, with in-place updates and model swaps between."""
+    models_dir = os.path.join(app_dir, "models")
+    i = 0
+    while not stop.is_set():
+        docs = corpora[i % len(corpora)]
+        search_engine.train_index_from_documents(app_dir, docs.items(), workers=1)
+        counts["rebuilds"] += 1
+        for path in list(docs)[:20]:
+            search_engine.update_index(app_dir, path, corpora[(i + 1) % len(corpora)][path])
+            counts["updates"] += 1
+        if i % 3 == 2:
+            classifier.reload_resources(models_dir)
+            counts["model_swaps"] += 1
+        i += 1
+
+
+def run_queries(app_dir, queries, paths, threads, seconds, corpora=None):
+    stop = threading.Event()
+    latencies, empty, counts = [], [0], {"rebuilds": 0, "updates": 0, "model_swaps": 0}
+    workers = [threading.Thread(target=query_loop, args=(app_dir, queries, paths, stop, latencies, empty, seed))
+               for seed in range(threads)]
+    if corpora is not None:
+        workers.append(threading.Thread(target=rebuild_loop, args=(app_dir, corpora, stop, counts)))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return {"queries": len(latencies), "empty": empty[0],
+            "p50_ms": float(np.percentile(latencies, 50)), "p95_ms": float(np.percentile(latencies, 95)),
+            **counts}
+
+
+def run_stress_report(models_dir, n_docs, threads, seconds):
+    """Query latency and errors while the index is rebuilt and swapped continuously."""
+    pools, background = topic_word_pools(models_dir)
+    corpora = [make_corpus(pools, background, n_docs, seed=seed) for seed in (0, 1)]
+    queries = make_queries(pools, 200)
+    paths = list(corpora[0])
+
+    errors = ErrorCounter()
+    logging.getLogger(metrics.LOGGER_NAME).addHandler(errors)
+    search_engine.set_query_cache_size(0)  # Every query reads the index
+    app_dir = make_app_dir(models_dir)
+    try:
+        search_engine.train_index_from_documents(app_dir, corpora[0].items(), workers=1)
+        idle = run_queries(app_dir, queries, paths, threads, seconds)
+        busy = run_queries(app_dir, queries, paths, threads, seconds, corpora)
+    finally:
+        shutil.rmtree(app_dir)
+        logging.getLogger(metrics.LOGGER_NAME).removeHandler(errors)
+
+    print(f"\nConcurrent queries: {n_docs} docs, {threads} query threads, {seconds:.0f}s per phase")
+    print(f"  {'phase':<8} {'queries':>8} {'empty':>6} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'rebuilds':>9} {'updates':>8} {'swaps':>6}")
+    for name, row in (("idle", idle), ("rebuild", busy)):
+        print(f"  {name:<8} {row['queries']:>8} {row['empty']:>6} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+              f"{row['rebuilds']:>9} {row['updates']:>8} {row['model_swaps']:>6}")
+    print(f"  errors logged: {len(errors.messages)}")
+    for message in errors.messages[:5]:
+        print(f"    {message}")
+    return idle, busy, errors.messages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query errors and latency while the index is rebuilt underneath.")
+    parser.add_argument("--models-dir", default=ASSETS_DIR)
+    parser.add_argument("--docs", type=int, default=3000)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--max-p95-ratio", type=float, default=3.0,
+                        help="Fail if p95 latency during rebuilds exceeds this multiple of the idle p95")
+    args = parser.parse_args()
+
+    lock_failures = check_lock()
+    print(f"Read-write lock: {'ok' if not lock_failures else '; '.join(lock_failures)}")
+
+    idle, busy, errors = run_stress_report(args.models_dir, args.docs, args.threads, args.seconds)
+    ratio = busy["p95_ms"] / idle["p95_ms"] if idle["p95_ms"] else 0.0
+    print(f"  p95 ratio: {ratio:.2f} (limit {args.max_p95_ratio:.2f})")
+    if lock_failures or errors or busy["empty"] or ratio > args.max_p95_ratio:
+        sys.exit(1)
@@ -0,0 +1,68 @@
+import sys
+import os
+import time
+import json
+import argparse
+import shutil
+import numpy as np
+
+PROJECT_ROOT = os.getcwd()
+PYTHON_SOURCE_DIR = os.path.join(PROJECT_ROOT, "android/app/src/main/python")
+sys.path.extend([PROJECT_ROOT, os.path.dirname(__file__), PYTHON_SOURCE_DIR])
+
+import search_engine
+from evaluate_ann import ASSETS_DIR, make_app_dir, topic_word_pools, make_corpus, make_queries
+
+# Nested folders: /synthetic/g0 holds 1/2 of the documents, /synthetic/g0/h0 1/10, /synthetic/g0/h0/k0 1/100.
+FOLDERS = [("all", None), ("50%", "/synthetic/g0"), ("10%", "/synthetic/g0/h0"), ("1%", "/synthetic/g0/h0/k0")]
+
+
+def nest(docs):
+    return {f"/synthetic/g{i % 2}/h{i % 10}/k{i % 100}/doc{i}.txt": text for i, text in enumerate(docs.values())}
+
+
+def run_filter_report(models_dir, n_docs, n_queries, top_k=10):
+    """Latency of folder-filtered search by selectivity, against filtering the unfiltered top k."""
+    pools, background = topic_word_pools(models_dir)
+    docs = nest(make_corpus(pools, background, n_docs))
+    queries = make_queries(pools, n_queries, seed=6)
+
+    app_dir = make_app_dir(models_dir)
+    rows = []
+    try:
+        search_engine.train_local_index(app_dir, json.dumps(docs), neighbor_k=0)
+        search_engine.set_query_cache_size(0)
+
+        for mode in (search_engine.MODE_EXACT, search_engine.MODE_HYBRID):
+            for label, folder in FOLDERS:
+                filters = {"folder": folder} if folder else None
+                latencies, filtered, post_filtered = [], 0, 0
+                for query in queries:
+                    start = time.perf_counter()
+                    results = search_engine.search_documents(app_dir, query, top_k=top_k, mode=mode,
+                                                             filters=filters)["results"]
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    filtered += len(results)
+
+                    unfiltered = search_engine.search_documents(app_dir, query, top_k=top_k, mode=mode)["results"]
+                    post_filtered += sum(folder is None or path.startswith(folder + "/") for path in unfiltered)
+                rows.append({"mode": mode, "filter": label, "p50_ms": float(np.percentile(latencies, 50)),
+                             "results": filtered / len(queries), "post_filter_results": post_filtered / len(queries)})
+    finally:
+        shutil.rmtree(app_dir)
+
+    print(f"\nFiltered search: {n_docs} docs, {len(queries)} queries, top {top_k}, filter on folder")
+    print(f"  {'mode':<7} {'matches':<8} {'p50 ms':>8} {'results':>8} {'post-filtered top k':>20}")
+    for row in rows:
+        print(f"  {row['mode']:<7} {row['filter']:<8} {row['p50_ms']:>8.2f} {row['results']:>8.1f} "
+              f"{row['post_filter_results']:>20.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-filtered search latency and results by filter selectivity.")
+    parser.add_argument("--models-dir", default=ASSETS_DIR)
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    run_filter_report(args.models_dir, args.docs, args.queries)
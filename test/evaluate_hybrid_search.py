@@ -0,0 +1,109 @@
+import sys
+import os
+import time
+import json
+import argparse
+import shutil
+import numpy as np
+
+PROJECT_ROOT = os.getcwd()
+PYTHON_SOURCE_DIR = os.path.join(PROJECT_ROOT, "android/app/src/main/python")
+sys.path.extend([PROJECT_ROOT, os.path.dirname(__file__), PYTHON_SOURCE_DIR])
+
+import bm25
+import search_engine
+from evaluate_ann import ASSETS_DIR, make_app_dir, topic_word_pools, make_corpus
+
+
+def add_identifiers(docs, seed=2):
+    """Give every document an invoice number and a made-up name, as exact-term targets."""
+    rng = np.random.default_rng(seed)
+    targets = {}
+    for i, path in enumerate(docs):
+        invoice = f"INV-{rng.integers(2015, 2026)}-{i:05d}"
+        name = "".join(rng.choice(list("bcdfghklmnprstvz"), 3)) + "ov" + str(i)
+        docs[path] = f"{docs[path]} invoice {invoice} issued to {name}"
+        targets[path] = (invoice, name)
+    return targets
+
+
+def run_exact_term_report(models_dir, n_docs, n_queries, top_k=10):
+    """How often the document holding an invoice number or name ranks in the top k."""
+    pools, background = topic_word_pools(models_dir)
+    docs = make_corpus(pools, background, n_docs)
+    targets = add_identifiers(docs)
+    rng = np.random.default_rng(3)
+    picked = [list(targets)[i] for i in rng.choice(len(targets), min(n_queries, len(targets)), replace=False)]
+
+    app_dir = make_app_dir(models_dir)
+    try:
+        search_engine.train_local_index(app_dir, json.dumps(docs), neighbor_k=0)
+
+        rows = []
+        for mode in (search_engine.MODE_EXACT, search_engine.MODE_HYBRID):
+            for kind, field in (("invoice", 0), ("name", 1)):
+                hits, latencies = 0, []
+                for path in picked:
+                    start = time.perf_counter()
+                    results = search_engine.search_documents(app_dir, targets[path][field],
+                                                             top_k=top_k, mode=mode)["results"]
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    hits += path in results
+                rows.append({"mode": mode, "query": kind, "hit_rate": hits / len(picked),
+                             "p50_ms": float(np.percentile(latencies, 50))})
+    finally:
+        shutil.rmtree(app_dir)
+
+    print(f"\nExact-term queries: {n_docs} docs, {len(picked)} queries, target in top {top_k}")
+    print(f"  {'mode':<7} {'query':<8} {'hit rate':>9} {'p50 ms':>8}")
+    for row in rows:
+        print(f"  {row['mode']:<7} {row['query']:<8} {row['hit_rate']:>9.2%} {row['p50_ms']:>8.2f}")
+
+
+def run_postings_report(n_docs, n_lookups, terms_per_doc=120, vocabulary=200000, seed=0):
+    """Postings lookup latency on a synthetic Zipf-distributed keyword index."""
+    rng = np.random.default_rng(seed)
+    builder = bm25.PostingsBuilder()
+    start = time.perf_counter()
+    for first in range(0, n_docs, 1000):
+        batch = []
+        for _ in range(min(1000, n_docs - first)):
+            ids, tfs = np.unique(np.minimum(rng.zipf(1.2, terms_per_doc), vocabulary), return_counts=True)
+            batch.append({f"t{i}": int(tf) for i, tf in zip(ids, tfs)})
+        builder.add(batch)
+    lexical = bm25.LexicalIndex(builder.pack())
+    build_seconds = time.perf_counter() - start
+
+    df = np.diff(lexical.posting_starts)
+    order = np.argsort(df)
+    buckets = [("rare", order[:len(order) // 2]),
+               ("median", order[len(order) // 2:len(order) * 99 // 100]),
+               ("top 1%", order[len(order) * 99 // 100:])]
+
+    print(f"\nPostings lookups: {n_docs} docs, {lexical.term_count} terms, "
+          f"{int(lexical.posting_starts[-1])} postings in {lexical.nbytes() / 1e6:.1f} MB, "
+          f"built in {build_seconds:.1f}s")
+    print(f"  {'terms':<8} {'mean df':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for label, positions in buckets:
+        sample = rng.choice(positions, min(n_lookups, len(positions)), replace=False)
+        latencies = []
+        for position in sample:
+            term = lexical.term(position)
+            start = time.perf_counter()
+            lexical.postings(term)
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"  {label:<8} {df[sample].mean():>9.0f} {np.percentile(latencies, 50):>8.3f} "
+              f"{np.percentile(latencies, 95):>8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exact-term recall of hybrid search and BM25 postings latency.")
+    parser.add_argument("--models-dir", default=ASSETS_DIR)
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--lexical-docs", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+
+    run_exact_term_report(args.models_dir, args.docs, args.queries)
+    run_postings_report(args.lexical_docs, args.lookups)
@@ -0,0 +1,95 @@
+import sys
+import os
+import time
+import json
+import argparse
+import tempfile
+import shutil
+import subprocess
+import numpy as np
+
+PROJECT_ROOT = os.getcwd()
+PYTHON_SOURCE_DIR = os.path.join(PROJECT_ROOT, "android/app/src/main/python")
+sys.path.extend([PROJECT_ROOT, os.path.dirname(__file__), PYTHON_SOURCE_DIR])
+
+import index_jobs
+import index_store
+import search_engine
+from evaluate_ann import ASSETS_DIR, make_app_dir, topic_word_pools, make_corpus
+
+# Starts a job in a fresh interpreter and kills it once `stop_at` documents are done.
+KILLED_JOB = """
+import os, sys, time
+sys.path.insert(0, {source!r})
+import index_jobs
+index_jobs.start_index_job({app_dir!r}, {corpus!r}, workers=1)
+while index_jobs.job_status({app_dir!r})["processed"] < {stop_at}:
+    time.sleep(0.01)
+os._exit(0)
+"""
+
+
+def wait(app_dir):
+    while index_jobs.job_status(app_dir)["state"] == index_jobs.STATE_RUNNING:
+        time.sleep(0.05)
+    return index_jobs.job_status(app_dir)
+
+
+def snapshot(app_dir):
+    index = index_store.load_index(app_dir)
+    return index.paths, np.asarray(index.gather(np.arange(len(index))))
+
+
+def run_job_report(models_dir, n_docs, kill_fraction):
+    """Job overhead against a direct build, and the work a resume saves after a kill."""
+    pools, background = topic_word_pools(models_dir)
+    docs = make_corpus(pools, background, n_docs)
+    work_dir = tempfile.mkdtemp()
+    corpus = os.path.join(work_dir, "corpus.jsonl")
+    with open(corpus, "w", encoding="utf-8") as f:
+        for path, text in docs.items():
+            f.write(json.dumps({"path": path, "text": text}) + "\n")
+
+    app_dirs = [make_app_dir(models_dir) for _ in range(3)]
+    direct_dir, job_dir, resumed_dir = app_dirs
+    try:
+        start = time.perf_counter()
+        search_engine.train_index_from_jsonl(direct_dir, corpus, workers=1, use_cache=False)
+        direct_seconds = time.perf_counter() - start
+
+        index_jobs.start_index_job(job_dir, corpus, workers=1)
+        job = wait(job_dir)
+
+        stop_at = int(n_docs * kill_fraction)
+        code = KILLED_JOB.format(source=PYTHON_SOURCE_DIR, app_dir=resumed_dir, corpus=corpus, stop_at=stop_at)
+        subprocess.run([sys.executable, "-c", code], check=True)
+        interrupted = index_jobs.job_status(resumed_dir)
+        index_jobs.start_index_job(resumed_dir, corpus, workers=1)
+        resumed = wait(resumed_dir)
+
+        reference = snapshot(direct_dir)
+        identical = all(paths == reference[0] and np.array_equal(vectors, reference[1])
+                        for paths, vectors in (snapshot(job_dir), snapshot(resumed_dir)))
+    finally:
+        for app_dir in app_dirs:
+            shutil.rmtree(app_dir)
+        shutil.rmtree(work_dir)
+
+    print(f"\nIndex jobs: {n_docs} docs, checkpoint every {index_jobs.CHECKPOINT_DOCUMENTS} documents")
+    print(f"  direct build          {direct_seconds:>7.2f}s")
+    print(f"  job                   {job['seconds']:>7.2f}s  ({job['docs_per_sec']:.0f} docs/s)")
+    print(f"  killed after          {stop_at:>7} docs, checkpoint at {interrupted['processed']}")
+    print(f"  resumed job           {resumed['seconds']:>7.2f}s  (from document {resumed['resumed_from']})")
+    print(f"  same index as direct  {identical}")
+    return identical
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checkpoint overhead and resume of background index jobs.")
+    parser.add_argument("--models-dir", default=ASSETS_DIR)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--kill-at", type=float, default=0.6, help="Fraction of documents done when killed")
+    args = parser.parse_args()
+
+    if not run_job_report(args.models_dir, args.docs, args.kill_at):
+        sys.exit(1)
@@ -16,6 +16,7 @@ sys.path.extend([PROJECT_ROOT, os.path.dirname(__file__), PYTHON_SOURCE_DIR])
 import classifier
 import search_engine
 import summarizer
+import index_store
 
 # Initialize Resources
 ASSETS_DIR = os.path.join(PROJECT_ROOT, "assets/models")
@@ -188,8 +189,8 @@ def run_recommendation_audit():
         targets = ["/dir/space1.txt", "/dir/money3.txt", "/dir/tech2.txt", "/dir/legal1.txt"]
         precisions, recalls, diversities = [], [], []
 
-        with open(os.path.join(test_dir, "search_index.json"), "r") as f:
-            index_data = {item['path']: np.array(item['vector']) for item in json.load(f)}
+        index = index_store.load_index(test_dir)
+        index_data = {path: np.array(vec) for path, vec in zip(index.paths, index.gather(np.arange(len(index))))}
 
         for target in targets:
             prefix = target[5:8]
@@ -0,0 +1,115 @@
+import sys
+import os
+import time
+import json
+import argparse
+import shutil
+import numpy as np
+
+PROJECT_ROOT = os.getcwd()
+PYTHON_SOURCE_DIR = os.path.join(PROJECT_ROOT, "android/app/src/main/python")
+sys.path.extend([PROJECT_ROOT, os.path.dirname(__file__), PYTHON_SOURCE_DIR])
+
+import classifier
+import index_store
+import search_engine
+from evaluate_ann import ASSETS_DIR, make_app_dir, topic_word_pools, make_corpus, make_queries
+
+
+def overlap(results, reference):
+    scores = [len(set(r) & set(e)) / len(e) for r, e in zip(results, reference) if e]
+    return float(np.mean(scores)) if scores else 1.0
+
+
+def reload_model(models_dir):
+    classifier.reload_resources(models_dir)
+
+
+def run_queries(app_dir, queries, similar_paths):
+    search = [search_engine.search_documents(app_dir, q)["results"] for q in queries]
+    similar = [search_engine.get_similar_files(app_dir, p)["results"] for p in similar_paths]
+    return search, similar
+
+
+def index_files_bytes(app_dir):
+    directory = index_store.index_dir(app_dir)
+    header = index_store._read_header(directory)
+    files = [index_store._file(directory, header, f) for f in (index_store.VECTORS_FILE, index_store.SCALES_FILE)]
+    return sum(os.path.getsize(f) for f in files if os.path.exists(f))
+
+
+def run_index_audit(models_dir, docs, queries, similar_paths):
+    """Search quality and size of float16 / int8 index storage against float32."""
+    rows, reference = [], None
+    for dtype in ("float32", "float16", "int8"):
+        app_dir = make_app_dir(models_dir)
+        try:
+            reload_model(os.path.join(app_dir, "models"))
+            search_engine.train_local_index(app_dir, json.dumps(docs), neighbor_k=0, vector_dtype=dtype)
+
+            start = time.perf_counter()
+            index = index_store.load_index(app_dir)
+            np.asarray(index.main_vectors).sum()  # Touch every page
+            load_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            results = run_queries(app_dir, queries, similar_paths)
+            query_ms = (time.perf_counter() - start) * 1000 / (len(queries) + len(similar_paths))
+
+            reference = reference or results
+            rows.append((dtype, index_files_bytes(app_dir), load_ms, query_ms,
+                         overlap(results[0], reference[0]), overlap(results[1], reference[1])))
+        finally:
+            shutil.rmtree(app_dir)
+
+    print("\nIndex storage vs float32")
+    print(f"  {'dtype':<8} {'bytes':>10} {'load ms':>8} {'query ms':>9} {'search@10':>10} {'similar@5':>10}")
+    for dtype, size, load_ms, query_ms, search_overlap, similar_overlap in rows:
+        print(f"  {dtype:<8} {size:>10} {load_ms:>8.2f} {query_ms:>9.3f} "
+              f"{search_overlap:>10.2%} {similar_overlap:>10.2%}")
+
+
+def run_word_vector_audit(models_dir, docs, queries, similar_paths):
+    """Search quality when the classifier embeds with quantized word vectors."""
+    rows, reference = [], None
+    for dtype in ("float32", "float16", "int8"):
+        app_dir = make_app_dir(models_dir)
+        try:
+            app_models = os.path.join(app_dir, "models")
+            size = os.path.getsize(os.path.join(app_models, "word_vectors.npy"))
+            if dtype != "float32":
+                _, size = classifier.export_quantized_word_vectors(app_models, dtype)
+
+            start = time.perf_counter()
+            reload_model(app_models)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            search_engine.train_local_index(app_dir, json.dumps(docs), neighbor_k=0)
+            results = run_queries(app_dir, queries, similar_paths)
+
+            reference = reference or results
+            rows.append((dtype, size, load_ms,
+                         overlap(results[0], reference[0]), overlap(results[1], reference[1])))
+        finally:
+            shutil.rmtree(app_dir)
+
+    print("\nWord vectors vs float32")
+    print(f"  {'dtype':<8} {'bytes':>10} {'load ms':>8} {'search@10':>10} {'similar@5':>10}")
+    for dtype, size, load_ms, search_overlap, similar_overlap in rows:
+        print(f"  {dtype:<8} {size:>10} {load_ms:>8.2f} {search_overlap:>10.2%} {similar_overlap:>10.2%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ranking agreement of quantized vectors with full precision.")
+    parser.add_argument("--models-dir", default=ASSETS_DIR)
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    pools, background = topic_word_pools(args.models_dir)
+    corpus = make_corpus(pools, background, args.docs)
+    query_set = make_queries(pools, args.queries)
+    similar_set = list(corpus)[::max(1, args.docs // args.queries)][:args.queries]
+
+    run_index_audit(args.models_dir, corpus, query_set, similar_set)
+    run_word_vector_audit(args.models_dir, corpus, query_set, similar_set)
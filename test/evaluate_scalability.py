@@ -0,0 +1,294 @@
+import sys
+import os
+import time
+import json
+import argparse
+import platform
+import resource
+import shutil
+import subprocess
+import numpy as np
+
+PROJECT_ROOT = os.getcwd()
+PYTHON_SOURCE_DIR = os.path.join(PROJECT_ROOT, "android/app/src/main/python")
+sys.path.extend([PROJECT_ROOT, os.path.dirname(__file__), PYTHON_SOURCE_DIR])
+
+import classifier
+import neighbors
+import search_engine
+import summarizer
+import index_store
+from evaluate_ann import ASSETS_DIR, make_app_dir
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+# Synthetic documents mix Zipf-distributed background words with words from
+# one of TOPICS contiguous slices of the vocabulary. vocab.json ids follow
+# descending training-corpus frequency, so low ids are the common words.
+TOPICS = 64
+TOPIC_OFFSET = 200
+ZIPF_EXPONENT = 1.1
+TOPICAL_SHARE = 0.4
+
+# The neighbour table is built with O(n^2) work; larger indexes skip it and
+# get_similar_files falls back to scoring every row.
+NEIGHBOR_LIMIT = 20000
+
+# Metrics compared with the baseline: name -> True if higher is better.
+TRACKED = {
+    "build_docs_per_sec": True,
+    "build_seconds": False,
+    "search_p50_ms": False,
+    "search_p95_ms": False,
+    "search_p99_ms": False,
+    "hybrid_p50_ms": False,
+    "hybrid_p95_ms": False,
+    "hybrid_p99_ms": False,
+    "similar_p50_ms": False,
+    "similar_p95_ms": False,
+    "similar_p99_ms": False,
+    "cold_start_ms": False,
+    "peak_rss_mb": False,
+    "index_mb": False,
+    "classify_p50_ms": False,
+    "classify_p95_ms": False,
+    "summarize_p50_ms": False,
+    "summarize_p95_ms": False,
+}
+# Latency changes smaller than this are timer noise, whatever their percentage.
+MIN_REGRESSION_MS = 0.5
+
+# Runs in a fresh interpreter: time to import, load the model and index, and answer one query.
+COLD_START_PROBE = """
+import json, sys, time
+sys.path.insert(0, {source!r})
+start = time.perf_counter()
+import search_engine
+search_engine.search_documents({app_dir!r}, {query!r})
+print(json.dumps({{"cold_start_ms": (time.perf_counter() - start) * 1000}}))
+"""
+
+
+class CorpusGenerator:
+    def __init__(self, models_dir, words_per_doc=80, seed=0):
+        with open(os.path.join(models_dir, "vocab.json"), "r") as f:
+            vocab = json.load(f)
+        words = [None] * (max(vocab.values()) + 1)
+        for word, idx in vocab.items():
+            words[idx] = word
+        self.words = np.array([w or "" for w in words], dtype=object)
+
+        ranks = np.arange(1, len(self.words) + 1, dtype=np.float64)
+        self.background = ranks ** -ZIPF_EXPONENT
+        self.background /= self.background.sum()
+        self.topic_span = max(1, min(500, (len(self.words) - TOPIC_OFFSET) // TOPICS))
+        self.words_per_doc = words_per_doc
+        self.rng = np.random.default_rng(seed)
+
+    def topic_words(self, topic, count):
+        start = TOPIC_OFFSET + topic * self.topic_span
+        return self.words[self.rng.integers(start, start + self.topic_span, count)]
+
+    def word_rows(self, n_rows, n_words):
+        """(n_rows, n_words) array of words, each row mostly one topic."""
+        n_topical = int(n_words * TOPICAL_SHARE)
+        ids = self.rng.choice(len(self.words), size=(n_rows, n_words - n_topical), p=self.background)
+        topics = self.rng.integers(TOPICS, size=n_rows)
+        offsets = TOPIC_OFFSET + topics[:, None] * self.topic_span
+        topical = offsets + self.rng.integers(self.topic_span, size=(n_rows, n_topical))
+        return self.words[np.concatenate([ids, np.minimum(topical, len(self.words) - 1)], axis=1)]
+
+    def documents(self, n_docs, block=1000):
+        """(path, text) pairs, generated a block at a time so 1M documents fit in memory."""
+        for first in range(0, n_docs, block):
+            rows = self.word_rows(min(block, n_docs - first), self.words_per_doc)
+            for i, row in enumerate(rows):
+                self.rng.shuffle(row)
+                yield f"/synthetic/doc{first + i}.txt", " ".join(row)
+
+    def queries(self, n_queries, words_per_query=3):
+        return [" ".join(self.topic_words(self.rng.integers(TOPICS), words_per_query)) for _ in range(n_queries)]
+
+    def long_documents(self, n_docs, sentences=40):
+        """Documents of many sentences, for the summarizer."""
+        docs = []
+        for _ in range(n_docs):
+            rows = self.word_rows(sentences, int(self.rng.integers(8, 16)))
+            docs.append(" ".join(" ".join(row).capitalize() + "." for row in rows))
+        return docs
+
+
+def percentiles(latencies, prefix):
+    return {f"{prefix}_p{p}_ms": float(np.percentile(latencies, p)) for p in (50, 95, 99)}
+
+
+def timed_calls(call, args_list):
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        call(*args)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def index_mb(app_dir):
+    directory = index_store.index_dir(app_dir)
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 1e6
+
+
+def run_size(models_dir, n_docs, n_queries, neighbor_limit, words_per_doc):
+    """Build and query an index of `n_docs` synthetic documents; run in its own process for peak RSS."""
+    generator = CorpusGenerator(models_dir, words_per_doc)
+    app_dir = make_app_dir(models_dir)
+    try:
+        # train_local_index hands its parsed JSON to this same streaming path;
+        # feeding it a generator keeps 1M-document corpora out of memory.
+        neighbor_k = neighbors.NEIGHBOR_K if n_docs <= neighbor_limit else 0
+        build = search_engine.train_index_from_documents(app_dir, generator.documents(n_docs),
+                                                         neighbor_k=neighbor_k, use_cache=False)
+        if build["status"] != "ok":
+            raise RuntimeError(f"Index build failed for {n_docs} documents")
+
+        search_engine.set_query_cache_size(0)  # Measure ranking, not the result cache
+        queries = generator.queries(n_queries)
+        search_engine.search_documents(app_dir, queries[0])  # Open the index
+
+        result = {
+            "docs": n_docs,
+            "indexed": build["indexed"],
+            "neighbor_k": neighbor_k,
+            "build_seconds": build["seconds"],
+            "build_docs_per_sec": build["docs_per_sec"],
+            "index_mb": index_mb(app_dir),
+        }
+        result.update(percentiles(timed_calls(search_engine.search_documents,
+                                              [(app_dir, q) for q in queries]), "search"))
+        result.update(percentiles(timed_calls(search_engine.search_documents,
+                                              [(app_dir, q, search_engine.SEARCH_TOP_K,
+                                                search_engine.SEARCH_THRESHOLD, search_engine.MODE_HYBRID)
+                                               for q in queries]), "hybrid"))
+        rows = generator.rng.integers(n_docs, size=n_queries)
+        result.update(percentiles(timed_calls(search_engine.get_similar_files,
+                                              [(app_dir, f"/synthetic/doc{row}.txt") for row in rows]), "similar"))
+        result["peak_rss_mb"] = peak_rss_mb()
+
+        probe = COLD_START_PROBE.format(source=PYTHON_SOURCE_DIR, app_dir=app_dir, query=queries[0])
+        out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+        result.update(json.loads(out.strip().splitlines()[-1]))
+        return result
+    finally:
+        shutil.rmtree(app_dir)
+
+
+def run_components(models_dir, n_samples, words_per_doc):
+    """classify_file and summarize_file latency; independent of index size."""
+    generator = CorpusGenerator(models_dir, words_per_doc, seed=1)
+    classifier.load_resources(models_dir)
+    texts = [text for _, text in generator.documents(n_samples)]
+    long_texts = generator.long_documents(n_samples)
+
+    result = percentiles(timed_calls(classifier.classify_file, [(models_dir, t) for t in texts]), "classify")
+    result.update(percentiles(timed_calls(summarizer.summarize_file, [(t,) for t in long_texts]), "summarize"))
+    return result
+
+
+def run_size_in_subprocess(args, n_docs):
+    command = [sys.executable, os.path.abspath(__file__), "--single", str(n_docs),
+               "--models-dir", args.models_dir, "--queries", str(args.queries),
+               "--neighbor-limit", str(args.neighbor_limit), "--words", str(args.words)]
+    out = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """Tracked metrics that moved the wrong way by more than `tolerance` (a fraction)."""
+    regressions = []
+    current_sections = {"components": results["components"], **results["sizes"]}
+    baseline_sections = {"components": baseline.get("components", {}), **baseline.get("sizes", {})}
+    for section, metrics in current_sections.items():
+        for name, higher_is_better in TRACKED.items():
+            old = baseline_sections.get(section, {}).get(name)
+            new = metrics.get(name)
+            if old is None or new is None or old <= 0:
+                continue
+            if name.endswith("_ms") and abs(new - old) < MIN_REGRESSION_MS:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            if worse > tolerance:
+                regressions.append({"section": section, "metric": name, "baseline": old,
+                                    "current": new, "change": change})
+    return regressions
+
+
+def print_report(results, regressions):
+    print(f"\nScalability benchmark ({results['meta']['platform']}, {results['meta']['cpu_count']} CPUs)")
+    print(f"  {'docs':>8} {'build/s':>9} {'search p50/p95/p99 ms':>24} {'hybrid p95':>11} "
+          f"{'similar p95':>12} {'cold ms':>8} {'rss MB':>7} {'index MB':>9}")
+    for size in results["sizes"].values():
+        search = f"{size['search_p50_ms']:.2f}/{size['search_p95_ms']:.2f}/{size['search_p99_ms']:.2f}"
+        print(f"  {size['docs']:>8} {size['build_docs_per_sec']:>9.0f} {search:>24} "
+              f"{size['hybrid_p95_ms']:>11.2f} {size['similar_p95_ms']:>12.2f} {size['cold_start_ms']:>8.0f} "
+              f"{size['peak_rss_mb']:>7.0f} {size['index_mb']:>9.1f}")
+    components = results["components"]
+    print(f"  classify_file  p50 {components['classify_p50_ms']:.2f} ms, p95 {components['classify_p95_ms']:.2f} ms")
+    print(f"  summarize_file p50 {components['summarize_p50_ms']:.2f} ms, p95 {components['summarize_p95_ms']:.2f} ms")
+
+    if regressions is None:
+        return
+    if not regressions:
+        print("\n  No regressions against the baseline.")
+    for r in regressions:
+        print(f"  REGRESSION {r['section']:>10} {r['metric']:<20} {r['baseline']:.2f} -> {r['current']:.2f} "
+              f"({r['change']:+.0%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline build, query, memory and cold-start benchmarks.")
+    parser.add_argument("--models-dir", default=ASSETS_DIR)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--samples", type=int, default=100, help="classify/summarize calls")
+    parser.add_argument("--words", type=int, default=80, help="words per synthetic document")
+    parser.add_argument("--neighbor-limit", type=int, default=NEIGHBOR_LIMIT)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed fractional slowdown")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_size(args.models_dir, args.single, args.queries, args.neighbor_limit, args.words)))
+        sys.exit(0)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "queries": args.queries,
+            "words_per_doc": args.words,
+        },
+        "sizes": {str(n): run_size_in_subprocess(args, n) for n in args.sizes},
+        "components": run_components(args.models_dir, args.samples, args.words),
+    }
+
+    regressions = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results["regressions"] = regressions
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_report(results, regressions)
+    print(f"\n  Results written to {args.output}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,61 @@
+import sys
+import os
+import time
+import json
+import argparse
+import shutil
+
+PROJECT_ROOT = os.getcwd()
+PYTHON_SOURCE_DIR = os.path.join(PROJECT_ROOT, "android/app/src/main/python")
+sys.path.extend([PROJECT_ROOT, os.path.dirname(__file__), PYTHON_SOURCE_DIR])
+
+import search_engine
+from evaluate_ann import ASSETS_DIR, make_app_dir, topic_word_pools, make_corpus, make_queries
+
+
+def run_batch_report(models_dir, n_docs, batch_sizes, modes):
+    """Time of Q search_documents calls against one search_many call, and whether they agree."""
+    pools, background = topic_word_pools(models_dir)
+    docs = make_corpus(pools, background, n_docs)
+    queries = make_queries(pools, max(batch_sizes), seed=5)
+
+    app_dir = make_app_dir(models_dir)
+    rows = []
+    try:
+        search_engine.train_local_index(app_dir, json.dumps(docs), neighbor_k=0)
+        search_engine.set_query_cache_size(0)  # Time the scoring, not the cache
+
+        for mode in modes:
+            for q in batch_sizes:
+                batch = queries[:q]
+                start = time.perf_counter()
+                one = [search_engine.search_documents(app_dir, query, mode=mode)["results"] for query in batch]
+                loop_ms = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                many = search_engine.search_many(app_dir, batch, mode=mode)["results"]
+                batch_ms = (time.perf_counter() - start) * 1000
+                rows.append({"mode": mode, "queries": q, "loop_ms": loop_ms, "batch_ms": batch_ms,
+                             "same": one == many})
+    finally:
+        shutil.rmtree(app_dir)
+
+    print(f"\nBatch search: {n_docs} docs")
+    print(f"  {'mode':<7} {'queries':>8} {'loop ms':>9} {'batch ms':>9} {'speedup':>8} {'same':>5}")
+    for row in rows:
+        print(f"  {row['mode']:<7} {row['queries']:>8} {row['loop_ms']:>9.1f} {row['batch_ms']:>9.1f} "
+              f"{row['loop_ms'] / row['batch_ms']:>7.1f}x {str(row['same']):>5}")
+    return all(row["same"] for row in rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="search_many against repeated search_documents calls.")
+    parser.add_argument("--models-dir", default=ASSETS_DIR)
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--batch-sizes", default="1,8,32,128")
+    parser.add_argument("--modes", default="exact,hybrid")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.batch_sizes.split(",")]
+    if not run_batch_report(args.models_dir, args.docs, sizes, args.modes.split(",")):
+        sys.exit(1)
@@ -0,0 +1,134 @@
+import sys
+import os
+import re
+import time
+import json
+import argparse
+import numpy as np
+
+PROJECT_ROOT = os.getcwd()
+PYTHON_SOURCE_DIR = os.path.join(PROJECT_ROOT, "android/app/src/main/python")
+sys.path.extend([PROJECT_ROOT, os.path.dirname(__file__), PYTHON_SOURCE_DIR])
+
+import summarizer
+
+TOPIC_WORDS_PATH = os.path.join(PROJECT_ROOT, "topic_words.json")
+FILLER = ["the", "and", "of", "to", "in", "is", "that", "for", "with", "was", "which", "they",
+          "system", "results", "section", "data", "model", "first", "between", "using", "report"]
+
+
+def legacy_summarize(text, max_sentences=5):
+    """The pairwise-loop TextRank with networkx and gensim that summarizer used to run."""
+    import networkx as nx
+    from gensim.utils import simple_preprocess
+
+    if not text or len(text.strip()) < 50:
+        return text[:500]
+
+    sentences = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?|\!)\s', text)
+    sentences = [s.strip() for s in sentences if len(s.split()) > 4]
+    if len(sentences) <= max_sentences:
+        return " ".join(sentences)
+
+    sentence_tokens = [simple_preprocess(s) for s in sentences]
+    sim_mat = np.zeros([len(sentences), len(sentences)])
+    for i in range(len(sentences)):
+        for j in range(len(sentences)):
+            if i != j:
+                set_i = set(w for w in sentence_tokens[i] if w not in summarizer.STOPWORDS)
+                set_j = set(w for w in sentence_tokens[j] if w not in summarizer.STOPWORDS)
+                if not set_i or not set_j:
+                    continue
+                log_len = np.log(len(set_i)) + np.log(len(set_j))
+                if log_len != 0:
+                    sim_mat[i][j] = len(set_i.intersection(set_j)) / log_len
+
+    scores = nx.pagerank(nx.from_numpy_array(sim_mat))
+    ranked = sorted(((scores[i], s) for i, s in enumerate(sentences)), reverse=True)
+    top = [s for _, s in ranked[:max_sentences]]
+    return " ".join(s for s in sentences if s in top)
+
+
+def make_corpus(n_docs, seed=0):
+    """Documents of 5-400 sentences mixing words from one or two topics with filler."""
+    with open(TOPIC_WORDS_PATH, "r") as f:
+        topics = [words for words in json.load(f).values()]
+
+    rng = np.random.default_rng(seed)
+    docs = []
+    for i in range(n_docs):
+        pools = [topics[rng.integers(len(topics))] for _ in range(1 + i % 2)]
+        sentences = []
+        for _ in range(int(rng.integers(5, 400))):
+            pool = pools[rng.integers(len(pools))]
+            words = list(rng.choice(pool, rng.integers(3, 12))) + list(rng.choice(FILLER, rng.integers(2, 8)))
+            rng.shuffle(words)
+            if rng.random() < 0.1:
+                words.insert(0, str(rng.integers(1, 2000)))
+            sentences.append(" ".join(words).capitalize() + rng.choice([".", "?", "!"]))
+        docs.append(" ".join(sentences))
+
+    with open(os.path.join(PROJECT_ROOT, "README.md"), "r", encoding="utf-8") as f:
+        docs.append(f.read())
+    return docs
+
+
+def run_regression(n_docs, max_sentences):
+    docs = make_corpus(n_docs)
+    matches, legacy_seconds, new_seconds = 0, 0.0, 0.0
+    mismatched = []
+    for i, text in enumerate(docs):
+        start = time.perf_counter()
+        expected = legacy_summarize(text, max_sentences)
+        legacy_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = summarizer.summarize_file(text, max_sentences)["summary"]
+        new_seconds += time.perf_counter() - start
+
+        if actual == expected:
+            matches += 1
+        else:
+            mismatched.append(i)
+
+    print(f"\nTextRank regression: {len(docs)} documents, max_sentences={max_sentences}")
+    print(f"  identical summaries : {matches}/{len(docs)}")
+    print(f"  legacy total        : {legacy_seconds:.2f}s")
+    print(f"  vectorized total    : {new_seconds:.2f}s ({legacy_seconds / max(new_seconds, 1e-9):.0f}x)")
+    if mismatched:
+        print(f"  mismatched docs     : {mismatched[:20]}")
+    return not mismatched
+
+
+def run_candidate_audit(n_docs, max_sentences, max_candidates, repeat=4):
+    """Time and sentence overlap of capped batch summaries on long documents."""
+    docs = [" ".join([text] * repeat) for text in make_corpus(n_docs, seed=1)]
+
+    start = time.perf_counter()
+    full = summarizer.summarize_files(docs, max_sentences, max_candidates=None, max_workers=1)["summaries"]
+    full_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    capped = summarizer.summarize_files(docs, max_sentences, max_candidates=max_candidates)["summaries"]
+    capped_seconds = time.perf_counter() - start
+
+    split = re.compile(r'(?<=[.?!])\s')
+    overlaps = [len(set(split.split(c)) & set(split.split(f))) / max(1, len(set(split.split(f))))
+                for c, f in zip(capped, full)]
+
+    print(f"\nCandidate cap: {len(docs)} documents, max_candidates={max_candidates}")
+    print(f"  uncapped serial     : {full_seconds:.2f}s")
+    print(f"  capped batch        : {capped_seconds:.2f}s")
+    print(f"  sentence overlap    : {np.mean(overlaps):.2%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare summarizer output with the legacy TextRank.")
+    parser.add_argument("--docs", type=int, default=60)
+    parser.add_argument("--max-sentences", type=int, default=5)
+    parser.add_argument("--max-candidates", type=int, default=summarizer.MAX_CANDIDATES)
+    args = parser.parse_args()
+
+    identical = run_regression(args.docs, args.max_sentences)
+    run_candidate_audit(args.docs, args.max_sentences, args.max_candidates)
+    sys.exit(0 if identical else 1)
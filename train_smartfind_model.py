@@ -1,10 +1,14 @@
 import os
+import sys
 import json
 import numpy as np
 import re
 from gensim.models import Word2Vec
 from sklearn.datasets import fetch_20newsgroups
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "android/app/src/main/python"))
+import vocab_store
+
 # --- CONFIGURATION ---
 OUTPUT_DIR = "assets/models"
 MODEL_DIMENSIONS = 100
@@ -180,6 +184,8 @@ def main():
     vocab = {word: i for i, word in enumerate(model.wv.index_to_key)}
     with open(os.path.join(OUTPUT_DIR, "vocab.json"), "w", encoding="utf-8") as f:
         json.dump(vocab, f)
+    vocab_json = os.path.join(OUTPUT_DIR, "vocab.json")
+    vocab_store.export_vocab(vocab, OUTPUT_DIR, vocab_store.file_digest(vocab_json))
 
     np.save(os.path.join(OUTPUT_DIR, "word_vectors.npy"), model.wv.vectors.astype(np.float32))
     np.save(os.path.join(OUTPUT_DIR, "topic_vectors.npy"), centroids)